@@ -0,0 +1,73 @@
+"""
+Benchmark for authenticated requests against the Blackjack Web API.
+
+Drives the FastAPI app in-process (through httpx's ASGI transport) with N
+concurrent clients that each poll their own stack, so every request pays
+for one check_user() call with HTTP Basic.  Reports requests per second and p50/p99 latency.
+Each client logs in once to set up its game, which also caches its credentials.
+
+Repeated credentials are answered by the credential cache.  With --no-cache every
+client's entry is dropped before each request and the authentication rate limits are
+lifted, so that every request runs an argon2 verify on the worker pool.
+
+Usage: python bench_check_user.py --clients 16 --requests 50 [--no-cache]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+import httpx
+import web_blackjack
+from bench_web_api import login
+from rate_limit import TokenBucketLimiter
+
+
+async def run_client(client: httpx.AsyncClient, username: str, auth: httpx.BasicAuth,
+                     url: str, num_requests: int, latencies: List[float], no_cache: bool):
+    for _ in range(num_requests):
+        if no_cache:
+            web_blackjack.CREDENTIAL_CACHE.invalidate(username)
+        start = time.perf_counter()
+        response = await client.get(url, auth=auth)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+
+
+async def main(num_clients: int, num_requests: int, no_cache: bool):
+    if no_cache:
+        web_blackjack.AUTH_USER_LIMITER = TokenBucketLimiter(1e9, 1e9)
+        web_blackjack.AUTH_IP_LIMITER = TokenBucketLimiter(1e9, 1e9)
+    transport = httpx.ASGITransport(app=web_blackjack.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        usernames, urls, auths = [], [], []
+        for client_idx in range(num_clients):
+            resp = (await client.post(f'/user/create?username=bench{client_idx}')).json()
+            token = await login(client, resp['username'], resp['password'])
+            game_id = (await client.get('/game/create/1', headers=token)).json()['game_id']
+            (await client.post(f'/game/{game_id}/initialize', headers=token)).raise_for_status()
+            usernames.append(resp['username'])
+            urls.append(f'/game/{game_id}/player/0/stack')
+            auths.append(httpx.BasicAuth(resp['username'], resp['password']))
+
+        latencies: List[float] = []
+        start = time.perf_counter()
+        await asyncio.gather(*[run_client(client, usernames[idx], auths[idx], urls[idx], num_requests, latencies,
+                                          no_cache)
+                               for idx in range(num_clients)])
+        elapsed = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f'clients={num_clients} requests={len(latencies)} elapsed={elapsed:.2f}s '
+          f'cache={"off" if no_cache else "on"}')
+    print(f'throughput: {len(latencies) / elapsed:.1f} req/s')
+    print(f'latency p50: {quantiles[49] * 1000:.1f} ms, p99: {quantiles[98] * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=16, help='number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=50, help='requests per client')
+    parser.add_argument('--no-cache', action='store_true', help='verify the password on every request')
+    args = parser.parse_args()
+    asyncio.run(main(args.clients, args.requests, args.no_cache))
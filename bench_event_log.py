@@ -0,0 +1,85 @@
+"""
+Benchmark of the event log: appending events and recovering from them.
+
+Plays games through an AsyncBlackjackGameDB with and without an event log until the
+requested number of events is logged, terminating every game but the last --live-games,
+and reports the cost of logging per event, then times recovery from the log alone and
+from a snapshot.
+
+Usage: python bench_event_log.py --events 1000000 --live-games 5000 --dir /tmp/blackjack-events
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from blackjack_db import AsyncBlackjackGameDB, Blackjack
+from event_log import EventLog
+from user_db import UserDB
+
+HITS_PER_PLAYER = 5
+# create, 3 players added, initial deal, hits, a dealer draw and terminate
+EVENTS_PER_GAME = 1 + 3 + 1 + 4 * HITS_PER_PLAYER + 1 + 1
+
+
+async def play_games(game_db: AsyncBlackjackGameDB, num_games: int, live_games: int) -> float:
+    """
+    :return: seconds spent in the game DB, not counting building the games
+    """
+    elapsed = 0.0
+    for game_number in range(num_games):
+        game_db_start = time.perf_counter()
+        game_id, term_pass, _ = await game_db.add_game(4, 'owner', 2)
+        for player in ('p1', 'p2', 'p3'):
+            await game_db.add_player(game_id, player)
+        async with game_db.game_session(game_id) as (the_game, _):
+            the_game.initial_deal()
+            for _ in range(HITS_PER_PLAYER):
+                for player_idx in range(4):
+                    the_game.player_draw(player_idx)
+            the_game.dealer_draw()
+        if game_number < num_games - live_games:
+            await game_db.del_game(game_id, term_pass, 'owner')
+        elapsed += time.perf_counter() - game_db_start
+    return elapsed
+
+
+def timed_recover(directory: str) -> float:
+    start = time.perf_counter()
+    EventLog.recover(directory)
+    return time.perf_counter() - start
+
+
+async def main(num_events: int, live_games: int, directory: str):
+    shutil.rmtree(directory, ignore_errors=True)
+    num_games = num_events // EVENTS_PER_GAME
+    num_events = num_games * EVENTS_PER_GAME - min(live_games, num_games)  # live games are not terminated
+    # the games are built up front, so that only the game DB and the log are timed
+    games = [Blackjack(2, 4) for _ in range(num_games)]
+    unlogged = await play_games(AsyncBlackjackGameDB(UserDB(), game_factory=lambda *_: games.pop()),
+                                num_games, live_games)
+    games = [Blackjack(2, 4) for _ in range(num_games)]
+    event_log = EventLog(directory, segment_events=num_events + 1)
+    logged = await play_games(AsyncBlackjackGameDB(UserDB(), game_factory=lambda *_: games.pop(), journal=event_log),
+                              num_games, live_games)
+    await event_log.close()
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    print(f'{num_events} events, {size / 1e6:.1f} MB, logging costs {(logged - unlogged) / num_events * 1e6:.2f} us '
+          f'per event')
+    print(f'recovery from the log: {timed_recover(directory):.2f} s')
+    event_log = EventLog(directory, compact_executor=ThreadPoolExecutor(1))
+    await event_log.compact()
+    await event_log.close()
+    print(f'recovery from a snapshot: {timed_recover(directory):.2f} s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--events', type=int, default=1000000, help='number of events to log')
+    parser.add_argument('--live-games', type=int, default=5000, help='games left unterminated')
+    parser.add_argument('--dir', default=os.path.join(tempfile.gettempdir(), 'blackjack-events'),
+                        help='log directory, emptied first')
+    args = parser.parse_args()
+    asyncio.run(main(args.events, args.live_games, args.dir))
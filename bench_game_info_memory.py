@@ -0,0 +1,65 @@
+"""
+Memory per game of BlackjackGameInfo records.
+
+Builds N game info records for two-player games the way the Web API does, where
+every username arrives as a fresh string from the request, and reports the
+traced memory per game for the earlier dataclass layout and the current one.
+
+Usage: python bench_game_info_memory.py --games 100000
+"""
+import argparse
+import tracemalloc
+import uuid
+from dataclasses import dataclass
+from typing import List
+from blackjack_db import BlackjackGameInfo
+
+
+@dataclass
+class DataclassGameInfo:
+    num_players: int
+    owner: str
+    players: List[str]
+    termination_password: str
+
+
+def request_string(value: str) -> str:
+    return value.encode().decode()  # a new str object, as parsed from a request
+
+
+def build_dataclass_info(owner: str, player: str) -> DataclassGameInfo:
+    owner = request_string(owner)
+    info = DataclassGameInfo(2, owner, [owner], str(uuid.uuid4()))
+    info.players.append(request_string(player))
+    return info
+
+
+def build_slots_info(owner: str, player: str) -> BlackjackGameInfo:
+    info = BlackjackGameInfo(2, request_string(owner), [request_string(owner)], str(uuid.uuid4()))
+    info.add_player(request_string(player))
+    return info
+
+
+def measure(builder, num_games: int, num_users: int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = [builder(f'user{idx % num_users:06d}', f'user{(idx + 1) % num_users:06d}')
+               for idx in range(num_games)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del records
+    return used / num_games
+
+
+def main(num_games: int, num_users: int):
+    print(f'{num_games} live two-player games, {num_users} distinct users')
+    print(f'dataclass:  {measure(build_dataclass_info, num_games, num_users):.0f} bytes/game')
+    print(f'slots:      {measure(build_slots_info, num_games, num_users):.0f} bytes/game')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--games', type=int, default=100000, help='number of live games')
+    parser.add_argument('--users', type=int, default=10000, help='number of distinct usernames')
+    args = parser.parse_args()
+    main(args.games, args.users)
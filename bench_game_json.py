@@ -0,0 +1,55 @@
+"""
+Benchmark of response serialization for the hot game routes.
+
+Builds player_hit, player_stack and get_winners responses from a dealt game and
+reports microseconds per response for FastAPI's default path (jsonable_encoder,
+then the stdlib json) and for GameJSONResponse with the stdlib json and with orjson
+(when it is installed), plus str() against card_str() for the drawn card.
+
+Usage: python bench_game_json.py --iterations 100000
+"""
+import argparse
+import timeit
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from blackjack_db import Blackjack
+import game_json
+from game_json import GameJSONResponse, card_str
+
+
+def sample_responses():
+    game = Blackjack(2, 4)
+    game.initial_deal()
+    drawn_card = game.player_draw(0)
+    dealer_stack, player_stacks = game.get_stacks()
+    return drawn_card, {
+        'player_hit': {'player': 0, 'drawn_card': card_str(drawn_card), 'player_stack': player_stacks[0]},
+        'player_stack': {'player': 0, 'player_stack': player_stacks[0]},
+        'get_winners': {'game_id': '5c1f8a4e-1b2d-4f0e-9a37-2f6d3c8b9e10', 'winners': game.compute_winners()},
+    }
+
+
+def per_call_us(func, iterations: int) -> float:
+    return min(timeit.repeat(func, number=iterations, repeat=3)) / iterations * 1e6
+
+
+def main(iterations: int):
+    drawn_card, responses = sample_responses()
+    orjson = game_json.orjson
+    print(f'{"route":<14}{"default":>10}{"stdlib":>10}{"orjson":>10}  (us/response)')
+    for route, content in responses.items():
+        default = per_call_us(lambda: JSONResponse(jsonable_encoder(content)), iterations)
+        game_json.orjson = None
+        stdlib = per_call_us(lambda: GameJSONResponse(content), iterations)
+        game_json.orjson = orjson
+        fast = f'{per_call_us(lambda: GameJSONResponse(content), iterations):10.2f}' if orjson else f'{"n/a":>10}'
+        print(f'{route:<14}{default:10.2f}{stdlib:10.2f}{fast}')
+    print(f'{"str(card)":<16}{per_call_us(lambda: str(drawn_card), iterations):8.3f} us')
+    print(f'{"card_str(card)":<16}{per_call_us(lambda: card_str(drawn_card), iterations):8.3f} us')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=100000, help='responses to serialize per measurement')
+    args = parser.parse_args()
+    main(args.iterations)
@@ -0,0 +1,39 @@
+"""
+Benchmark of game creation with and without a GamePool.
+
+Creates a burst of games for each deck count, as at the start of a tournament, and
+reports the mean add_game() latency when every game is built on the request path
+and when games are taken from a pool filled beforehand.
+
+Usage: python bench_game_pool.py --games 500
+"""
+import argparse
+import asyncio
+import time
+from blackjack_db import AsyncBlackjackGameDB
+from game_pool import GamePool
+from user_db import UserDB
+
+
+async def create_burst(game_db: AsyncBlackjackGameDB, num_games: int, num_decks: int) -> float:
+    start = time.perf_counter()
+    for _ in range(num_games):
+        await game_db.add_game(2, 'owner', num_decks)
+    return (time.perf_counter() - start) / num_games
+
+
+async def main(num_games: int):
+    print(f'{"decks":>5}{"on demand us":>14}{"pooled us":>11}')
+    for num_decks in (1, 2, 6, 8):
+        on_demand = await create_burst(AsyncBlackjackGameDB(UserDB()), num_games, num_decks)
+        pool = GamePool({(num_decks, 2): num_games})
+        await pool.refill()
+        pooled = await create_burst(AsyncBlackjackGameDB(UserDB(), game_factory=pool.take), num_games, num_decks)
+        print(f'{num_decks:>5}{on_demand * 1e6:>14.1f}{pooled * 1e6:>11.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--games', type=int, default=500, help='games created per deck count')
+    args = parser.parse_args()
+    asyncio.run(main(args.games))
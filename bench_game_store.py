@@ -0,0 +1,48 @@
+"""
+Benchmark of AsyncBlackjackGameDB storage backends.
+
+Plays the database side of a game (create, add a player, deal, save) for many
+games and reports games per second for the in-memory and SQLite backends.
+The SQLite timing includes flushing every batched write to disk.
+
+Usage: python bench_game_store.py --games 5000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from blackjack_db import AsyncBlackjackGameDB, InMemoryGameStore
+from sqlite_store import SQLiteWriteBatcher, SQLiteGameStore
+from user_db import UserDB
+
+
+async def play_games(game_db: AsyncBlackjackGameDB, num_games: int):
+    for _ in range(num_games):
+        game_uuid, _, _ = await game_db.add_game(2, 'owner')
+        await game_db.add_player(game_uuid, 'player')
+        async with game_db.game_session(game_uuid) as (the_game, _):
+            the_game.initial_deal()
+
+
+async def main(num_games: int):
+    user_db = UserDB()
+    start = time.perf_counter()
+    await play_games(AsyncBlackjackGameDB(user_db, InMemoryGameStore()), num_games)
+    print(f'in-memory: {num_games / (time.perf_counter() - start):.0f} games/s')
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        batcher = SQLiteWriteBatcher(os.path.join(state_dir, 'state.db'))
+        start = time.perf_counter()
+        await play_games(AsyncBlackjackGameDB(user_db, SQLiteGameStore(batcher)), num_games)
+        await batcher.flush_async()
+        elapsed = time.perf_counter() - start
+        print(f'sqlite:    {num_games / elapsed:.0f} games/s ({batcher.batches_committed} transactions)')
+        batcher.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--games', type=int, default=5000, help='number of games to play per backend')
+    args = parser.parse_args()
+    asyncio.run(main(args.games))
@@ -0,0 +1,46 @@
+"""
+Microbenchmark of UserDB password hashing profiles.
+
+For each profile in user_db.HASH_PROFILES, hashes a password once and then
+times repeated verifies.  Each profile runs in a fresh process so that the peak
+resident memory it reports is that profile's argon2 working set.
+
+Usage: python bench_pwhash_profiles.py --verifies 5 [--profiles interactive moderate]
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+from user_db import UserDB, HASH_PROFILES
+
+
+def profile_worker(profile_name: str, num_verifies: int, results):
+    baseline_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    user_db = UserDB(hash_profile=profile_name)
+    username, password = user_db.create_user('bench')
+    start = time.perf_counter()
+    for _ in range(num_verifies):
+        assert user_db.is_valid(username, password)
+    per_verify = (time.perf_counter() - start) / num_verifies
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((profile_name, per_verify, (peak_kib - baseline_kib) / 1024))
+
+
+def main(profile_names, num_verifies: int):
+    results = multiprocessing.Queue()
+    print(f'{"profile":<12} {"opslimit":>8} {"memlimit MiB":>12} {"ms/verify":>10} {"peak RSS MiB":>12}')
+    for profile_name in profile_names:
+        worker = multiprocessing.Process(target=profile_worker, args=(profile_name, num_verifies, results))
+        worker.start()
+        name, per_verify, peak_mib = results.get()
+        worker.join()
+        opslimit, memlimit = HASH_PROFILES[name]
+        print(f'{name:<12} {opslimit:>8} {memlimit / 2 ** 20:>12.0f} {per_verify * 1000:>10.1f} {peak_mib:>12.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--verifies', type=int, default=5, help='verifies to time per profile')
+    parser.add_argument('--profiles', nargs='+', default=list(HASH_PROFILES), choices=list(HASH_PROFILES))
+    args = parser.parse_args()
+    main(args.profiles, args.verifies)
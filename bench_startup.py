@@ -0,0 +1,110 @@
+"""
+Benchmark of the Web API's cold start.
+
+Starts a new interpreter for every run, as when an instance is added under load, and
+reports the median time of each stage: starting Python, importing web_blackjack, building
+the app with create_app(), warming up until GET /ready answers 200, and answering the
+first listing of the games (after creating a user and logging in, which is not timed).
+Set BLACKJACK_STATE_PATH or BLACKJACK_EVENT_LOG_DIR to include loading saved state in the
+warm-up.
+
+--save writes the report as a JSON baseline; --baseline compares the run against one
+and exits with status 1 if any stage got slower by more than --tolerance.
+
+Usage: python bench_startup.py --runs 10 --save startup.json
+"""
+from typing import Dict, List, Any
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+STAGES = ('interpreter', 'import', 'create_app', 'ready', 'first_request')
+
+
+async def child_timeline() -> Dict[str, float]:
+    """
+    Run in the child process: start the app as a server would and time every stage.
+
+    :return: {stage: wall clock time at its end}
+    """
+    timeline = {'interpreter': time.time()}
+    import web_blackjack
+    timeline['import'] = time.time()
+    app = web_blackjack.create_app()
+    timeline['create_app'] = time.time()
+    import httpx
+    client_import = time.time() - timeline['create_app']  # not part of the server's start, left out
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench') as client:
+            while (await client.get('/ready')).status_code != 200:
+                await asyncio.sleep(0.001)
+            timeline['ready'] = time.time() - client_import
+            password = (await client.post('/user/create?username=bench')).json()['password']
+            token = (await client.post('/user/login', auth=('bench', password))).json()['access_token']
+            request_start = time.time()
+            (await client.get('/games', headers={'Authorization': f'Bearer {token}'})).raise_for_status()
+            timeline['first_request'] = timeline['ready'] + time.time() - request_start
+    return timeline
+
+
+def run_once() -> Dict[str, float]:
+    """
+    :return: {stage: seconds} for one cold start
+    """
+    spawned = time.time()
+    output = subprocess.run([sys.executable, __file__, '--child'], check=True, capture_output=True, text=True).stdout
+    timeline = json.loads(output.splitlines()[-1])
+    durations, previous = {}, spawned
+    for stage in STAGES:
+        durations[stage] = timeline[stage] - previous
+        previous = timeline[stage]
+    return durations
+
+
+def regressions(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    :return: a description of every stage whose median is more than tolerance worse than the baseline's
+    """
+    found = []
+    for stage, median in report['median_ms'].items():
+        base = baseline['median_ms'].get(stage)
+        if base is not None and median > base * (1 + tolerance):
+            found.append(f'{stage}: {median:.1f} ms, baseline {base:.1f} ms')
+    return found
+
+
+def main(num_runs: int) -> Dict[str, Any]:
+    runs = [run_once() for _ in range(num_runs)]
+    return {'runs': num_runs,
+            'median_ms': {stage: statistics.median(run[stage] for run in runs) * 1000 for stage in STAGES},
+            'total_median_ms': statistics.median(sum(run.values()) for run in runs) * 1000}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=10, help='number of cold starts')
+    parser.add_argument('--save', help='write the report to this JSON file')
+    parser.add_argument('--baseline', help='compare against the report in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(asyncio.run(child_timeline())))
+        sys.exit(0)
+    report = main(args.runs)
+    for stage in STAGES:
+        print(f'{stage:<16}{report["median_ms"][stage]:>9.1f} ms')
+    print(f'{"total":<16}{report["total_median_ms"]:>9.1f} ms')
+    if args.save is not None:
+        with open(args.save, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            found = regressions(report, json.load(baseline_file), args.tolerance)
+        for regression in found:
+            print(f'REGRESSION {regression}')
+        sys.exit(1 if found else 0)
@@ -0,0 +1,211 @@
+"""
+Load test of the Web API with concurrent tables.
+
+Every table creates its users and logs each in once, then plays rounds with their
+bearer tokens, as clients of the API are meant to: create a game, add the players,
+deal, hit and read the stack of every player, play the dealer, get the winners and
+terminate the game.  Tables run concurrently.  Reports requests per second and
+p50/p95/p99 latency per route.
+
+By default the app is driven in-process through httpx's ASGI transport, which measures
+the application without any network.  With --uvicorn the app is started in a uvicorn
+subprocess with TLS and driven over HTTPS, and with --url an already running server is
+driven instead.
+
+--save writes the report as a JSON baseline; --baseline compares the run against one
+and exits with status 1 if any route's p95 latency got worse by more than --tolerance.
+
+Usage: python bench_web_api.py --tables 50 --rounds 5 --players 3 --save baseline.json
+"""
+from typing import Dict, List, Any, Optional, Callable, Awaitable
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import httpx
+
+
+class LatencyRecorder(object):
+    def __init__(self):
+        """
+        Latencies of requests, per route.
+        """
+        self.latencies: Dict[str, List[float]] = {}
+
+    async def timed(self, route: str, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """
+        Send a request and record its latency under route.
+
+        :raises: httpx.HTTPStatusError if the response is an error
+        :param route: name of the route, e.g. 'POST /game/{game_id}/dealer/play'
+        :param send: coroutine function sending the request
+        :return: the response
+        """
+        start = time.perf_counter()
+        response = await send()
+        self.latencies.setdefault(route, []).append(time.perf_counter() - start)
+        response.raise_for_status()
+        return response
+
+    def report(self, elapsed: float) -> Dict[str, Dict[str, float]]:
+        """
+        :param elapsed: wall time of the run in seconds
+        :return: {route: {'requests', 'requests_per_s', 'p50_ms', 'p95_ms', 'p99_ms'}}
+        """
+        report = {}
+        for route, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            report[route] = {'requests': len(latencies), 'requests_per_s': len(latencies) / elapsed}
+            for percent in (50, 95, 99):
+                rank = max(1, math.ceil(percent / 100 * len(latencies)))  # nearest-rank percentile
+                report[route][f'p{percent}_ms'] = latencies[rank - 1] * 1000
+        return report
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> Dict[str, str]:
+    """
+    Log in once with POST /user/login.  Every simulated user logs in from this one address,
+    so a 429 from the per-IP limit on password verifies is waited out rather than failed.
+
+    :return: the Authorization header carrying the user's bearer token
+    """
+    while True:
+        response = await client.post('/user/login', auth=(username, password))
+        if response.status_code != 429:
+            break
+        await asyncio.sleep(int(response.headers['Retry-After']))
+    response.raise_for_status()
+    return {'Authorization': f'Bearer {response.json()["access_token"]}'}
+
+
+async def play_table(client: httpx.AsyncClient, recorder: LatencyRecorder, table: int,
+                     num_players: int, num_rounds: int):
+    users = []
+    for seat in range(num_players):
+        response = await recorder.timed('POST /user/create', lambda: client.post(
+            '/user/create', params={'username': f'bench{os.getpid()}_{table}_{seat}'}))
+        users.append((response.json()['username'], response.json()['password']))
+    tokens = [await login(client, username, password) for username, password in users]
+    owner = tokens[0]
+    for _ in range(num_rounds):
+        game = (await recorder.timed('GET /game/create/{num_players}', lambda: client.get(
+            f'/game/create/{num_players}', headers=owner))).json()
+        game_id = game['game_id']
+        for username, _ in users[1:]:
+            await recorder.timed('POST /game/{game_id}/add_player', lambda: client.post(
+                f'/game/{game_id}/add_player', params={'username': username}, headers=owner))
+        await recorder.timed('POST /game/{game_id}/initialize', lambda: client.post(
+            f'/game/{game_id}/initialize', headers=owner))
+        for seat, player in enumerate(tokens):
+            await recorder.timed('POST /game/{game_id}/player/{player_idx}/hit', lambda: client.post(
+                f'/game/{game_id}/player/{seat}/hit', headers=player))
+            await recorder.timed('GET /game/{game_id}/player/{player_idx}/stack', lambda: client.get(
+                f'/game/{game_id}/player/{seat}/stack', headers=player))
+        await recorder.timed('POST /game/{game_id}/dealer/play', lambda: client.post(
+            f'/game/{game_id}/dealer/play', headers=owner))
+        await recorder.timed('GET /game/{game_id}/winners', lambda: client.get(f'/game/{game_id}/winners'))
+        await recorder.timed('POST /game/{game_id}/terminate', lambda: client.post(
+            f'/game/{game_id}/terminate', params={'password': game['termination_password']}, headers=owner))
+
+
+async def run(client: httpx.AsyncClient, num_tables: int, num_rounds: int, num_players: int) -> Dict[str, Any]:
+    recorder = LatencyRecorder()
+    start = time.perf_counter()
+    await asyncio.gather(*(play_table(client, recorder, table, num_players, num_rounds)
+                           for table in range(num_tables)))
+    elapsed = time.perf_counter() - start
+    return {'tables': num_tables, 'rounds': num_rounds, 'players': num_players, 'elapsed_s': elapsed,
+            'requests_per_s': sum(map(len, recorder.latencies.values())) / elapsed,
+            'routes': recorder.report(elapsed)}
+
+
+def regressions(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    :return: a description of every route whose p95 latency is more than tolerance worse than the baseline's
+    """
+    found = []
+    for route, stats in report['routes'].items():
+        base = baseline['routes'].get(route)
+        if base is not None and stats['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            found.append(f'{route}: p95 {stats["p95_ms"]:.2f} ms, baseline {base["p95_ms"]:.2f} ms')
+    return found
+
+
+def print_report(report: Dict[str, Any]):
+    print(f'{report["tables"]} tables x {report["rounds"]} rounds x {report["players"]} players: '
+          f'{report["requests_per_s"]:.0f} requests/s over {report["elapsed_s"]:.2f} s')
+    print(f'{"route":<48}{"requests":>9}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}')
+    for route, stats in report['routes'].items():
+        print(f'{route:<48}{stats["requests"]:>9}{stats["requests_per_s"]:>9.0f}'
+              f'{stats["p50_ms"]:>9.2f}{stats["p95_ms"]:>9.2f}{stats["p99_ms"]:>9.2f}')
+
+
+async def wait_until_up(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get('/ready')).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if server.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError('uvicorn did not start')
+        await asyncio.sleep(0.2)
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    server: Optional[subprocess.Popen] = None
+    if args.uvicorn:
+        server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'web_blackjack:app', '--port', str(args.port),
+                                   '--log-level', 'warning', '--ssl-keyfile', args.ssl_keyfile,
+                                   '--ssl-certfile', args.ssl_certfile])
+        client = httpx.AsyncClient(base_url=f'https://localhost:{args.port}', verify=args.ssl_certfile,
+                                   limits=httpx.Limits(max_connections=args.tables))
+    elif args.url is not None:
+        client = httpx.AsyncClient(base_url=args.url, verify=not args.insecure,
+                                   limits=httpx.Limits(max_connections=args.tables))
+    else:
+        from web_blackjack import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench')
+    try:
+        async with client:
+            if server is not None:
+                await wait_until_up(client, server)
+            return await run(client, args.tables, args.rounds, args.players)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tables', type=int, default=50, help='number of concurrent tables')
+    parser.add_argument('--rounds', type=int, default=5, help='games played per table')
+    parser.add_argument('--players', type=int, default=3, help='players per table')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--uvicorn', action='store_true', help='start the app in uvicorn with TLS')
+    target.add_argument('--url', help='base URL of a running server, e.g. https://localhost:8000')
+    parser.add_argument('--port', type=int, default=8443, help='port of the uvicorn server started with --uvicorn')
+    parser.add_argument('--ssl-keyfile', default='key/localhost+2-key.pem', help='TLS key for --uvicorn')
+    parser.add_argument('--ssl-certfile', default='key/localhost+2.pem', help='TLS certificate for --uvicorn')
+    parser.add_argument('--insecure', action='store_true', help='do not verify the certificate of --url')
+    parser.add_argument('--save', help='write the report to this JSON file')
+    parser.add_argument('--baseline', help='compare against the report in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 slowdown against the baseline')
+    args = parser.parse_args()
+    report = asyncio.run(main(args))
+    print_report(report)
+    if args.save is not None:
+        with open(args.save, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            found = regressions(report, json.load(baseline_file), args.tolerance)
+        for regression in found:
+            print(f'REGRESSION {regression}')
+        sys.exit(1 if found else 0)
@@ -1,26 +1,483 @@
 from uuid import uuid4
-from typing import List, Tuple, Dict, Union
-from blackjack.blackjack import Blackjack
+from typing import List, Tuple, Dict, Union, Optional, AsyncIterator, Callable, Any, TYPE_CHECKING
 from user_db import UserDB
-from dataclasses import dataclass
+from game_index import GameIndex
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from fastapi import HTTPException, status
 import asyncio
+import itertools
+import logging
+import sys
+import time
 
+if TYPE_CHECKING:
+    from blackjack.blackjack import Blackjack
 
-@dataclass
-class BlackjackGameInfo:
-    num_players: int
-    owner: str
-    players: List[str]
-    termination_password: str
+logger = logging.getLogger(__name__)
+
+
+def new_game(num_decks: int, num_players: int) -> 'Blackjack':
+    """
+    Build a new, shuffled game.  The blackjack package is imported by the first call
+    rather than with this module, to keep the server's startup short.
+
+    :param num_decks: number of decks to use
+    :param num_players: number of players
+    :return: the game
+    """
+    from blackjack.blackjack import Blackjack
+    return Blackjack(num_decks, num_players)
+
+
+def __getattr__(name: str) -> Any:
+    # blackjack_db.Blackjack, imported on first use like in new_game()
+    if name == 'Blackjack':
+        from blackjack.blackjack import Blackjack
+        return Blackjack
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def deep_sizeof(obj: Any) -> int:
+    """
+    Approximate memory held by an object and everything it references, counting shared objects once.
+
+    :param obj: the object to measure
+    :return: size in bytes
+    """
+    seen = set()
+    pending = [obj]
+    total = 0
+    while pending:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, type):
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            pending.extend(item)
+        if hasattr(item, '__dict__'):
+            pending.append(vars(item))
+        for slot in getattr(type(item), '__slots__', ()):
+            if hasattr(item, slot):
+                pending.append(getattr(item, slot))
+    return total
+
+
+class BlackjackGameInfo(object):
+    """
+    Who owns and plays a game.  Slots-based to keep the per-game footprint small, and
+    usernames are interned so every game shares one copy of each.  Player lookups scan
+    small tables and use a username -> index map once a game has more than
+    INDEX_THRESHOLD players, so they are O(1) either way without a dict per small game.
+
+    version counts the changes to the game; it is saved with the info so that every
+    process sharing a store agrees on it.
+    """
+    __slots__ = ('num_players', 'owner', 'players', 'termination_password', 'version', '_player_idx')
+    INDEX_THRESHOLD = 8
+
+    def __init__(self, num_players: int, owner: str, players: List[str], termination_password: str,
+                 version: int = 0):
+        self.num_players = num_players
+        self.owner = sys.intern(owner)
+        self.players: List[str] = []
+        self._player_idx: Optional[Dict[str, int]] = None
+        self.termination_password = termination_password
+        self.version = version
+        for username in players:  # not add_player(): games saved before it checked seats may be over
+            self._append_player(username)
+
+    def add_player(self, username: str) -> int:
+        """
+        :raises: ValueError if every seat of the game is taken
+        :param username: username of the player to add
+        :return: the index of the player who was added
+        """
+        if len(self.players) >= self.num_players:
+            raise ValueError(f'all {self.num_players} seats are taken')
+        return self._append_player(username)
+
+    def _append_player(self, username: str) -> int:
+        self.players.append(sys.intern(username))
+        if self._player_idx is not None:
+            self._player_idx.setdefault(self.players[-1], len(self.players) - 1)
+        elif len(self.players) > self.INDEX_THRESHOLD:
+            self._player_idx = {}
+            for idx in range(len(self.players) - 1, -1, -1):
+                self._player_idx[self.players[idx]] = idx
+        return len(self.players) - 1
+
+    def player_idx(self, username: str) -> Optional[int]:
+        """
+        :param username: username of the player
+        :return: the first index of the player, or None if they are not in the game
+        """
+        if self._player_idx is not None:
+            return self._player_idx.get(username)
+        for idx, player in enumerate(self.players):
+            if player == username:
+                return idx
+        return None
+
+    def player_at(self, player_idx: int) -> Optional[str]:
+        """
+        :param player_idx: index of the player (zero-indexed)
+        :return: username of the player at the index, or None if there is none
+        """
+        if 0 <= player_idx < len(self.players):
+            return self.players[player_idx]
+        return None
+
+    def __getstate__(self) -> Tuple:
+        return self.num_players, self.owner, self.players, self.termination_password, self.version
+
+    def __setstate__(self, state: Union[Tuple, Dict[str, Any]]):
+        if isinstance(state, dict):  # pickled by the earlier dataclass version
+            state = state['num_players'], state['owner'], state['players'], state['termination_password']
+        # 4-tuples were pickled before games had a version
+        self.__init__(*state)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, BlackjackGameInfo):
+            return NotImplemented
+        return self.__getstate__() == other.__getstate__()
+
+    def __repr__(self) -> str:
+        return (f'BlackjackGameInfo(num_players={self.num_players!r}, owner={self.owner!r}, '
+                f'players={self.players!r}, termination_password={self.termination_password!r}, '
+                f'version={self.version!r})')
+
+
+class _GameView(object):
+    __slots__ = ('version', 'stacks', 'winners')
+
+    def __init__(self, version: int):
+        self.version = version
+        self.stacks: Optional[Tuple[List[str], List[List[str]]]] = None
+        self.winners: Optional[List[str]] = None
+
+
+class GameStore(object):
+    """
+    Storage backend for AsyncBlackjackGameDB.  Subclasses implement the async methods below.
+
+    A store is shared when other processes change it too: the DB then lists games with
+    page() instead of its in-process index, which would only know this process's games.
+    """
+    shared = False
+    async def put(self, game_id: str, game: 'Blackjack', game_info: BlackjackGameInfo):
+        """
+        Store a game under game_id, replacing any existing one.
+        """
+        raise NotImplementedError
+
+    async def get(self, game_id: str) -> Tuple[Union['Blackjack', None], Union[BlackjackGameInfo, None]]:
+        """
+        :return: (the game or None if not found, the game info or None if not found)
+        """
+        raise NotImplementedError
+
+    async def delete(self, game_id: str):
+        """
+        Remove a game.
+
+        :raises: KeyError if the game is not found
+        """
+        raise NotImplementedError
+
+    async def items(self) -> List[Tuple[str, 'Blackjack']]:
+        """
+        :return: list of (game_id, game) for every stored game
+        """
+        raise NotImplementedError
+
+    @asynccontextmanager
+    async def lock(self, game_id: str) -> AsyncIterator[None]:
+        """
+        Hold the store's lock on one game while it is read, changed and put back.
+        Only stores shared between processes need one, so the default does nothing.
+        """
+        yield
+
+    async def page(self, cursor: Optional[str] = None, limit: int = 100, owner: Optional[str] = None,
+                   player: Optional[str] = None) -> Tuple[List[Tuple[str, str, int]], Optional[str]]:
+        """
+        Same as GameIndex.page(), over every stored game.  Only shared stores need it.
+
+        :raises: ValueError if the cursor is malformed
+        """
+        raise NotImplementedError
+
+
+class InMemoryGameStore(GameStore):
+    def __init__(self):
+        self.games: Dict[str, 'Blackjack'] = {}
+        self.games_info: Dict[str, BlackjackGameInfo] = {}
+
+    async def put(self, game_id: str, game: 'Blackjack', game_info: BlackjackGameInfo):
+        self.games[game_id] = game
+        self.games_info[game_id] = game_info
+
+    async def get(self, game_id: str) -> Tuple[Union['Blackjack', None], Union[BlackjackGameInfo, None]]:
+        return self.games.get(game_id, None), self.games_info.get(game_id, None)
+
+    async def delete(self, game_id: str):
+        del self.games[game_id]
+        del self.games_info[game_id]
+
+    async def items(self) -> List[Tuple[str, 'Blackjack']]:
+        return list(self.games.items())
+
+
+class SimulatedLatencyGameStore(InMemoryGameStore):
+    def __init__(self, query_time: float = 0.05):
+        """
+        In-memory store that sleeps before every operation, to test behaviour under query latency.
+
+        :param query_time: seconds of simulated latency per operation
+        """
+        super().__init__()
+        self.query_time = query_time
+
+    async def put(self, game_id: str, game: 'Blackjack', game_info: BlackjackGameInfo):
+        await asyncio.sleep(self.query_time)  # simulate query time
+        await super().put(game_id, game, game_info)
+
+    async def get(self, game_id: str) -> Tuple[Union['Blackjack', None], Union[BlackjackGameInfo, None]]:
+        await asyncio.sleep(self.query_time)  # simulate query time
+        return await super().get(game_id)
+
+    async def delete(self, game_id: str):
+        await asyncio.sleep(self.query_time)  # simulate query time
+        await super().delete(game_id)
+
+    async def items(self) -> List[Tuple[str, 'Blackjack']]:
+        await asyncio.sleep(self.query_time)  # simulate query time
+        return await super().items()
+
+
+class GameJournal(object):
+    """
+    Receives every change AsyncBlackjackGameDB makes to its games, before the change is
+    made, e.g. to write them to an event log.  The default records nothing.
+    """
+    def game_created(self, game_id: str, game: 'Blackjack', game_info: BlackjackGameInfo):
+        pass
+
+    def player_added(self, game_id: str, username: str):
+        pass
+
+    def initial_deal(self, game_id: str):
+        pass
+
+    def player_hit(self, game_id: str, player_idx: int):
+        pass
+
+    def dealer_draw(self, game_id: str):
+        pass
+
+    def game_removed(self, game_id: str):
+        pass
+
+
+class _JournaledGame(object):
+    """
+    The game game_session() yields when the DB has a journal: the same game, whose
+    changes are recorded in the journal first.
+    """
+    __slots__ = ('_game', '_game_id', '_journal')
+
+    def __init__(self, game: 'Blackjack', game_id: str, journal: GameJournal):
+        self._game = game
+        self._game_id = game_id
+        self._journal = journal
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._game, name)
+
+    def initial_deal(self):
+        self._journal.initial_deal(self._game_id)
+        return self._game.initial_deal()
+
+    def player_draw(self, player_idx: int):
+        self._journal.player_hit(self._game_id, player_idx)
+        return self._game.player_draw(player_idx)
+
+    def dealer_draw(self):
+        self._journal.dealer_draw(self._game_id)
+        return self._game.dealer_draw()
+
+
+class _GameLock(object):
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0  # coroutines holding or waiting for the lock
 
 
 class AsyncBlackjackGameDB(object):
-    def __init__(self, user_db: UserDB):
-        self._current_games: Dict[str, Blackjack] = {}
-        self._current_games_info: Dict[str, BlackjackGameInfo] = {}
-        self._QUERY_TIME: float = 0.05
+    def __init__(self, user_db: UserDB, store: Optional[GameStore] = None,
+                 idle_ttl: Optional[float] = None, max_games: Optional[int] = None,
+                 clock: Callable[[], float] = time.monotonic, max_cached_views: int = 10000,
+                 game_factory: Callable[[int, int], 'Blackjack'] = new_game,
+                 journal: Optional[GameJournal] = None):
+        """
+        :param user_db: the Web API's UserDB
+        :param store: storage backend, an InMemoryGameStore with no latency if None
+        :param idle_ttl: seconds without activity after which reap_idle_games() removes a game, never if None
+        :param max_games: maximum number of live games; creating one more evicts the least
+            recently active game that is not in use, unlimited if None
+        :param clock: monotonic clock for activity tracking, replaceable for testing
+        :param max_cached_views: maximum number of games whose stacks and winners are cached
+        :param game_factory: builds the game of add_game() from (num_decks, num_players),
+            e.g. game_pool.GamePool.take
+        :param journal: receives every change to the games, e.g. an event_log.EventLog
+        """
+        self._game_factory = game_factory
+        self._journal = journal
+        self._store = store if store is not None else InMemoryGameStore()
         self._user_db = user_db  # pointer to the Web API's UserDB
+        self._game_locks: Dict[str, _GameLock] = {}
+        self._idle_ttl = idle_ttl
+        self._max_games = max_games
+        self._clock = clock
+        # game_id -> time of last activity, least recently active first.
+        # Activity is tracked per process, so games are only reaped by a process that has seen them.
+        self._last_activity: 'OrderedDict[str, float]' = OrderedDict()
+        self._reaper: Optional[asyncio.Task] = None
+        # owner/player -> games indexes, also per process, so left empty when the store is shared
+        self._index = GameIndex()
+        # game_id -> stacks and winners as of a game version, least recently read first
+        self._views: 'OrderedDict[str, _GameView]' = OrderedDict()
+        self._max_cached_views = max_cached_views
+
+    @property
+    def _current_games(self) -> Dict[str, 'Blackjack']:
+        return self._store.games
+
+    @property
+    def _current_games_info(self) -> Dict[str, BlackjackGameInfo]:
+        return self._store.games_info
+
+    def _touch(self, game_id: str):
+        self._last_activity[game_id] = self._clock()
+        self._last_activity.move_to_end(game_id)
+
+    def _forget(self, game_id: str):
+        self._last_activity.pop(game_id, None)
+        self._index.remove_game(game_id)
+        self._views.pop(game_id, None)
+
+    @property
+    def live_game_count(self) -> int:
+        """
+        Number of live games tracked by this process.
+        """
+        return len(self._last_activity)
+
+    async def approx_bytes(self, sample_size: int = 64) -> int:
+        """
+        Estimate the memory held by live games from the average size of up to
+        sample_size of the most recently active ones.
+
+        :param sample_size: number of games to measure
+        :return: approximate bytes held by all live games
+        """
+        sample_ids = list(itertools.islice(reversed(self._last_activity), sample_size))
+        if not sample_ids:
+            return 0
+        sizes = [deep_sizeof(await self._store.get(game_id)) for game_id in sample_ids]
+        return sum(sizes) * len(self._last_activity) // len(sizes)
+
+    async def _remove_if_idle(self, game_id: str, idle_since: float) -> bool:
+        async with self._lock_game(game_id):
+            if self._last_activity.get(game_id, idle_since) > idle_since:
+                return False  # used since it was picked
+            self._forget(game_id)
+            try:
+                await self._store.delete(game_id)
+            except KeyError:
+                return False
+            if self._journal is not None:
+                self._journal.game_removed(game_id)
+            return True
+
+    async def reap_idle_games(self) -> int:
+        """
+        Remove every game that has had no activity for idle_ttl seconds.
+
+        :return: number of games removed
+        """
+        if self._idle_ttl is None:
+            return 0
+        idle_since = self._clock() - self._idle_ttl
+        idle_ids = list(itertools.takewhile(lambda game_id: self._last_activity[game_id] <= idle_since,
+                                            self._last_activity))
+        removed = 0
+        for game_id in idle_ids:
+            if game_id not in self._game_locks and await self._remove_if_idle(game_id, idle_since):
+                removed += 1
+        return removed
+
+    async def _evict_for_new_game(self):
+        for game_id in list(self._last_activity):
+            if len(self._last_activity) < self._max_games:
+                return
+            if game_id not in self._game_locks \
+                    and await self._remove_if_idle(game_id, self._last_activity.get(game_id, 0.0)):
+                logger.info('evicted game %s to stay under %d live games', game_id, self._max_games)
+        if len(self._last_activity) >= self._max_games:
+            raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, "too many live games")
+
+    async def _run_reaper(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await self.reap_idle_games()
+            except Exception:
+                logger.exception('reaping idle games failed')
+            else:
+                if removed:
+                    logger.info('reaped %d idle games', removed)
+
+    async def load_existing_games(self):
+        """
+        Track and index the games already in the store (e.g. loaded from disk).
+        They count as active from now.
+        """
+        for game_id, _ in await self._store.items():
+            if game_id not in self._last_activity:
+                self._touch(game_id)
+            if game_id not in self._index and not self._store.shared:
+                _, the_game_info = await self._store.get(game_id)
+                self._index.add_game(game_id, the_game_info.owner, the_game_info.num_players,
+                                     the_game_info.players)
+
+    async def start_reaper(self, interval: float = 60.0):
+        """
+        Start a background task that calls reap_idle_games() every interval seconds.
+
+        :param interval: seconds between reaps
+        """
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._run_reaper(interval))
+
+    async def stop_reaper(self):
+        """
+        Stop the background task started by start_reaper().
+        """
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
 
     async def add_game(self, num_players: int, owner: str,
                        num_decks: int = 2) -> Tuple[str, str, str]:
@@ -30,29 +487,47 @@ class AsyncBlackjackGameDB(object):
         :param num_players: number of players
         :param owner: username of the owner of the game
         :param num_decks: number of decks to use, default 2
-        :return: the UUID (universally-unique ID) of the game, termination password, and owner username
+        :return: the UUID (universally-unique ID) of the game, termination password, and owner username,
+            or exception if max_games games are live and all of them are in use
         """
-        await asyncio.sleep(self._QUERY_TIME)  # simulate query time
+        if self._max_games is not None and len(self._last_activity) >= self._max_games:
+            await self._evict_for_new_game()
         game_uuid = str(uuid4())
         game_term_password = str(uuid4())
-        self._current_games[game_uuid] = Blackjack(num_decks, num_players)
-        self._current_games_info[game_uuid] = BlackjackGameInfo(
+        self._touch(game_uuid)
+        the_game_info = BlackjackGameInfo(
             num_players,
             owner,
             [owner],
             game_term_password)
+        the_game = self._game_factory(num_decks, num_players)
+        if self._journal is not None:
+            self._journal.game_created(game_uuid, the_game, the_game_info)
+        await self._store.put(game_uuid, the_game, the_game_info)
+        if not self._store.shared:
+            self._index.add_game(game_uuid, the_game_info.owner, num_players, the_game_info.players)
         return game_uuid, game_term_password, owner
 
-    async def add_player(self, game_uuid: str, username: str) -> int:
+    async def add_player(self, game_uuid: str, username: str, attempter: Optional[str] = None) -> int:
         """
         Asks the database to add a player to a game.
 
         :param game_uuid: UUID of the game
         :param username: username of the player to add
-        :return: the index of the player who was added
+        :param attempter: if given, the username of the person adding the player, who must own the game
+        :return: the index of the player who was added, or exception if not found or not authorized
         """
-        self._current_games_info[game_uuid].players.append(username)
-        return len(self._current_games_info[game_uuid].players) - 1
+        async with self.game_session(game_uuid) as (_, the_game_info):
+            if attempter is not None and the_game_info.owner != attempter:
+                raise HTTPException(status.HTTP_401_UNAUTHORIZED, "not owner of game")
+            if len(the_game_info.players) >= the_game_info.num_players:
+                raise HTTPException(status.HTTP_400_BAD_REQUEST, "game is full")
+            if self._journal is not None:
+                self._journal.player_added(game_uuid, username)
+            player_idx = the_game_info.add_player(username)
+        if not self._store.shared:
+            self._index.add_player(game_uuid, the_game_info.players[player_idx])
+        return player_idx
 
     async def list_games(self) -> List[Tuple[str, int]]:
         """
@@ -60,18 +535,137 @@ class AsyncBlackjackGameDB(object):
 
         :return: list of (game_id, number of players in game)
         """
-        await asyncio.sleep(self._QUERY_TIME)  # simulate query time
-        return [(game_id, game.num_players) for game_id, game in self._current_games.items()]
+        if self._store.shared:
+            games, _ = await self._store.page(limit=sys.maxsize)
+            return [(game_id, num_players) for game_id, _, num_players in games]
+        return list(self._index)
+
+    async def list_games_page(self, cursor: Optional[str] = None, limit: int = 100, owner: Optional[str] = None,
+                              player: Optional[str] = None) -> Tuple[List[Tuple[str, str, int]], Optional[str]]:
+        """
+        Asks the database for one page of active games, oldest first, through the owner/player indexes,
+        or the store's own when it is shared with other processes.
 
-    async def get_game(self, game_id: str) -> Tuple[Union[Blackjack, None], Union[BlackjackGameInfo, None]]:
+        :param cursor: next_cursor from the previous page, or None for the first page
+        :param limit: maximum number of games in the page
+        :param owner: only list games owned by this username
+        :param player: only list games this username plays in
+        :return: ([(game_id, owner, number of players), ...], cursor of the next page or None),
+            or exception if the cursor is malformed
+        """
+        try:
+            if self._store.shared:
+                return await self._store.page(cursor, limit, owner=owner, player=player)
+            return self._index.page(cursor, limit, owner=owner, player=player)
+        except ValueError:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "invalid cursor")
+
+    async def get_game(self, game_id: str) -> Tuple[Union['Blackjack', None], Union[BlackjackGameInfo, None]]:
         """
         Asks the database for a pointer to a specific game.
 
         :param game_id: the UUID of the specific game
         :return: (None if the game was not found, otherwise pointer to the Blackjack object; Game info or None)
         """
-        await asyncio.sleep(self._QUERY_TIME)  # simulate query time
-        return self._current_games.get(game_id, None), self._current_games_info.get(game_id, None)
+        the_game, the_game_info = await self._store.get(game_id)
+        if the_game is not None:
+            self._touch(game_id)
+        else:
+            self._forget(game_id)  # e.g. removed by another process sharing the store
+        return the_game, the_game_info
+
+    @asynccontextmanager
+    async def _lock_game(self, game_id: str) -> AsyncIterator[None]:
+        """
+        Serialize coroutines working on the same game; other games are unaffected.
+        The game's lock is created on first use and dropped once nobody holds or awaits it,
+        so ended games leave nothing behind.
+        """
+        game_lock = self._game_locks.get(game_id)
+        if game_lock is None:
+            game_lock = self._game_locks[game_id] = _GameLock()
+        game_lock.users += 1
+        try:
+            async with game_lock.lock:
+                async with self._store.lock(game_id):
+                    yield
+        finally:
+            game_lock.users -= 1
+            if game_lock.users == 0:
+                del self._game_locks[game_id]
+
+    @asynccontextmanager
+    async def game_session(self, game_id: str) -> AsyncIterator[Tuple['Blackjack', BlackjackGameInfo]]:
+        """
+        Asks the database for a game to change in place (e.g. with initial_deal(), player_draw()
+        or dealer_draw()).  The game is locked for the duration of the block; when the block exits
+        without an exception, its version is incremented and it is saved.
+
+        :param game_id: the UUID of the specific game
+        :return: async context manager yielding (the Blackjack object, the game info), or exception if not found
+        """
+        async with self._lock_game(game_id):
+            the_game, the_game_info = await self._store.get(game_id)
+            if the_game is None:
+                self._forget(game_id)
+                raise HTTPException(status.HTTP_404_NOT_FOUND, f"Game {game_id} not found.")
+            self._touch(game_id)
+            if self._journal is not None:
+                yield _JournaledGame(the_game, game_id, self._journal), the_game_info
+            else:
+                yield the_game, the_game_info
+            the_game_info.version += 1
+            await self._store.put(game_id, the_game, the_game_info)
+
+    def _view(self, game_id: str, game_info: BlackjackGameInfo) -> _GameView:
+        view = self._views.get(game_id)
+        if view is None or view.version != game_info.version:
+            view = self._views[game_id] = _GameView(game_info.version)
+            if len(self._views) > self._max_cached_views:
+                self._views.popitem(last=False)
+        self._views.move_to_end(game_id)
+        return view
+
+    def stacks(self, game_id: str, game: 'Blackjack',
+               game_info: BlackjackGameInfo) -> Tuple[List[str], List[List[str]]]:
+        """
+        Stacks of a game from get_game(), computed once per version of the game.
+        Do not call it from inside game_session(), and do not modify the result.
+
+        :param game_id: the UUID of the specific game
+        :param game: the Blackjack object
+        :param game_info: the game info
+        :return: (dealer's stack, list of players' stacks)
+        """
+        view = self._view(game_id, game_info)
+        if view.stacks is None:
+            view.stacks = game.get_stacks()
+        return view.stacks
+
+    def player_stack(self, game_id: str, game: 'Blackjack', game_info: BlackjackGameInfo,
+                     player_idx: int) -> List[str]:
+        """
+        Same as stacks(), for a single player.
+
+        :param player_idx: index of the player (zero-indexed)
+        :return: the player's stack
+        """
+        return self.stacks(game_id, game, game_info)[1][player_idx]
+
+    def winners(self, game_id: str, game: 'Blackjack', game_info: BlackjackGameInfo) -> List[str]:
+        """
+        Winners of a game from get_game(), computed once per version of the game.
+        Do not call it from inside game_session(), and do not modify the result.
+
+        :param game_id: the UUID of the specific game
+        :param game: the Blackjack object
+        :param game_info: the game info
+        :return: compute_winners() of the game
+        """
+        view = self._view(game_id, game_info)
+        if view.winners is None:
+            view.winners = game.compute_winners()
+        return view.winners
 
     async def del_game(self, game_id: str, term_pass: str, attempter: str) -> bool:
         """
@@ -82,14 +676,15 @@ class AsyncBlackjackGameDB(object):
         :param attempter: the username of the person attempting the delete
         :return: False or exception if not found, True if success
         """
-        try:
-            await asyncio.sleep(self._QUERY_TIME)  # simulate query time
-            if self._current_games_info[game_id].termination_password == term_pass \
-                    and self._current_games_info[game_id].owner == attempter:
-                del self._current_games[game_id]
-                del self._current_games_info[game_id]
+        async with self._lock_game(game_id):
+            _, the_game_info = await self._store.get(game_id)
+            if the_game_info is None:
+                raise HTTPException(status.HTTP_404_NOT_FOUND, "game_id not found")
+            if the_game_info.termination_password == term_pass and the_game_info.owner == attempter:
+                self._forget(game_id)
+                await self._store.delete(game_id)
+                if self._journal is not None:
+                    self._journal.game_removed(game_id)
                 return True
             else:
                 raise HTTPException(status.HTTP_401_UNAUTHORIZED, "user not authorized")
-        except KeyError:
-            raise HTTPException(status.HTTP_404_NOT_FOUND, "game_id not found")
@@ -0,0 +1,17 @@
+import pytest
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    """
+    Clock for the clock parameter of caches, limiters and game DBs, advanced by setting clock.now.
+    """
+    return FakeClock()
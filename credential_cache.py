@@ -0,0 +1,92 @@
+from typing import Dict, Set, Optional, Callable
+from collections import OrderedDict
+import hashlib
+import secrets
+import time
+
+
+class CredentialCache(object):
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Bounded cache of recently verified (username, password) pairs, so that
+        repeated requests with the same credentials skip the argon2 verify.
+
+        Entries are keyed on a keyed BLAKE2b digest of the credentials; the key is
+        random per process, so the plaintext password is never stored.
+
+        :param max_entries: maximum number of cached credentials, least recently used are evicted
+        :param ttl: seconds a verification stays valid in the cache
+        :param clock: monotonic clock used for expiry, replaceable for testing
+        """
+        self._digest_key = secrets.token_bytes(hashlib.blake2b.MAX_KEY_SIZE)
+        self._entries: 'OrderedDict[bytes, float]' = OrderedDict()  # digest -> expiry time
+        self._user_digests: Dict[str, Set[bytes]] = {}
+        self._digest_users: Dict[bytes, str] = {}
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._clock = clock
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def _digest(self, username: str, password: str) -> bytes:
+        hasher = hashlib.blake2b(key=self._digest_key, digest_size=32)
+        hasher.update(username.encode())
+        hasher.update(b'\x00')
+        hasher.update(password.encode())
+        return hasher.digest()
+
+    def _remove(self, digest: bytes):
+        self._entries.pop(digest, None)
+        username = self._digest_users.pop(digest, None)
+        if username is not None:
+            user_digests = self._user_digests[username]
+            user_digests.discard(digest)
+            if not user_digests:
+                del self._user_digests[username]
+
+    def is_cached(self, username: str, password: str) -> bool:
+        """
+        Check whether these credentials were verified recently.  Counts a hit or a miss.
+
+        :param username: the attempted username
+        :param password: the attempted password
+        :return: True if the credentials are cached and not expired, False if not.
+        """
+        digest = self._digest(username, password)
+        expiry: Optional[float] = self._entries.get(digest)
+        if expiry is not None and expiry > self._clock():
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return True
+        if expiry is not None:
+            self._remove(digest)
+        self.misses += 1
+        return False
+
+    def add(self, username: str, password: str):
+        """
+        Record credentials that were just verified by the UserDB.
+
+        :param username: the verified username
+        :param password: the verified password
+        """
+        digest = self._digest(username, password)
+        self._entries[digest] = self._clock() + self._ttl
+        self._entries.move_to_end(digest)
+        self._digest_users[digest] = username
+        self._user_digests.setdefault(username, set()).add(digest)
+        while len(self._entries) > self._max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, username: str):
+        """
+        Drop every cached verification for a user, e.g. after a password change.
+
+        :param username: the user whose cached credentials should be dropped
+        """
+        for digest in list(self._user_digests.get(username, ())):
+            self._remove(digest)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,476 @@
+"""
+Append-only event log of users and games, with snapshots.
+
+Every change is appended to a memory-mapped segment file as a small binary record, so
+writing an event costs a memory copy and no system call; the operating system writes
+the pages back, and flush() (run every second by start(), in a thread) forces them to
+disk.  flush() also prepares the bigger map and the next segment the log will move on
+to, so that append() only swaps them in, and finishes the maps left behind.
+
+After segment_events events the log moves on to a new segment, and the finished one is
+compacted in another process: the previous snapshot plus that segment's events become
+the next snapshot, and the segment is deleted.  recover() loads the newest snapshot and
+replays the segments after it.
+
+Files in the log directory:
+    snapshot-<generation>.pickle    state before events-<generation>.log
+    events-<generation>.log         records, each <crc32, payload length, event type> + payload
+"""
+from typing import Dict, Tuple, Optional, Iterator, Iterable, MutableMapping, Any, TYPE_CHECKING
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import chain
+import asyncio
+import logging
+import mmap
+import multiprocessing
+import os
+import pickle
+import queue
+import re
+import struct
+import threading
+import uuid
+import zlib
+from blackjack_db import BlackjackGameInfo, GameJournal
+
+if TYPE_CHECKING:
+    from blackjack.blackjack import Blackjack
+
+logger = logging.getLogger(__name__)
+
+CREATE_GAME = 1     # game id, pickled (game, game info)
+ADD_PLAYER = 2      # game id, username
+INITIAL_DEAL = 3    # game id
+PLAYER_HIT = 4      # game id, player index
+DEALER_DRAW = 5     # game id
+REMOVE_GAME = 6     # game id
+SET_ACCOUNT = 7     # username length, username, password hash
+DELETE_ACCOUNT = 8  # username
+
+# raised by game actions that are refused, e.g. a hit for a player the game does not have
+_REFUSED_ACTION_ERRORS = (IndexError, ValueError)
+
+_HEADER = struct.Struct('<IIB')  # crc32 of type + payload, payload length, type
+_PLAYER_IDX = struct.Struct('<H')
+_NAME_LENGTH = struct.Struct('<H')
+_SEGMENT_FILE = re.compile(r'^events-(\d+)\.log$')
+_SNAPSHOT_FILE = re.compile(r'^snapshot-(\d+)\.pickle$')
+
+State = Dict[str, Dict[str, Any]]  # {'games': {game_id: (game, info)}, 'accounts': {username: hash}}
+
+
+def _segment_path(directory: str, generation: int) -> str:
+    return os.path.join(directory, f'events-{generation:08d}.log')
+
+
+def _snapshot_path(directory: str, generation: int) -> str:
+    return os.path.join(directory, f'snapshot-{generation:08d}.pickle')
+
+
+def _generations(directory: str, pattern: 're.Pattern[str]') -> list:
+    return sorted(int(match.group(1)) for match in map(pattern.match, os.listdir(directory)) if match)
+
+
+def read_events(path: str) -> Iterator[Tuple[int, bytes]]:
+    """
+    :param path: path of a segment file
+    :return: iterator of (event type, payload), up to the end of the file or the first
+        record that is not complete (e.g. not written back before a crash)
+    """
+    with open(path, 'rb') as segment:
+        data = segment.read()
+    pos = 0
+    while pos + _HEADER.size <= len(data):
+        crc, length, kind = _HEADER.unpack_from(data, pos)
+        end = pos + _HEADER.size + length
+        if end > len(data) or _checksum(kind, data[pos + _HEADER.size:end]) != crc:
+            return
+        yield kind, data[pos + _HEADER.size:end]
+        pos = end
+
+
+def _game_id(payload: bytes) -> str:
+    return str(uuid.UUID(bytes=payload[:16]))
+
+
+def replay(state: State, events: Iterable[Tuple[int, bytes]]) -> int:
+    """
+    Apply events to a state in place.  A game action that was refused when it was recorded
+    is refused the same way again, and is skipped.  Games removed by a later event are never
+    unpickled, which is most of the work of replaying a long log.
+
+    :param state: {'games': {game_id: (game, info)}, 'accounts': {username: hash}}
+    :param events: iterable of (event type, payload)
+    :return: number of events applied
+    """
+    events = list(events)
+    removed = {payload[:16] for kind, payload in events if kind == REMOVE_GAME}
+    games = state['games']
+    accounts = state['accounts']
+    live = {uuid.UUID(game_id).bytes: entry for game_id, entry in games.items()}  # by binary game id
+    for position, (kind, payload) in enumerate(events):
+        if kind == SET_ACCOUNT:
+            name_end = _NAME_LENGTH.size + _NAME_LENGTH.unpack_from(payload)[0]
+            accounts[payload[_NAME_LENGTH.size:name_end].decode()] = payload[name_end:]
+            continue
+        if kind == DELETE_ACCOUNT:
+            accounts.pop(payload.decode(), None)
+            continue
+        raw_id = payload[:16]
+        if kind == CREATE_GAME:
+            if raw_id not in removed:
+                live[raw_id] = games[_game_id(raw_id)] = pickle.loads(payload[16:])
+            continue
+        if kind == REMOVE_GAME:
+            if live.pop(raw_id, None) is not None:
+                del games[_game_id(raw_id)]
+            continue
+        entry = live.get(raw_id)
+        if entry is None:
+            continue
+        game, game_info = entry
+        try:
+            if kind == ADD_PLAYER:
+                game_info.add_player(payload[16:].decode())
+            elif kind == INITIAL_DEAL:
+                game.initial_deal()
+            elif kind == PLAYER_HIT:
+                game.player_draw(_PLAYER_IDX.unpack_from(payload, 16)[0])
+            elif kind == DEALER_DRAW:
+                game.dealer_draw()
+        except _REFUSED_ACTION_ERRORS as error:
+            logger.info('skipped event %d (type %d) of game %s: %r', position, kind, _game_id(raw_id), error)
+    return len(events)
+
+
+def _checksum(kind: int, payload: bytes) -> int:
+    return zlib.crc32(payload, zlib.crc32(bytes((kind,))))
+
+
+def _load_snapshot(directory: str, generation: int) -> State:
+    path = _snapshot_path(directory, generation)
+    if not os.path.exists(path):
+        return {'games': {}, 'accounts': {}}
+    with open(path, 'rb') as snapshot:
+        return pickle.load(snapshot)
+
+
+def compact(directory: str, generation: int):
+    """
+    Replace snapshot <generation> and segment <generation> with snapshot <generation + 1>.
+    Module level so that it can run in a ProcessPoolExecutor.
+
+    :param directory: the log directory
+    :param generation: generation of the finished segment
+    """
+    state = _load_snapshot(directory, generation)
+    replay(state, read_events(_segment_path(directory, generation)))
+    path = _snapshot_path(directory, generation + 1)
+    with open(path + '.tmp', 'wb') as snapshot:
+        pickle.dump(state, snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+    os.replace(path + '.tmp', path)
+    for stale in (_segment_path(directory, generation), _snapshot_path(directory, generation)):
+        if os.path.exists(stale):
+            os.remove(stale)
+
+
+def recover(directory: str) -> Tuple[State, int]:
+    """
+    Rebuild the state from the newest snapshot and the segments after it.
+
+    :param directory: the log directory
+    :return: (state, generation of the newest segment, or of the snapshot if there is none)
+    """
+    snapshots = _generations(directory, _SNAPSHOT_FILE)
+    base = snapshots[-1] if snapshots else 0
+    state = _load_snapshot(directory, base)
+    segments = [generation for generation in _generations(directory, _SEGMENT_FILE) if generation >= base]
+    replay(state, chain.from_iterable(read_events(_segment_path(directory, generation)) for generation in segments))
+    return state, segments[-1] if segments else base
+
+
+class EventLog(GameJournal):
+    def __init__(self, directory: str, segment_events: int = 200000, chunk_bytes: int = 64 * 1024 * 1024,
+                 compact_executor: Optional[Executor] = None):
+        """
+        Event log of the games of an AsyncBlackjackGameDB (as its journal) and of the accounts
+        of a UserDB (through accounts()).  Call recover() first to get the state to start from.
+
+        :param directory: the log directory, created if needed
+        :param segment_events: number of events per segment before compacting it into a snapshot
+        :param chunk_bytes: segments grow by this many bytes at a time
+        :param compact_executor: where compaction runs, a one-process ProcessPoolExecutor
+            started on first use if None
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._segment_events = segment_events
+        self._chunk_bytes = chunk_bytes
+        self._compact_executor = compact_executor
+        self._base_generation = (_generations(directory, _SNAPSHOT_FILE) or [0])[-1]
+        for generation in _generations(directory, _SNAPSHOT_FILE):
+            if generation < self._base_generation:  # left by a compaction interrupted before its cleanup
+                os.remove(_snapshot_path(directory, generation))
+        segments = _generations(directory, _SEGMENT_FILE)
+        for generation in segments:
+            if generation < self._base_generation:
+                os.remove(_segment_path(directory, generation))
+        # never append to a segment written before: its tail may be torn
+        self._generation = max(segments[-1] + 1, self._base_generation) if segments else self._base_generation
+        self._fd = -1
+        self._flush_lock = threading.Lock()  # one flush() at a time, never taken on the event loop
+        self._map: Optional[mmap.mmap] = None
+        # maps the log has moved past, closed by flush(): (map, fd, final size) of a finished
+        # segment, or (map, -1, 0) for a map replaced by a bigger one of the same file
+        self._retired: 'queue.SimpleQueue[Tuple[mmap.mmap, int, int]]' = queue.SimpleQueue()
+        # made ready by flush() and taken by append(): (fd, map) of the current segment grown
+        # by a chunk, and (generation, fd, map) of the next segment
+        self._grown: Optional[Tuple[int, mmap.mmap]] = None
+        self._spare: Optional[Tuple[int, int, mmap.mmap]] = None
+        # held while growing a segment or creating one, so that append() doing it itself when
+        # nothing is ready never races flush()
+        self._prepare_lock = threading.Lock()
+        self._pos = 0
+        self._events = 0
+        self._compact_wanted = asyncio.Event()
+        self._prepare_wanted = asyncio.Event()
+        self._tasks: list = []
+        self._fd, self._map = self._new_segment(self._generation)
+
+    @staticmethod
+    def recover(directory: str) -> State:
+        """
+        :return: {'games': {game_id: (game, info)}, 'accounts': {username: hash}} as of the last event
+        """
+        os.makedirs(directory, exist_ok=True)
+        return recover(directory)[0]
+
+    def _new_segment(self, generation: int) -> Tuple[int, mmap.mmap]:
+        fd = os.open(_segment_path(self.directory, generation), os.O_RDWR | os.O_CREAT, 0o600)
+        os.ftruncate(fd, self._chunk_bytes)
+        return fd, mmap.mmap(fd, self._chunk_bytes)
+
+    def _grow(self, fd: int, size: int) -> mmap.mmap:
+        os.ftruncate(fd, max(size, os.fstat(fd).st_size))  # never shrink it under a map
+        return mmap.mmap(fd, size)
+
+    def _prepare(self):
+        """
+        Make the next segment ready, and a bigger map once the current one is half full.
+        Runs in flush(), off the event loop.
+        """
+        with self._prepare_lock:
+            if self._map is None:  # closed
+                return
+            if self._spare is None:  # read before _generation, which append() sets first
+                generation = self._generation + 1
+                self._spare = (generation,) + self._new_segment(generation)
+            fd, current = self._fd, self._map
+            if self._grown is None and len(current) - self._pos < self._chunk_bytes // 2:
+                # if append() moved to the next segment meanwhile, it discards this map
+                self._grown = (fd, self._grow(fd, len(current) + self._chunk_bytes))
+
+    @staticmethod
+    def _release(old_map: mmap.mmap, fd: int, size: int):
+        if fd < 0:
+            old_map.close()  # its pages are the file's, written back through the current map
+            return
+        old_map.flush()
+        old_map.close()
+        os.ftruncate(fd, size)
+        os.close(fd)
+
+    def append(self, kind: int, payload: bytes):
+        """
+        Append one event.  It reaches the disk at the next flush() at the latest.
+
+        :param kind: the event type, e.g. PLAYER_HIT
+        :param payload: the event's data
+        """
+        end = self._pos + _HEADER.size + len(payload)
+        if end > len(self._map):
+            self._retired.put((self._map, -1, 0))
+            grown, self._grown = self._grown, None
+            if grown is not None and grown[0] == self._fd and len(grown[1]) >= end:
+                self._map = grown[1]
+            else:
+                if grown is not None:
+                    self._retired.put((grown[1], -1, 0))
+                with self._prepare_lock:  # nothing ready in time: grow it here
+                    self._map = self._grow(self._fd, max(end, self._pos + self._chunk_bytes))
+        self._map[self._pos + _HEADER.size:end] = payload
+        _HEADER.pack_into(self._map, self._pos, _checksum(kind, payload), len(payload), kind)
+        self._pos = end
+        self._events += 1
+        if self._events >= self._segment_events:
+            self._move_on()
+        elif self._grown is None and len(self._map) - end < self._chunk_bytes // 2:
+            self._prepare_wanted.set()
+
+    def _move_on(self):
+        self._retired.put((self._map, self._fd, self._pos))
+        grown, self._grown = self._grown, None
+        if grown is not None:
+            self._retired.put((grown[1], -1, 0))
+        spare = self._spare
+        if spare is None:
+            with self._prepare_lock:  # nothing ready in time: create it here
+                spare = self._spare
+                if spare is None:
+                    spare = (self._generation + 1,) + self._new_segment(self._generation + 1)
+                self._generation, self._fd, self._map = spare
+                self._spare = None
+        else:
+            self._generation, self._fd, self._map = spare
+            self._spare = None  # after _generation, so that flush() prepares the segment after it
+        self._pos = 0
+        self._events = 0
+        self._compact_wanted.set()
+        self._prepare_wanted.set()
+
+    def flush(self):
+        """
+        Write the events appended so far to disk, finish the maps and segments the log has
+        moved past, and prepare the ones it will move on to.  It waits for the disk, so call it
+        from a thread when on the event loop.
+        """
+        with self._flush_lock:
+            while True:
+                try:
+                    retired = self._retired.get_nowait()
+                except queue.Empty:
+                    break
+                self._release(*retired)
+            current = self._map  # read after retiring, so it is not one closed above
+            if current is not None:
+                current.flush()
+            self._prepare()
+
+    def _close_current(self):
+        with self._prepare_lock:
+            if self._map is not None:
+                self._retired.put((self._map, self._fd, self._pos))
+                self._map = None
+            if self._grown is not None:
+                self._retired.put((self._grown[1], -1, 0))
+                self._grown = None
+        self.flush()
+        if self._spare is not None:
+            generation, fd, spare_map = self._spare
+            self._spare = None
+            spare_map.close()
+            os.close(fd)
+            os.remove(_segment_path(self.directory, generation))
+
+    async def compact(self):
+        """
+        Compact every finished segment into a snapshot, oldest first.
+        """
+        if self._compact_executor is None:
+            self._compact_executor = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'))
+        loop = asyncio.get_running_loop()
+        if self._base_generation < self._generation:
+            await asyncio.to_thread(self.flush)  # finish the segments before they are read
+        while self._base_generation < self._generation:
+            await loop.run_in_executor(self._compact_executor, compact, self.directory, self._base_generation)
+            self._base_generation += 1
+
+    async def _run_compactor(self):
+        while True:
+            self._compact_wanted.clear()
+            try:
+                await self.compact()
+            except Exception:
+                logger.exception('compacting the event log failed')
+            await self._compact_wanted.wait()
+
+    async def _run_flusher(self, interval: float):
+        while True:
+            try:  # early when append() has used what the last flush prepared
+                await asyncio.wait_for(self._prepare_wanted.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._prepare_wanted.clear()
+            await asyncio.to_thread(self.flush)
+
+    def start(self, flush_interval: float = 1.0):
+        """
+        Start the background tasks flushing the log every flush_interval seconds and compacting
+        finished segments, including any left from before the last restart.
+        """
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run_flusher(flush_interval)),
+                           asyncio.create_task(self._run_compactor())]
+
+    async def close(self):
+        """
+        Stop the background tasks and write every event to disk.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.to_thread(self._close_current)
+        if isinstance(self._compact_executor, ProcessPoolExecutor):
+            self._compact_executor.shutdown()
+
+    def accounts(self, initial: Optional[Dict[str, bytes]] = None) -> 'EventLogAccounts':
+        """
+        :param initial: the accounts from recover()
+        :return: a mapping to use as UserDB's accounts, which logs every change
+        """
+        return EventLogAccounts(self, initial)
+
+    def game_created(self, game_id: str, game: 'Blackjack', game_info: BlackjackGameInfo):
+        self.append(CREATE_GAME, uuid.UUID(game_id).bytes + pickle.dumps((game, game_info), pickle.HIGHEST_PROTOCOL))
+
+    def player_added(self, game_id: str, username: str):
+        self.append(ADD_PLAYER, uuid.UUID(game_id).bytes + username.encode())
+
+    def initial_deal(self, game_id: str):
+        self.append(INITIAL_DEAL, uuid.UUID(game_id).bytes)
+
+    def player_hit(self, game_id: str, player_idx: int):
+        self.append(PLAYER_HIT, uuid.UUID(game_id).bytes + _PLAYER_IDX.pack(player_idx))
+
+    def dealer_draw(self, game_id: str):
+        self.append(DEALER_DRAW, uuid.UUID(game_id).bytes)
+
+    def game_removed(self, game_id: str):
+        self.append(REMOVE_GAME, uuid.UUID(game_id).bytes)
+
+
+class EventLogAccounts(MutableMapping[str, bytes]):
+    def __init__(self, event_log: EventLog, initial: Optional[Dict[str, bytes]] = None):
+        """
+        Mapping of username -> password hash, usable as UserDB's accounts, that appends
+        every change to an event log.
+
+        :param event_log: the log
+        :param initial: the accounts to start from, e.g. from EventLog.recover()
+        """
+        self._log = event_log
+        self._accounts: Dict[str, bytes] = dict(initial or {})
+
+    def __getitem__(self, username: str) -> bytes:
+        return self._accounts[username]
+
+    def __setitem__(self, username: str, stored_hash: bytes):
+        name = username.encode()
+        self._log.append(SET_ACCOUNT, _NAME_LENGTH.pack(len(name)) + name + stored_hash)
+        self._accounts[username] = stored_hash
+
+    def __delitem__(self, username: str):
+        del self._accounts[username]
+        self._log.append(DELETE_ACCOUNT, username.encode())
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._accounts)
+
+    def __len__(self) -> int:
+        return len(self._accounts)
+
+    def __contains__(self, username: object) -> bool:
+        return username in self._accounts
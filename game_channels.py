@@ -0,0 +1,69 @@
+from typing import Dict, Set, Any, Optional
+import asyncio
+import json
+
+
+class GameChannels(object):
+    def __init__(self, max_queued: int = 256):
+        """
+        Per-game publish/subscribe for pushing game updates to WebSocket clients.
+        A message is serialized to JSON once per publish, no matter how many players are
+        subscribed, and queued for each subscriber without waiting on slow sockets.
+
+        :param max_queued: messages a subscriber may fall behind before it is disconnected
+        """
+        self._subscribers: Dict[str, Set['asyncio.Queue[Optional[str]]']] = {}
+        self._max_queued = max_queued
+
+    def subscribe(self, game_id: str) -> 'asyncio.Queue[Optional[str]]':
+        """
+        Subscribe to a game's updates.
+
+        :param game_id: the UUID of the game
+        :return: queue of serialized messages; None means the subscription was closed
+        """
+        subscription: 'asyncio.Queue[Optional[str]]' = asyncio.Queue(self._max_queued + 1)
+        self._subscribers.setdefault(game_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, game_id: str, subscription: 'asyncio.Queue[Optional[str]]'):
+        """
+        :param game_id: the UUID of the game
+        :param subscription: the queue returned by subscribe()
+        """
+        subscriptions = self._subscribers.get(game_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscribers[game_id]
+
+    def subscriber_count(self, game_id: str) -> int:
+        return len(self._subscribers.get(game_id, ()))
+
+    def publish(self, game_id: str, message: Dict[str, Any]):
+        """
+        Send a message to every subscriber of a game.  Free if nobody is subscribed.
+
+        :param game_id: the UUID of the game
+        :param message: JSON-serializable message
+        """
+        subscriptions = self._subscribers.get(game_id)
+        if not subscriptions:
+            return
+        text = json.dumps(message)
+        for subscription in list(subscriptions):
+            if subscription.qsize() >= self._max_queued:
+                self.unsubscribe(game_id, subscription)
+                subscription.put_nowait(None)  # the one slot kept free for closing
+            else:
+                subscription.put_nowait(text)
+
+    def close_game(self, game_id: str):
+        """
+        End every subscription to a game, e.g. after it was terminated.
+
+        :param game_id: the UUID of the game
+        """
+        for subscription in self._subscribers.pop(game_id, ()):
+            if not subscription.full():
+                subscription.put_nowait(None)
@@ -0,0 +1,158 @@
+from typing import List, Tuple, Dict, Optional, Iterator
+from bisect import bisect_left, bisect_right
+
+
+class _SeqList(object):
+    """
+    Game ids in the order they were indexed, with O(log n) seek to a cursor.  Removed ids are left
+    as tombstones and compacted away once they make up half the list.
+    """
+    __slots__ = ('seqs', 'ids', 'tombstones')
+
+    def __init__(self):
+        self.seqs: List[int] = []
+        self.ids: List[Optional[str]] = []
+        self.tombstones = 0
+
+    def append(self, seq: int, game_id: str):
+        self.seqs.append(seq)
+        self.ids.append(game_id)
+
+    def remove(self, seq: int):
+        pos = bisect_left(self.seqs, seq)
+        if pos < len(self.seqs) and self.seqs[pos] == seq and self.ids[pos] is not None:
+            self.ids[pos] = None
+            self.tombstones += 1
+            if self.tombstones * 2 > len(self.ids):
+                live = [(seq, game_id) for seq, game_id in zip(self.seqs, self.ids) if game_id is not None]
+                self.seqs = [seq for seq, _ in live]
+                self.ids = [game_id for _, game_id in live]
+                self.tombstones = 0
+
+    def __len__(self) -> int:
+        return len(self.ids) - self.tombstones
+
+    def iter_after(self, after: int) -> Iterator[Tuple[int, str]]:
+        for pos in range(bisect_right(self.seqs, after), len(self.seqs)):
+            game_id = self.ids[pos]
+            if game_id is not None:
+                yield self.seqs[pos], game_id
+
+
+class _GameEntry(object):
+    __slots__ = ('seq', 'owner', 'num_players', 'players')
+
+    def __init__(self, seq: int, owner: str, num_players: int):
+        self.seq = seq
+        self.owner = owner
+        self.num_players = num_players
+        self.players: Dict[str, int] = {}  # username -> seq of the player joining
+
+
+class GameIndex(object):
+    def __init__(self):
+        """
+        In-memory index of live games, in creation order, with secondary indexes from
+        owner and from player username to their games (in the order they joined).
+        Listing a page costs O(log n + page size) no matter how many games are live.
+        """
+        self._next_seq = 0
+        self._entries: Dict[str, _GameEntry] = {}
+        self._all = _SeqList()
+        self._by_owner: Dict[str, _SeqList] = {}
+        self._by_player: Dict[str, _SeqList] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, game_id: object) -> bool:
+        return game_id in self._entries
+
+    def add_game(self, game_id: str, owner: str, num_players: int, players: Optional[List[str]] = None):
+        """
+        Index a new game.
+
+        :param game_id: the UUID of the game
+        :param owner: username of the owner of the game
+        :param num_players: number of players of the game
+        :param players: usernames of the players already in the game
+        """
+        if game_id in self._entries:
+            return
+        entry = self._entries[game_id] = _GameEntry(self._next_seq, owner, num_players)
+        self._next_seq += 1
+        self._all.append(entry.seq, game_id)
+        self._by_owner.setdefault(owner, _SeqList()).append(entry.seq, game_id)
+        for username in players or ():
+            self.add_player(game_id, username)
+
+    def add_player(self, game_id: str, username: str):
+        """
+        Index a player of a game.  A player added twice is indexed once.
+
+        :param game_id: the UUID of the game
+        :param username: username of the player
+        """
+        entry = self._entries.get(game_id)
+        if entry is None or username in entry.players:
+            return
+        entry.players[username] = self._next_seq
+        self._next_seq += 1
+        self._by_player.setdefault(username, _SeqList()).append(entry.players[username], game_id)
+
+    def remove_game(self, game_id: str):
+        """
+        Drop a game from every index.
+
+        :param game_id: the UUID of the game
+        """
+        entry = self._entries.pop(game_id, None)
+        if entry is None:
+            return
+        self._all.remove(entry.seq)
+        for index, key, seq in [(self._by_owner, entry.owner, entry.seq)] + \
+                [(self._by_player, username, seq) for username, seq in entry.players.items()]:
+            index[key].remove(seq)
+            if not index[key]:
+                del index[key]
+
+    def page(self, cursor: Optional[str] = None, limit: int = 100, owner: Optional[str] = None,
+             player: Optional[str] = None) -> Tuple[List[Tuple[str, str, int]], Optional[str]]:
+        """
+        List games in creation order (in joining order when filtering by player), starting after a cursor.
+
+        :raises: ValueError if the cursor is malformed
+        :param cursor: next_cursor from the previous page, or None for the first page
+        :param limit: maximum number of games in the page
+        :param owner: only list games owned by this username
+        :param player: only list games this username plays in
+        :return: ([(game_id, owner, num_players), ...], cursor of the next page or None if this is the last)
+        """
+        after = int(cursor) if cursor is not None else -1
+        if player is not None:
+            seq_list = self._by_player.get(player)
+        elif owner is not None:
+            seq_list = self._by_owner.get(owner)
+        else:
+            seq_list = self._all
+        if seq_list is None:
+            return [], None
+        games = []
+        last_seq = after
+        for last_seq, game_id in seq_list.iter_after(after):
+            entry = self._entries[game_id]
+            if owner is not None and entry.owner != owner:
+                continue
+            games.append((game_id, entry.owner, entry.num_players))
+            if len(games) == limit:
+                break
+        else:
+            return games, None
+        return games, str(last_seq)
+
+    def __iter__(self) -> Iterator[Tuple[str, int]]:
+        """
+        :return: iterator of (game_id, num_players) over every game in creation order
+        """
+        for _, game_id in self._all.iter_after(-1):
+            yield game_id, self._entries[game_id].num_players
@@ -0,0 +1,70 @@
+from typing import Any, Dict, Hashable, Optional
+import json
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from metrics import METRICS
+try:
+    import orjson
+except ImportError:  # optional, the stdlib json is used without it
+    orjson = None
+
+
+_CARD_STRINGS: Dict[Any, str] = {}
+MAX_CARD_STRINGS = 1024
+
+
+def _card_key(card: Any) -> Optional[Hashable]:
+    """
+    :return: a key equal for cards of equal value: the card itself if it is hashed by value,
+        otherwise its type and attributes; None if there is no such key
+    """
+    if type(card).__hash__ not in (None, object.__hash__):
+        return card
+    try:
+        key = (type(card), tuple(vars(card).items()))
+        hash(key)
+    except TypeError:  # no __dict__, or unhashable attributes
+        return None
+    return key
+
+
+def card_str(card: Any) -> str:
+    """
+    str(card), computed once per distinct card value in this process.  Cards hashed by
+    identity (or not at all) are cached by their type and attributes, e.g. rank and suit.
+
+    :param card: a card, e.g. as returned by Blackjack.player_draw()
+    :return: the string form of the card
+    """
+    key = _card_key(card)
+    if key is None:
+        return str(card)
+    text = _CARD_STRINGS.get(key)
+    if text is None:
+        text = str(card)
+        if len(_CARD_STRINGS) < MAX_CARD_STRINGS:
+            _CARD_STRINGS[key] = text
+    return text
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialize content with orjson if it is installed, otherwise with the stdlib json.
+    Values neither encoder handles (e.g. a card object) go through FastAPI's jsonable_encoder.
+
+    :param content: the content to serialize
+    :return: the UTF-8 JSON document
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=jsonable_encoder)
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':'), default=jsonable_encoder).encode('utf-8')
+
+
+class GameJSONResponse(JSONResponse):
+    """
+    JSON response for the game routes.  Routes return it directly, which skips FastAPI's
+    jsonable_encoder pass over the whole response, and it renders with dumps().
+    """
+    def render(self, content: Any) -> bytes:
+        with METRICS.stage('serialize'):
+            return dumps(content)
@@ -0,0 +1,103 @@
+from typing import Dict, Tuple, Deque, Callable, Optional, Iterable, TYPE_CHECKING
+from collections import deque
+import asyncio
+import logging
+from blackjack_db import new_game
+
+if TYPE_CHECKING:
+    from blackjack.blackjack import Blackjack
+
+logger = logging.getLogger(__name__)
+
+
+class GamePool(object):
+    def __init__(self, sizes: Dict[Tuple[int, int], int],
+                 factory: Callable[[int, int], 'Blackjack'] = new_game):
+        """
+        Pool of new, already shuffled games, so that creating a game on the request path
+        only takes one from the pool instead of building and shuffling every deck.
+        A background task (start()) keeps each pool filled to its size.
+
+        :param sizes: {(num_decks, num_players): number of games to keep ready}
+        :param factory: builds a new game from (num_decks, num_players)
+        """
+        self._sizes = dict(sizes)
+        self._factory = factory
+        self._ready: Dict[Tuple[int, int], Deque['Blackjack']] = {key: deque() for key in self._sizes}
+        self._wanted = asyncio.Event()
+        self._refiller: Optional[asyncio.Task] = None
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @classmethod
+    def for_decks(cls, num_decks: Iterable[int], max_players: int, size: int,
+                  factory: Callable[[int, int], 'Blackjack'] = new_game) -> 'GamePool':
+        """
+        :return: a pool keeping size games ready for every deck count in num_decks
+            and every table of 1 to max_players players
+        """
+        return cls({(decks, players): size for decks in num_decks for players in range(1, max_players + 1)}, factory)
+
+    def ready_count(self, num_decks: int, num_players: int) -> int:
+        """
+        :return: number of games ready for (num_decks, num_players)
+        """
+        return len(self._ready.get((num_decks, num_players), ()))
+
+    def fill_level(self) -> Tuple[int, int]:
+        """
+        :return: (games ready, games wanted) over all pools
+        """
+        return sum(len(ready) for ready in self._ready.values()), sum(self._sizes.values())
+
+    def take(self, num_decks: int, num_players: int) -> 'Blackjack':
+        """
+        Get a new game, from the pool if one is ready, otherwise built now.
+
+        :param num_decks: number of decks to use
+        :param num_players: number of players
+        :return: a game no one else has
+        """
+        ready = self._ready.get((num_decks, num_players))
+        if ready:
+            self.hits += 1
+            self._wanted.set()
+            return ready.popleft()
+        self.misses += 1
+        return self._factory(num_decks, num_players)
+
+    async def refill(self):
+        """
+        Fill every pool to its size, yielding to the event loop after each game
+        so that requests are served in between.
+        """
+        for key, size in self._sizes.items():
+            ready = self._ready[key]
+            while len(ready) < size:
+                ready.append(self._factory(*key))
+                await asyncio.sleep(0)
+
+    async def _run_refiller(self):
+        while True:
+            self._wanted.clear()
+            try:
+                await self.refill()
+            except Exception:
+                logger.exception('filling the game pool failed')
+            await self._wanted.wait()
+
+    def start(self):
+        """
+        Start the background task filling the pools, now and after games are taken.
+        """
+        if self._refiller is None:
+            self._refiller = asyncio.create_task(self._run_refiller())
+
+    async def stop(self):
+        if self._refiller is not None:
+            self._refiller.cancel()
+            try:
+                await self._refiller
+            except asyncio.CancelledError:
+                pass
+            self._refiller = None
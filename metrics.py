@@ -0,0 +1,268 @@
+from typing import Dict, Tuple, List, Callable, Iterator, AsyncIterator, Optional, Any, Union, TYPE_CHECKING
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager, asynccontextmanager, AsyncExitStack
+import os
+import sys
+import threading
+import time
+from blackjack_db import GameStore, BlackjackGameInfo
+
+if TYPE_CHECKING:
+    from blackjack.blackjack import Blackjack
+
+# upper bounds in seconds, from a cached read to a slow password hash
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram(object):
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # per bucket, the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, value.replace('\\', r'\\').replace('"', r'\"'))
+                          for name, value in pairs) + '}'
+
+
+class Metrics(object):
+    def __init__(self, enabled: bool = False, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """
+        Latency histograms and gauges, rendered in the Prometheus text format.
+        While disabled, observe() and stage() do nothing, so instrumented code costs an
+        attribute check.
+
+        :param enabled: whether to record observations
+        :param buckets: upper bounds of the histogram buckets, in seconds
+        """
+        self.enabled = enabled
+        self._buckets = buckets
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._help: Dict[str, str] = {}
+        self._gauges: List[Tuple[str, str, str, Callable[[], float]]] = []
+
+    def describe(self, name: str, help_text: str):
+        """
+        Set the HELP text of a histogram.
+        """
+        self._help[name] = help_text
+
+    def observe(self, name: str, labels: Labels, seconds: float):
+        """
+        Record a latency in the histogram name with the given labels.
+
+        :param name: name of the histogram, e.g. 'blackjack_request_seconds'
+        :param labels: ((label name, value), ...)
+        :param seconds: the latency
+        """
+        if not self.enabled:
+            return
+        series = self._histograms.setdefault(name, {})
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram(self._buckets)
+        histogram.observe(seconds)
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """
+        Time the block as one stage of handling a request, in blackjack_stage_seconds.
+
+        :param stage: name of the stage, e.g. 'password_verify'
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('blackjack_stage_seconds', (('stage', stage),), time.perf_counter() - start)
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float], metric_type: str = 'gauge'):
+        """
+        Add a value read when the metrics are rendered.
+
+        :param name: name of the metric
+        :param help_text: HELP text of the metric
+        :param read: function returning the current value
+        :param metric_type: 'gauge', or 'counter' for values that only go up
+        """
+        self._gauges.append((name, help_text, metric_type, read))
+
+    def render(self) -> str:
+        """
+        :return: every metric in the Prometheus text exposition format
+        """
+        lines = []
+        for name, help_text, metric_type, read in self._gauges:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}', f'{name} {read()}']
+        for name, series in self._histograms.items():
+            lines += [f'# HELP {name} {self._help.get(name, name)}', f'# TYPE {name} histogram']
+            for labels, histogram in list(series.items()):
+                cumulative = 0
+                for bound, count in zip(self._buckets + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{_format_labels(labels, (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
+METRICS.describe('blackjack_request_seconds', 'Latency of HTTP requests by route.')
+METRICS.describe('blackjack_stage_seconds', 'Latency of the stages of handling requests.')
+
+
+class MetricsMiddleware(object):
+    def __init__(self, app: Any, metrics: Metrics = METRICS):
+        """
+        ASGI middleware recording the latency of every HTTP request in blackjack_request_seconds,
+        labelled with the method, the route's path template and the status code.
+
+        :param app: the ASGI app to wrap
+        :param metrics: where to record the latencies
+        """
+        self.app = app
+        self.metrics = metrics
+        self._route_paths: Dict[Any, str] = {}
+
+    def _route_path(self, scope: Dict[str, Any]) -> str:
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            return 'unmatched'
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            for route in scope['app'].routes:
+                if getattr(route, 'endpoint', None) is endpoint:
+                    path = self._route_paths[endpoint] = route.path
+                    break
+            else:
+                path = 'unmatched'
+        return path
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable):
+        if scope['type'] != 'http' or not self.metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+        status_code = ['500']
+
+        async def send_with_status(message: Dict[str, Any]):
+            if message['type'] == 'http.response.start':
+                status_code[0] = str(message['status'])
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.metrics.observe('blackjack_request_seconds',
+                                 (('method', scope['method']), ('route', self._route_path(scope)),
+                                  ('status', status_code[0])),
+                                 time.perf_counter() - start)
+
+
+class TimedGameStore(GameStore):
+    def __init__(self, store: GameStore, metrics: Metrics = METRICS):
+        """
+        Wraps a game store to time its operations as stages (store_get, store_put, store_delete
+        and store_lock for the time spent waiting for the store's lock).
+
+        :param store: the store to wrap, whose other attributes stay reachable through this one
+        :param metrics: where to record the latencies
+        """
+        self._wrapped = store
+        self._metrics = metrics
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._wrapped, name)
+
+    @property
+    def shared(self) -> bool:
+        # GameStore.shared is a class attribute, which __getattr__ would never reach
+        return self._wrapped.shared
+
+    async def put(self, game_id: str, game: 'Blackjack', game_info: BlackjackGameInfo):
+        with self._metrics.stage('store_put'):
+            await self._wrapped.put(game_id, game, game_info)
+
+    async def get(self, game_id: str) -> Tuple[Union['Blackjack', None], Union[BlackjackGameInfo, None]]:
+        with self._metrics.stage('store_get'):
+            return await self._wrapped.get(game_id)
+
+    async def delete(self, game_id: str):
+        with self._metrics.stage('store_delete'):
+            await self._wrapped.delete(game_id)
+
+    async def items(self) -> List[Tuple[str, 'Blackjack']]:
+        return await self._wrapped.items()
+
+    async def page(self, cursor: Optional[str] = None, limit: int = 100, owner: Optional[str] = None,
+                   player: Optional[str] = None) -> Tuple[List[Tuple[str, str, int]], Optional[str]]:
+        return await self._wrapped.page(cursor, limit, owner=owner, player=player)
+
+    @asynccontextmanager
+    async def lock(self, game_id: str) -> AsyncIterator[None]:
+        async with AsyncExitStack() as held:
+            with self._metrics.stage('store_lock'):
+                await held.enter_async_context(self._wrapped.lock(game_id))
+            yield
+
+
+class SamplingProfiler(object):
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None):
+        """
+        Statistical profiler: a background thread samples the stack of one thread (by default
+        the one creating the profiler, i.e. the event loop's) every interval seconds and counts
+        the stacks.  The result is in the collapsed format read by flamegraph.pl and speedscope.
+
+        :param interval: seconds between samples
+        :param thread_id: ident of the thread to sample, the current thread if None
+        """
+        self.interval = interval
+        self.samples: 'Counter[str]' = Counter()
+        self._thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self._stopped = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stopped.clear()
+        self._sampler = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """
+        :return: one 'frame;frame;... count' line per distinct stack, most sampled first
+        """
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
@@ -0,0 +1,74 @@
+from typing import Callable
+from collections import OrderedDict
+import time
+
+
+class _Bucket(object):
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class TokenBucketLimiter(object):
+    def __init__(self, rate: float, burst: float, max_keys: int = 100000,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Token-bucket rate limits per key (e.g. per username or per client IP): each key may
+        spend up to burst tokens at once, refilled at rate tokens per second.
+
+        At most max_keys buckets are kept, least recently used are dropped first.  A dropped
+        bucket comes back full, which is what an idle key's bucket refills to anyway, so
+        memory stays bounded however many distinct keys are seen.
+
+        :param rate: tokens added per second
+        :param burst: capacity of each bucket
+        :param max_keys: maximum number of buckets kept
+        :param clock: monotonic clock, replaceable for testing
+        """
+        self._rate = rate
+        self._burst = burst
+        self._max_keys = max_keys
+        self._clock = clock
+        self._buckets: 'OrderedDict[str, _Bucket]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _refill(self, key: str) -> _Bucket:
+        now = self._clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(self._burst, now)
+            if len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            bucket.tokens = min(self._burst, bucket.tokens + (now - bucket.updated) * self._rate)
+            bucket.updated = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def wait_time(self, key: str, cost: float = 1.0) -> float:
+        """
+        :param key: the key to check
+        :param cost: tokens needed
+        :return: 0 if key has cost tokens now, otherwise the seconds until it has them
+        """
+        bucket = self._refill(key)
+        if bucket.tokens >= cost:
+            return 0.0
+        return (cost - bucket.tokens) / self._rate
+
+    def acquire(self, key: str, cost: float = 1.0) -> float:
+        """
+        Take cost tokens from key's bucket if it has them.
+
+        :param key: the key to charge
+        :param cost: tokens to take
+        :return: 0 if the tokens were taken, otherwise the seconds until they would be available
+        """
+        wait = self.wait_time(key, cost)
+        if wait == 0.0:
+            self._buckets[key].tokens -= cost
+        return wait
@@ -0,0 +1,178 @@
+"""
+Monte Carlo simulation of Blackjack hands with NumPy.
+
+Plays many independent rounds at once under the rules of blackjack.blackjack.Blackjack:
+every round is dealt from its own freshly shuffled shoe of num_decks decks, two cards to
+each player then the dealer, players draw in seat order, and the dealer draws until 17.
+Outcomes are counted the way compute_winners() reports them: 'PLAYER', 'DEALER' or 'NONE'.
+
+Usage: python simulate.py --hands 1000000 --players 1 --decks 2 --stand-on 12 17
+"""
+from concurrent.futures import Executor
+from typing import Dict, Any, Optional, Union, List, Tuple
+import argparse
+import asyncio
+import functools
+import time
+import numpy as np
+
+
+# values of 2, 3, ..., 10, J, Q, K, A with the ace counted as 11
+RANK_VALUES = np.array([2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11], dtype=np.int8)
+OUTCOMES = ('PLAYER', 'DEALER', 'NONE')
+DEALER_STANDS_ON = 17
+MAX_CARDS_PER_HAND = 12  # a hand cannot take a 12th card without going over 21
+
+
+def _shuffled_shoes(rng: np.random.Generator, num_rounds: int, num_decks: int) -> np.ndarray:
+    shoe = np.tile(np.repeat(RANK_VALUES, 4), num_decks)
+    return rng.permuted(np.tile(shoe, (num_rounds, 1)), axis=1)
+
+
+class _Hands(object):
+    """
+    Totals of one seat across every round of a batch, with aces counted as 11 while
+    that does not bust the hand.
+    """
+    __slots__ = ('total', 'soft_aces')
+
+    def __init__(self, num_rounds: int):
+        self.total = np.zeros(num_rounds, dtype=np.int16)
+        self.soft_aces = np.zeros(num_rounds, dtype=np.int8)
+
+    def add(self, cards: np.ndarray, mask: Union[np.ndarray, bool] = True):
+        cards = np.where(mask, cards, 0)
+        self.total += cards
+        self.soft_aces += cards == 11
+        harden = (self.total > 21) & (self.soft_aces > 0)
+        self.total -= 10 * harden
+        self.soft_aces -= harden
+
+
+def _outcomes(player: _Hands, dealer: _Hands) -> np.ndarray:
+    """
+    :return: index in OUTCOMES of the player's result in every round, as compute_winners() decides it
+    """
+    player_bust = player.total > 21
+    player_wins = ~player_bust & ((dealer.total > 21) | (player.total > dealer.total))
+    push = ~player_bust & (dealer.total <= 21) & (player.total == dealer.total)
+    return np.where(player_wins, 0, np.where(push, 2, 1))
+
+
+def _play_batch(rng: np.random.Generator, num_rounds: int, num_players: int, num_decks: int,
+                player_stands_on: int) -> np.ndarray:
+    shoes = _shuffled_shoes(rng, num_rounds, num_decks)
+    rows = np.arange(num_rounds)
+    next_card = np.zeros(num_rounds, dtype=np.int64)
+    players = [_Hands(num_rounds) for _ in range(num_players)]
+    dealer = _Hands(num_rounds)
+
+    def draw(hand: _Hands, mask: Union[np.ndarray, bool] = True):
+        hand.add(shoes[rows, next_card], mask)
+        np.add(next_card, mask, out=next_card)
+
+    for _ in range(2):
+        for hand in players + [dealer]:
+            draw(hand)
+    for hand in players:
+        drawing = hand.total < player_stands_on
+        while drawing.any():
+            draw(hand, drawing)
+            drawing &= hand.total < player_stands_on
+    drawing = dealer.total < DEALER_STANDS_ON
+    while drawing.any():
+        draw(dealer, drawing)
+        drawing &= dealer.total < DEALER_STANDS_ON
+
+    counts = np.zeros(len(OUTCOMES), dtype=np.int64)
+    for hand in players:
+        counts += np.bincount(_outcomes(hand, dealer), minlength=len(OUTCOMES))
+    return counts
+
+
+def simulate(num_rounds: int, num_players: int = 1, num_decks: int = 2, player_stands_on: int = 17,
+             seed: Union[int, np.random.SeedSequence, None] = None, batch_size: int = 65536) -> Dict[str, Any]:
+    """
+    Play rounds of Blackjack where every player draws until reaching player_stands_on.
+
+    :raises: ValueError if a shoe could run out of cards or an argument is out of range
+    :param num_rounds: number of rounds to play
+    :param num_players: number of players at the table
+    :param num_decks: number of decks in each round's shoe
+    :param player_stands_on: total at which players stop drawing (0 to never draw)
+    :param seed: seed of the random generator, random if None
+    :param batch_size: number of rounds played at once, which bounds memory use
+    :return: {'rounds', 'num_players', 'num_decks', 'player_stands_on',
+              'outcomes': {'PLAYER': count, 'DEALER': count, 'NONE': count}, 'house_edge'}
+              where outcomes are counted per player hand and house_edge is the dealer's
+              expected gain per hand at even money
+    """
+    if num_rounds < 0 or num_players < 1 or num_decks < 1 or batch_size < 1:
+        raise ValueError('num_rounds must be >= 0; num_players, num_decks and batch_size must be >= 1')
+    if (num_players + 1) * MAX_CARDS_PER_HAND > 52 * num_decks:
+        raise ValueError(f'{num_decks} deck(s) may run out of cards with {num_players} players')
+    rng = np.random.default_rng(seed)
+    counts = np.zeros(len(OUTCOMES), dtype=np.int64)
+    for start in range(0, num_rounds, batch_size):
+        counts += _play_batch(rng, min(batch_size, num_rounds - start), num_players, num_decks, player_stands_on)
+    return _result(num_rounds, num_players, num_decks, player_stands_on, counts)
+
+
+def _result(num_rounds: int, num_players: int, num_decks: int, player_stands_on: int,
+            counts: np.ndarray) -> Dict[str, Any]:
+    hands = num_rounds * num_players
+    return {'rounds': num_rounds, 'num_players': num_players, 'num_decks': num_decks,
+            'player_stands_on': player_stands_on,
+            'outcomes': {outcome: int(count) for outcome, count in zip(OUTCOMES, counts)},
+            'house_edge': float(counts[1] - counts[0]) / hands if hands else 0.0}
+
+
+async def simulate_in_executor(executor: Executor, num_rounds: int, num_players: int = 1, num_decks: int = 2,
+                               player_stands_on: int = 17, seed: Optional[int] = None,
+                               rounds_per_task: int = 250000) -> Dict[str, Any]:
+    """
+    Same as simulate(), split into tasks of at most rounds_per_task rounds run in an executor
+    (e.g. a ProcessPoolExecutor), each with its own independent random stream.
+
+    :param executor: the executor to run the tasks in
+    :param rounds_per_task: maximum number of rounds per task
+    :return: the simulate() result over all rounds
+    """
+    num_tasks = max(1, -(-num_rounds // rounds_per_task))
+    seeds = np.random.SeedSequence(seed).spawn(num_tasks)
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(executor, functools.partial(
+            simulate, num_rounds * (task + 1) // num_tasks - num_rounds * task // num_tasks,
+            num_players, num_decks, player_stands_on, seeds[task]))
+        for task in range(num_tasks)))
+    counts = np.array([sum(result['outcomes'][outcome] for result in results) for outcome in OUTCOMES])
+    return _result(num_rounds, num_players, num_decks, player_stands_on, counts)
+
+
+def house_edge_table(num_rounds: int, stand_on_totals: List[int], num_players: int = 1,
+                     num_decks: int = 2, seed: Optional[int] = None) -> List[Tuple[int, float]]:
+    """
+    :return: [(player_stands_on, house edge), ...] for each total in stand_on_totals
+    """
+    seeds = np.random.SeedSequence(seed).spawn(len(stand_on_totals))
+    return [(stands_on, simulate(num_rounds, num_players, num_decks, stands_on, stand_seed)['house_edge'])
+            for stands_on, stand_seed in zip(stand_on_totals, seeds)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--hands', type=int, default=1000000, help='number of rounds to play per total')
+    parser.add_argument('--players', type=int, default=1, help='number of players at the table')
+    parser.add_argument('--decks', type=int, default=2, help='number of decks in the shoe')
+    parser.add_argument('--stand-on', type=int, nargs='+', default=[17],
+                        help='totals at which players stop drawing, one table row each')
+    parser.add_argument('--seed', type=int, default=None, help='random seed')
+    args = parser.parse_args()
+    start = time.perf_counter()
+    table = house_edge_table(args.hands, args.stand_on, args.players, args.decks, args.seed)
+    elapsed = time.perf_counter() - start
+    print(f'{"stand on":>8}  {"house edge":>10}')
+    for stands_on, edge in table:
+        print(f'{stands_on:>8}  {edge:>10.4f}')
+    print(f'{args.hands * len(table) / elapsed:,.0f} rounds/s')
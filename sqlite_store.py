@@ -0,0 +1,501 @@
+from typing import Tuple, Dict, List, Union, Iterator, Any, MutableMapping, AsyncIterator, Optional, TYPE_CHECKING
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import fcntl
+import logging
+import os
+import pickle
+import queue
+import secrets
+import sqlite3
+import threading
+import zlib
+from blackjack_db import GameStore, BlackjackGameInfo
+
+if TYPE_CHECKING:
+    from blackjack.blackjack import Blackjack
+
+logger = logging.getLogger(__name__)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (game_id TEXT PRIMARY KEY, game BLOB NOT NULL, info BLOB NOT NULL,
+                                  owner TEXT, num_players INTEGER);
+CREATE TABLE IF NOT EXISTS game_players (game_id TEXT NOT NULL, username TEXT NOT NULL,
+                                         PRIMARY KEY (game_id, username));
+CREATE TABLE IF NOT EXISTS accounts (username TEXT PRIMARY KEY, hash BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS secrets (name TEXT PRIMARY KEY, value BLOB NOT NULL);
+"""
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS games_by_owner ON games (owner);
+CREATE INDEX IF NOT EXISTS game_players_by_username ON game_players (username);
+"""
+
+
+def _add_game_columns(conn: sqlite3.Connection):
+    # databases written before games could be listed from SQLite lack the owner and player columns
+    if 'owner' in {row[1] for row in conn.execute('PRAGMA table_info(games)')}:
+        return
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if 'owner' not in {row[1] for row in conn.execute('PRAGMA table_info(games)')}:
+            conn.execute('ALTER TABLE games ADD COLUMN owner TEXT')
+            conn.execute('ALTER TABLE games ADD COLUMN num_players INTEGER')
+            for game_id, info in conn.execute('SELECT game_id, info FROM games').fetchall():
+                game_info = pickle.loads(info)
+                conn.execute('UPDATE games SET owner = ?, num_players = ? WHERE game_id = ?',
+                             (game_info.owner, game_info.num_players, game_id))
+                conn.executemany('INSERT OR IGNORE INTO game_players (game_id, username) VALUES (?, ?)',
+                                 [(game_id, username) for username in game_info.players])
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Open a connection to the state database in WAL mode, creating the tables if needed.
+
+    :param path: path of the SQLite database file
+    :return: the connection
+    """
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(_SCHEMA)
+    _add_game_columns(conn)
+    conn.executescript(_INDEXES)
+    return conn
+
+
+def load_secret(path: str, name: str) -> bytes:
+    """
+    Get a random secret stored in the state database, creating it on first use, so that
+    every process sharing the database (e.g. uvicorn workers) uses the same key.
+
+    :param path: path of the SQLite database file
+    :param name: name of the secret
+    :return: the 32-byte secret
+    """
+    conn = connect(path)
+    with conn:
+        conn.execute('INSERT OR IGNORE INTO secrets (name, value) VALUES (?, ?)', (name, secrets.token_bytes(32)))
+    value = conn.execute('SELECT value FROM secrets WHERE name = ?', (name,)).fetchone()[0]
+    conn.close()
+    return value
+
+
+class StripedFileLock(object):
+    def __init__(self, path: str, num_stripes: int = 256):
+        """
+        Per-key lock that works across processes: each key hashes to one byte of a lock file,
+        locked with fcntl.lockf.  POSIX record locks do not exclude threads of one process,
+        so each stripe also has an asyncio.Lock for coroutines of this process.
+
+        Waits for the file lock run on threads of their own rather than the default executor,
+        where a holder's to_thread() calls could otherwise queue behind waiters for its lock.
+
+        :param path: path of the lock file, created if needed
+        :param num_stripes: number of independent stripes
+        """
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._num_stripes = num_stripes
+        self._local_locks = [asyncio.Lock() for _ in range(num_stripes)]
+        # at most one waiter per stripe, so a wait never queues behind another
+        self._waiters = ThreadPoolExecutor(num_stripes, thread_name_prefix='sqlite-lock')
+
+    @asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        stripe = zlib.crc32(key.encode()) % self._num_stripes
+        async with self._local_locks[stripe]:
+            await asyncio.get_running_loop().run_in_executor(
+                self._waiters, fcntl.lockf, self._fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+
+
+class _Flush(threading.Event):
+    """
+    Set by the writer thread once the writes queued before it are committed, with error
+    holding the exception if their transaction failed.
+    """
+    error: Optional[BaseException] = None
+
+
+class SQLiteWriteBatcher(object):
+    def __init__(self, path: str, max_batch: int = 1000, max_delay: float = 0.005):
+        """
+        Background writer thread that coalesces writes to the state database into
+        batched transactions.  Writes with the same key in one batch collapse to the last one.
+
+        :param path: path of the SQLite database file
+        :param max_batch: maximum writes per transaction
+        :param max_delay: seconds to wait for more writes before committing a batch
+        """
+        self.path = path
+        self._conn = connect(path)
+        self._queue: 'queue.Queue[Any]' = queue.Queue()
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self.batches_committed: int = 0
+        self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, key: Tuple[str, str], sql: str, params: Tuple):
+        """
+        Queue a write without waiting for it.
+
+        :param key: (table, primary key) used to coalesce writes to the same row
+        :param sql: the statement to execute
+        :param params: the statement's parameters
+        """
+        self._queue.put((key, sql, params))
+
+    def flush(self):
+        """
+        Block until every write submitted so far is committed.
+
+        :raises: the error of the transaction holding the last of them, e.g. sqlite3.Error, if it failed
+        """
+        done = _Flush()
+        self._queue.put(done)
+        done.wait()
+        if done.error is not None:
+            raise done.error
+
+    async def flush_async(self):
+        """
+        Same as flush(), without blocking the event loop.
+        """
+        await asyncio.to_thread(self.flush)
+
+    def close(self):
+        """
+        Commit pending writes and stop the writer thread.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        self._conn.close()
+
+    def _run(self):
+        running = True
+        while running:
+            batch: 'OrderedDict[Tuple[str, str], Tuple[str, Tuple]]' = OrderedDict()
+            waiters: List[_Flush] = []
+            item = self._queue.get()
+            while True:
+                if item is None:
+                    running = False
+                elif isinstance(item, _Flush):
+                    waiters.append(item)
+                else:
+                    key, sql, params = item
+                    batch.pop(key, None)
+                    batch[key] = (sql, params)
+                if not running or len(batch) >= self._max_batch:
+                    break
+                try:
+                    item = self._queue.get(timeout=self._max_delay)
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    with self._conn:
+                        for sql, params in batch.values():
+                            self._conn.execute(sql, params)
+                    self.batches_committed += 1
+            except Exception as error:
+                logger.exception('writing a batch of %d rows to %s failed', len(batch), self.path)
+                for waiter in waiters:
+                    waiter.error = error
+            finally:
+                for waiter in waiters:
+                    waiter.set()
+
+
+class SQLiteGameStore(GameStore):
+    def __init__(self, batcher: SQLiteWriteBatcher, shared: bool = False):
+        """
+        Game store persisted to SQLite.  Writes go through the batcher.
+
+        By default every game is loaded into an in-process cache at startup and reads are
+        served from it.  With shared=True, several processes (e.g. uvicorn workers) can use
+        the same database: there is no cache, reads go to the database, writes are committed
+        before put() returns, lock() holds a per-game lock across all processes, and page()
+        lists the games of every process, by rowid.
+
+        :param batcher: the write batcher of the state database
+        :param shared: whether other processes use the same database at the same time
+        """
+        self._batcher = batcher
+        self.shared = shared
+        self.games: Dict[str, 'Blackjack'] = {}
+        self.games_info: Dict[str, BlackjackGameInfo] = {}
+        self._local = threading.local()  # one read connection per to_thread worker
+        self._file_lock: Optional[StripedFileLock] = None
+        if shared:
+            self._file_lock = StripedFileLock(batcher.path + '.locks')
+            return
+        conn = connect(batcher.path)
+        for game_id, game, info in conn.execute('SELECT game_id, game, info FROM games'):
+            self.games[game_id] = pickle.loads(game)
+            self.games_info[game_id] = pickle.loads(info)
+        conn.close()
+
+    def _reader(self) -> sqlite3.Connection:
+        if not hasattr(self._local, 'conn'):
+            self._local.conn = connect(self._batcher.path)
+        return self._local.conn
+
+    def _load(self, game_id: str) -> Tuple[Union['Blackjack', None], Union[BlackjackGameInfo, None]]:
+        row = self._reader().execute('SELECT game, info FROM games WHERE game_id = ?', (game_id,)).fetchone()
+        if row is None:
+            return None, None
+        return pickle.loads(row[0]), pickle.loads(row[1])
+
+    def _load_all(self) -> List[Tuple[str, 'Blackjack']]:
+        return [(game_id, pickle.loads(game)) for game_id, game in
+                self._reader().execute('SELECT game_id, game FROM games').fetchall()]
+
+    def _load_page(self, after: int, limit: int, owner: Optional[str],
+                   player: Optional[str]) -> List[Tuple[int, str, str, int]]:
+        if player is not None:
+            # in joining order, like GameIndex
+            sql = ('SELECT game_players.rowid, games.game_id, games.owner, games.num_players FROM game_players '
+                   'JOIN games ON games.game_id = game_players.game_id '
+                   'WHERE game_players.username = ? AND game_players.rowid > ?')
+            params: List[Any] = [player, after]
+        else:
+            sql = 'SELECT rowid, game_id, owner, num_players FROM games WHERE rowid > ?'
+            params = [after]
+        if owner is not None:
+            sql += ' AND games.owner = ?'
+            params.append(owner)
+        sql += ' ORDER BY 1 LIMIT ?'
+        params.append(limit)
+        return self._reader().execute(sql, params).fetchall()
+
+    async def put(self, game_id: str, game: 'Blackjack', game_info: BlackjackGameInfo):
+        if not self.shared:
+            self.games[game_id] = game
+            self.games_info[game_id] = game_info
+        # pickle now, on the event loop, so the writer never sees a game mid-mutation.
+        # An upsert rather than INSERT OR REPLACE keeps the game's rowid, which page() orders by.
+        self._batcher.submit(('games', game_id),
+                             'INSERT INTO games (game_id, game, info, owner, num_players) VALUES (?, ?, ?, ?, ?) '
+                             'ON CONFLICT (game_id) DO UPDATE SET game = excluded.game, info = excluded.info',
+                             (game_id, pickle.dumps(game), pickle.dumps(game_info), game_info.owner,
+                              game_info.num_players))
+        for username in game_info.players:
+            self._batcher.submit(('game_players', f'{game_id} {username}'),
+                                 'INSERT OR IGNORE INTO game_players (game_id, username) VALUES (?, ?)',
+                                 (game_id, username))
+        if self.shared:
+            await self._batcher.flush_async()
+
+    async def get(self, game_id: str) -> Tuple[Union['Blackjack', None], Union[BlackjackGameInfo, None]]:
+        if self.shared:
+            return await asyncio.to_thread(self._load, game_id)
+        return self.games.get(game_id, None), self.games_info.get(game_id, None)
+
+    async def delete(self, game_id: str):
+        if self.shared:
+            if (await self.get(game_id))[0] is None:
+                raise KeyError(game_id)
+        else:
+            del self.games[game_id]
+            del self.games_info[game_id]
+        self._batcher.submit(('games', game_id), 'DELETE FROM games WHERE game_id = ?', (game_id,))
+        self._batcher.submit(('game_players', game_id), 'DELETE FROM game_players WHERE game_id = ?', (game_id,))
+        if self.shared:
+            await self._batcher.flush_async()
+
+    async def items(self) -> List[Tuple[str, 'Blackjack']]:
+        if self.shared:
+            return await asyncio.to_thread(self._load_all)
+        return list(self.games.items())
+
+    async def page(self, cursor: Optional[str] = None, limit: int = 100, owner: Optional[str] = None,
+                   player: Optional[str] = None) -> Tuple[List[Tuple[str, str, int]], Optional[str]]:
+        after = int(cursor) if cursor is not None else -1
+        rows = await asyncio.to_thread(self._load_page, after, limit, owner, player)
+        games = [(game_id, game_owner, num_players) for _, game_id, game_owner, num_players in rows]
+        return games, str(rows[-1][0]) if len(rows) == limit else None
+
+    @asynccontextmanager
+    async def lock(self, game_id: str) -> AsyncIterator[None]:
+        if self._file_lock is None:
+            yield
+            return
+        async with self._file_lock.hold(game_id):
+            yield
+
+
+class SQLiteAccountStore(MutableMapping[str, bytes]):
+    def __init__(self, batcher: SQLiteWriteBatcher, shared: bool = False):
+        """
+        Mapping of username -> password hash persisted to SQLite, usable as UserDB's accounts.
+        Reads come from an in-process cache loaded at startup; writes go through the batcher.
+
+        With shared=True, users created by other processes are read from the database on a
+        cache miss and writes are committed before returning, so every process sees them.
+        Usernames this process has not seen are inserted as new accounts in one transaction,
+        so that two processes creating the same user cannot overwrite each other; only hashes
+        of known users (rehashes) replace the stored row.
+
+        The mapping methods may block on the database in shared mode; coroutines use get_async(),
+        set_async(), add_new_async() and taken_async(), which run that I/O in a thread.
+
+        :param batcher: the write batcher of the state database
+        :param shared: whether other processes use the same database at the same time
+        """
+        self._batcher = batcher
+        self._shared = shared
+        self._local = threading.local()  # one connection per thread
+        self._cache: Dict[str, bytes] = dict(self._connection().execute('SELECT username, hash FROM accounts'))
+
+    def _connection(self) -> sqlite3.Connection:
+        if not hasattr(self._local, 'conn'):
+            self._local.conn = connect(self._batcher.path)
+        return self._local.conn
+
+    def _fetch(self, username: str) -> Optional[bytes]:
+        row = self._connection().execute('SELECT hash FROM accounts WHERE username = ?', (username,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _taken(self, usernames: List[str]) -> List[str]:
+        taken = []
+        for start in range(0, len(usernames), 500):
+            chunk = usernames[start:start + 500]
+            taken += [row[0] for row in self._connection().execute(
+                f'SELECT username FROM accounts WHERE username IN ({", ".join("?" * len(chunk))})', chunk)]
+        return taken
+
+    def _submit(self, username: str, stored_hash: bytes):
+        self._cache[username] = stored_hash
+        self._batcher.submit(('accounts', username),
+                             'INSERT OR REPLACE INTO accounts (username, hash) VALUES (?, ?)',
+                             (username, stored_hash))
+
+    def __getitem__(self, username: str) -> bytes:
+        if username not in self._cache and self._shared:
+            stored_hash = self._fetch(username)
+            if stored_hash is not None:
+                self._cache[username] = stored_hash
+        return self._cache[username]
+
+    def _insert_new(self, accounts: Dict[str, bytes]):
+        conn = self._connection()
+        try:
+            with conn:
+                conn.executemany('INSERT INTO accounts (username, hash) VALUES (?, ?)', accounts.items())
+        except sqlite3.IntegrityError as error:
+            raise ValueError(f'username already taken: {error}') from error
+        self._cache.update(accounts)
+
+    async def get_async(self, username: str) -> Optional[bytes]:
+        """
+        :return: the password hash of username, None if there is no such account
+        """
+        if username not in self._cache and self._shared:
+            stored_hash = await asyncio.to_thread(self._fetch, username)
+            if stored_hash is not None:
+                self._cache[username] = stored_hash
+        return self._cache.get(username)
+
+    async def set_async(self, username: str, stored_hash: bytes):
+        """
+        Same as self[username] = stored_hash.
+
+        :raises: ValueError in shared mode if another process created the new username first
+        """
+        if self._shared and username not in self._cache:
+            await asyncio.to_thread(self._insert_new, {username: stored_hash})
+            return
+        self._submit(username, stored_hash)
+        if self._shared:
+            await self._batcher.flush_async()
+
+    async def add_new_async(self, accounts: Dict[str, bytes]):
+        """
+        Create accounts, all or none.
+
+        :raises: ValueError if any of the usernames already exists
+        """
+        if self._shared:
+            await asyncio.to_thread(self._insert_new, accounts)
+            return
+        taken = [username for username in accounts if username in self._cache]
+        if taken:
+            raise ValueError(f'usernames {", ".join(taken)} already taken')
+        for username, stored_hash in accounts.items():
+            self._submit(username, stored_hash)
+
+    async def taken_async(self, usernames: List[str]) -> List[str]:
+        """
+        :return: those of usernames that already have an account
+        """
+        taken = [username for username in usernames if username in self._cache]
+        if self._shared:
+            unknown = [username for username in usernames if username not in self._cache]
+            if unknown:
+                taken += await asyncio.to_thread(self._taken, unknown)
+        return taken
+
+    def __setitem__(self, username: str, stored_hash: bytes):
+        """
+        :raises: ValueError in shared mode if another process created the new username first
+        """
+        if self._shared and username not in self._cache:
+            self._insert_new({username: stored_hash})
+            return
+        self._submit(username, stored_hash)
+        if self._shared:
+            self._batcher.flush()
+
+    def update(self, other=(), **kwargs):
+        """
+        Set many accounts with a single flush in shared mode, where the new ones are
+        inserted all or none.
+
+        :raises: ValueError in shared mode if another process created any of the new usernames first
+        """
+        accounts = dict(other, **kwargs)
+        if self._shared:
+            self._insert_new({username: stored_hash for username, stored_hash in accounts.items()
+                              if username not in self._cache})
+            accounts = {username: stored_hash for username, stored_hash in accounts.items()
+                        if self._cache[username] != stored_hash}
+        for username, stored_hash in accounts.items():
+            self._submit(username, stored_hash)
+        if self._shared:
+            self._batcher.flush()
+
+    def __delitem__(self, username: str):
+        del self._cache[username]
+        self._batcher.submit(('accounts', username), 'DELETE FROM accounts WHERE username = ?', (username,))
+        if self._shared:
+            self._batcher.flush()
+
+    def __iter__(self) -> Iterator[str]:
+        if self._shared:
+            return iter([row[0] for row in self._connection().execute('SELECT username FROM accounts')])
+        return iter(self._cache)
+
+    def __len__(self) -> int:
+        if self._shared:
+            return self._connection().execute('SELECT COUNT(*) FROM accounts').fetchone()[0]
+        return len(self._cache)
+
+    def __contains__(self, username: object) -> bool:
+        try:
+            self[username]
+        except KeyError:
+            return False
+        return True
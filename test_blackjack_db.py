@@ -1,7 +1,9 @@
-from blackjack_db import AsyncBlackjackGameDB
+from blackjack_db import AsyncBlackjackGameDB, SimulatedLatencyGameStore, BlackjackGameInfo
+from fastapi import HTTPException
 from user_db import UserDB
 import pytest
 import asyncio
+import pickle
 
 TEST_USER = 'tester'
 
@@ -53,5 +55,129 @@ async def test_del_game(single_game_db):
     assert await single_game_db[0].del_game(single_game_db[1], single_game_db[2], TEST_USER) is True
 
 
+@pytest.mark.asyncio
+async def test_add_player(base_game_db):
+    game_uuid, _, _ = await base_game_db.add_game(2, TEST_USER)
+    assert await base_game_db.add_player(game_uuid, 'other') == 1
+    _, game_info = await base_game_db.get_game(game_uuid)
+    assert game_info.players == [TEST_USER, 'other']
+
+
+@pytest.mark.asyncio
+async def test_simulated_latency_store(base_user_db):
+    latency_db = AsyncBlackjackGameDB(base_user_db[0], SimulatedLatencyGameStore(0.01))
+    game_uuid, _, _ = await latency_db.add_game(1, TEST_USER)
+    the_game, the_game_info = await latency_db.get_game(game_uuid)
+    assert the_game_info.owner == TEST_USER
+    assert len(await latency_db.list_games()) == 1
+
+
+@pytest.mark.asyncio
+async def test_game_session_serializes_same_game(base_user_db):
+    latency_db = AsyncBlackjackGameDB(base_user_db[0], SimulatedLatencyGameStore(0.01))
+    game_a, _, _ = await latency_db.add_game(1, TEST_USER)
+    game_b, _, _ = await latency_db.add_game(1, TEST_USER)
+    events = []
+
+    async def session(game_id, tag):
+        async with latency_db.game_session(game_id):
+            events.append(('enter', tag))
+            await asyncio.sleep(0.01)
+            events.append(('exit', tag))
+
+    await asyncio.gather(session(game_a, 'a1'), session(game_a, 'a2'), session(game_b, 'b1'))
+    a_events = [event for event in events if event[1].startswith('a')]
+    assert a_events in ([('enter', 'a1'), ('exit', 'a1'), ('enter', 'a2'), ('exit', 'a2')],
+                        [('enter', 'a2'), ('exit', 'a2'), ('enter', 'a1'), ('exit', 'a1')])
+    assert events.index(('enter', 'b1')) < events.index(('exit', 'a1'))
+    assert latency_db._game_locks == {}
+
+
+def test_game_info_player_lookup():
+    game_info = BlackjackGameInfo(13, TEST_USER, [TEST_USER], 'password')
+    assert game_info.player_idx(TEST_USER) == 0
+    assert game_info.player_idx('nobody') is None
+    assert game_info.player_at(0) == TEST_USER
+    assert game_info.player_at(1) is None
+    assert game_info.player_at(-1) is None
+    for idx in range(1, 12):
+        assert game_info.add_player(f'player{idx}') == idx
+    assert game_info.add_player(TEST_USER) == 12
+    with pytest.raises(ValueError):
+        game_info.add_player('one too many')
+    assert game_info.player_idx('player11') == 11
+    assert game_info.player_idx(TEST_USER) == 0
+
+
+@pytest.mark.asyncio
+async def test_cached_views_follow_version(base_game_db):
+    game_uuid, _, _ = await base_game_db.add_game(1, TEST_USER)
+    the_game, the_game_info = await base_game_db.get_game(game_uuid)
+    calls = []
+    original_get_stacks = the_game.get_stacks
+    the_game.get_stacks = lambda: calls.append(1) or original_get_stacks()
+    async with base_game_db.game_session(game_uuid) as (game, _):
+        game.initial_deal()
+    assert the_game_info.version == 1
+    assert len(base_game_db.player_stack(game_uuid, the_game, the_game_info, 0)) == 2
+    assert base_game_db.stacks(game_uuid, the_game, the_game_info)[1][0] is \
+        base_game_db.player_stack(game_uuid, the_game, the_game_info, 0)
+    assert base_game_db.winners(game_uuid, the_game, the_game_info) is \
+        base_game_db.winners(game_uuid, the_game, the_game_info)
+    assert len(calls) == 1
+    async with base_game_db.game_session(game_uuid) as (game, _):
+        game.player_draw(0)
+    assert the_game_info.version == 2
+    assert len(base_game_db.player_stack(game_uuid, the_game, the_game_info, 0)) == 3
+    assert len(calls) == 2
+    with pytest.raises(HTTPException):
+        async with base_game_db.game_session(game_uuid):
+            raise HTTPException(401, 'rejected before changing the game')
+    assert the_game_info.version == 2
+    assert len(base_game_db.player_stack(game_uuid, the_game, the_game_info, 0)) == 3
+    assert len(calls) == 2
+
+
+def test_game_info_pickle():
+    game_info = BlackjackGameInfo(2, TEST_USER, [TEST_USER, 'other'], 'password')
+    assert pickle.loads(pickle.dumps(game_info)) == game_info
+    legacy = BlackjackGameInfo.__new__(BlackjackGameInfo)
+    legacy.__setstate__({'num_players': 2, 'owner': TEST_USER, 'players': [TEST_USER, 'other'],
+                         'termination_password': 'password'})
+    assert legacy == game_info
+    legacy.__setstate__((2, TEST_USER, [TEST_USER, 'other'], 'password'))
+    assert legacy == game_info
+    game_info.version = 3
+    assert pickle.loads(pickle.dumps(game_info)).version == 3
+
+
+@pytest.mark.asyncio
+async def test_reap_idle_games(base_user_db, clock):
+    expiring_db = AsyncBlackjackGameDB(base_user_db[0], idle_ttl=10.0, clock=clock)
+    idle_uuid, _, _ = await expiring_db.add_game(1, TEST_USER)
+    clock.now = 5.0
+    active_uuid, _, _ = await expiring_db.add_game(1, TEST_USER)
+    clock.now = 12.0
+    assert await expiring_db.reap_idle_games() == 1
+    assert (await expiring_db.get_game(idle_uuid))[0] is None
+    assert (await expiring_db.get_game(active_uuid))[0] is not None
+    assert expiring_db.live_game_count == 1
+    assert await expiring_db.approx_bytes() > 0
+
+
+@pytest.mark.asyncio
+async def test_max_games_evicts_least_recent(base_user_db, clock):
+    capped_db = AsyncBlackjackGameDB(base_user_db[0], max_games=2, clock=clock)
+    first_uuid, _, _ = await capped_db.add_game(1, TEST_USER)
+    clock.now = 1.0
+    second_uuid, _, _ = await capped_db.add_game(1, TEST_USER)
+    clock.now = 2.0
+    await capped_db.get_game(first_uuid)
+    clock.now = 3.0
+    third_uuid, _, _ = await capped_db.add_game(1, TEST_USER)
+    assert sorted(game_id for game_id, _ in await capped_db.list_games()) == sorted([first_uuid, third_uuid])
+    assert capped_db.live_game_count == 2
+
+
 if __name__ == '__main__':
     pytest.main()
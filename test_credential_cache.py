@@ -0,0 +1,49 @@
+import pytest
+from credential_cache import CredentialCache
+
+
+@pytest.fixture
+def cache(clock):
+    return CredentialCache(max_entries=2, ttl=10.0, clock=clock)
+
+
+def test_hit_and_miss(cache):
+    assert cache.is_cached('jimbo', 'pass') is False
+    cache.add('jimbo', 'pass')
+    assert cache.is_cached('jimbo', 'pass') is True
+    assert cache.is_cached('jimbo', 'wrong') is False
+    assert cache.hits == 1
+    assert cache.misses == 2
+
+
+def test_no_plaintext(cache):
+    cache.add('jimbo', 'supersecret')
+    assert all(b'supersecret' not in digest for digest in cache._entries)
+
+
+def test_ttl_expiry(cache, clock):
+    cache.add('jimbo', 'pass')
+    clock.now = 11.0
+    assert cache.is_cached('jimbo', 'pass') is False
+    assert len(cache) == 0
+
+
+def test_lru_eviction(cache):
+    cache.add('a', 'pass')
+    cache.add('b', 'pass')
+    assert cache.is_cached('a', 'pass') is True
+    cache.add('c', 'pass')
+    assert cache.is_cached('b', 'pass') is False
+    assert cache.is_cached('a', 'pass') is True
+    assert cache.is_cached('c', 'pass') is True
+
+
+def test_invalidate(cache):
+    cache.add('jimbo', 'pass')
+    cache.invalidate('jimbo')
+    assert cache.is_cached('jimbo', 'pass') is False
+    assert len(cache) == 0
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,126 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from blackjack_db import AsyncBlackjackGameDB, Blackjack
+import event_log as event_log_module
+from event_log import EventLog, recover, read_events, PLAYER_HIT
+from user_db import UserDB
+
+
+async def play_one_game(game_db: AsyncBlackjackGameDB) -> str:
+    game_id, _, _ = await game_db.add_game(2, 'owner', 1)
+    await game_db.add_player(game_id, 'second')
+    async with game_db.game_session(game_id) as (the_game, _):
+        the_game.initial_deal()
+        the_game.player_draw(1)
+        the_game.dealer_draw()
+    return game_id
+
+
+@pytest.mark.asyncio
+async def test_replay_after_restart(tmp_path):
+    event_log = EventLog(str(tmp_path))
+    user_db = UserDB(accounts=event_log.accounts())
+    user_db.create_user('owner')
+    game_db = AsyncBlackjackGameDB(user_db, journal=event_log)
+    game_id = await play_one_game(game_db)
+    removed_id = await play_one_game(game_db)
+    await game_db.del_game(removed_id, (await game_db.get_game(removed_id))[1].termination_password, 'owner')
+    stacks = (await game_db.get_game(game_id))[0].get_stacks()
+    await event_log.close()
+
+    state = EventLog.recover(str(tmp_path))
+    assert list(state['games']) == [game_id]
+    recovered_game, recovered_info = state['games'][game_id]
+    assert recovered_game.get_stacks() == stacks
+    assert recovered_info.players == ['owner', 'second']
+    assert list(state['accounts']) == ['owner']
+
+
+@pytest.mark.asyncio
+async def test_torn_tail_is_ignored(tmp_path):
+    event_log = EventLog(str(tmp_path))
+    game_db = AsyncBlackjackGameDB(UserDB(), journal=event_log)
+    await play_one_game(game_db)
+    await event_log.close()
+    segment, = [os.path.join(tmp_path, name) for name in os.listdir(tmp_path)]
+    kinds = [kind for kind, _ in read_events(segment)]
+    assert PLAYER_HIT in kinds
+    with open(segment, 'r+b') as segment_file:
+        segment_file.truncate(os.path.getsize(segment) - 1)  # the last event was half written
+    assert [kind for kind, _ in read_events(segment)] == kinds[:-1]
+
+
+@pytest.mark.asyncio
+async def test_compaction(tmp_path):
+    event_log = EventLog(str(tmp_path), segment_events=4, chunk_bytes=4096,
+                         compact_executor=ThreadPoolExecutor(1))
+    game_db = AsyncBlackjackGameDB(UserDB(), journal=event_log)
+    game_ids = [await play_one_game(game_db) for _ in range(5)]  # 5 events per game, 25 in all
+    stacks = [(await game_db.get_game(game_id))[0].get_stacks() for game_id in game_ids]
+    await event_log.compact()
+    # the 7th segment is the one its flush prepared for moving on to, removed by close()
+    assert sorted(os.listdir(tmp_path)) == ['events-00000006.log', 'events-00000007.log', 'snapshot-00000006.pickle']
+    await event_log.close()
+    assert sorted(os.listdir(tmp_path)) == ['events-00000006.log', 'snapshot-00000006.pickle']
+
+    state, generation = recover(str(tmp_path))
+    assert generation == 6
+    assert [state['games'][game_id][0].get_stacks() for game_id in game_ids] == stacks
+
+
+@pytest.mark.asyncio
+async def test_failed_actions_replay_the_same(tmp_path, caplog):
+    event_log = EventLog(str(tmp_path))
+    game_db = AsyncBlackjackGameDB(UserDB(), journal=event_log)
+    game_id, _, _ = await game_db.add_game(1, 'owner', 1)
+    with pytest.raises(Exception):
+        async with game_db.game_session(game_id) as (the_game, _):
+            the_game.player_draw(5)  # no such player
+    async with game_db.game_session(game_id) as (the_game, _):
+        the_game.initial_deal()
+    stacks = (await game_db.get_game(game_id))[0].get_stacks()
+    await event_log.close()
+    with caplog.at_level(logging.INFO, logger='event_log'):
+        assert EventLog.recover(str(tmp_path))['games'][game_id][0].get_stacks() == stacks
+    assert f'skipped event 1 (type {PLAYER_HIT}) of game {game_id}' in caplog.text
+
+
+def test_moving_on_is_finished_by_flush(tmp_path):
+    # 25 bytes per event: the map grows at the 2nd and 3rd events, then the log moves on
+    event_log = EventLog(str(tmp_path), segment_events=3, chunk_bytes=40)
+    for game_number in range(4):
+        event_log.game_removed(f'00000000-0000-0000-0000-00000000000{game_number}')
+    first_segment = os.path.join(tmp_path, 'events-00000000.log')
+    assert os.path.getsize(first_segment) == 90  # append() leaves truncating it to flush()
+    event_log.flush()
+    assert os.path.getsize(first_segment) == 75
+    assert len(list(read_events(first_segment))) == 3
+    event_log.flush()
+    assert len(list(read_events(os.path.join(tmp_path, 'events-00000001.log')))) == 1
+
+
+def test_append_uses_what_flush_prepared(tmp_path, monkeypatch):
+    event_log = EventLog(str(tmp_path), segment_events=3, chunk_bytes=40)
+    event_log.game_removed('00000000-0000-0000-0000-000000000000')  # past half of the first map
+    event_log.flush()
+
+    def on_event_loop(*args):
+        raise AssertionError('append() grew or created a segment itself')
+    with monkeypatch.context() as patched:
+        patched.setattr(event_log_module.os, 'ftruncate', on_event_loop)
+        patched.setattr(event_log_module.mmap, 'mmap', on_event_loop)
+        for game_number in range(1, 4):  # grows the map at the 2nd event, moves on after the 3rd
+            event_log.game_removed(f'00000000-0000-0000-0000-00000000000{game_number}')
+    event_log.flush()
+    assert len(list(read_events(os.path.join(tmp_path, 'events-00000000.log')))) == 3
+    assert len(list(read_events(os.path.join(tmp_path, 'events-00000001.log')))) == 1
+
+
+def test_new_segment_after_restart(tmp_path):
+    EventLog(str(tmp_path)).game_created('00000000-0000-0000-0000-000000000001', Blackjack(1, 1), None)
+    event_log = EventLog(str(tmp_path))  # the first was never closed, as after a crash
+    assert sorted(os.listdir(tmp_path)) == ['events-00000000.log', 'events-00000001.log']
+    assert list(EventLog.recover(str(tmp_path))['games']) == ['00000000-0000-0000-0000-000000000001']
+    event_log.flush()
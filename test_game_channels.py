@@ -0,0 +1,43 @@
+import json
+import pytest
+from game_channels import GameChannels
+
+
+@pytest.mark.asyncio
+async def test_publish_fans_out():
+    channels = GameChannels()
+    first = channels.subscribe('game')
+    second = channels.subscribe('game')
+    other = channels.subscribe('other_game')
+    channels.publish('game', {'event': 'player_stack', 'player': 0})
+    first_text = first.get_nowait()
+    assert json.loads(first_text) == {'event': 'player_stack', 'player': 0}
+    assert second.get_nowait() is first_text
+    assert other.empty()
+
+
+@pytest.mark.asyncio
+async def test_unsubscribe_and_close():
+    channels = GameChannels()
+    first = channels.subscribe('game')
+    second = channels.subscribe('game')
+    channels.unsubscribe('game', first)
+    assert channels.subscriber_count('game') == 1
+    channels.close_game('game')
+    assert second.get_nowait() is None
+    assert channels.subscriber_count('game') == 0
+    channels.publish('game', {'event': 'ignored'})
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_is_dropped():
+    channels = GameChannels(max_queued=2)
+    slow = channels.subscribe('game')
+    for idx in range(3):
+        channels.publish('game', {'event': idx})
+    assert [slow.get_nowait() for _ in range(3)][-1] is None
+    assert channels.subscriber_count('game') == 0
+
+
+if __name__ == '__main__':
+    pytest.main()
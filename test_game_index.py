@@ -0,0 +1,56 @@
+import pytest
+from game_index import GameIndex
+
+
+@pytest.fixture
+def index():
+    the_index = GameIndex()
+    for idx in range(5):
+        owner = 'alice' if idx % 2 == 0 else 'bob'
+        the_index.add_game(f'game{idx}', owner, 2, [owner])
+    the_index.add_player('game1', 'alice')
+    return the_index
+
+
+def test_page_all(index):
+    games, cursor = index.page(limit=2)
+    assert [game[0] for game in games] == ['game0', 'game1']
+    games, cursor = index.page(cursor, limit=2)
+    assert [game[0] for game in games] == ['game2', 'game3']
+    games, cursor = index.page(cursor, limit=2)
+    assert [game[0] for game in games] == ['game4']
+    assert cursor is None
+
+
+def test_owner_and_player_filters(index):
+    games, _ = index.page(owner='bob')
+    assert [game[0] for game in games] == ['game1', 'game3']
+    games, _ = index.page(player='alice')
+    assert [game[0] for game in games] == ['game0', 'game2', 'game4', 'game1']
+    games, cursor = index.page(player='alice', limit=3)
+    games, cursor = index.page(cursor, player='alice', limit=3)
+    assert [game[0] for game in games] == ['game1']
+    games, _ = index.page(owner='bob', player='alice')
+    assert games == [('game1', 'bob', 2)]
+    assert index.page(owner='nobody') == ([], None)
+
+
+def test_remove_game(index):
+    games, cursor = index.page(limit=2)
+    for idx in range(4):
+        index.remove_game(f'game{idx}')
+    games, cursor = index.page(cursor, limit=2)
+    assert [game[0] for game in games] == ['game4']
+    assert len(index) == 1
+    assert list(index) == [('game4', 2)]
+    assert index.page(owner='bob') == ([], None)
+    assert 'bob' not in index._by_owner
+
+
+def test_bad_cursor(index):
+    with pytest.raises(ValueError):
+        index.page('notacursor')
+
+
+if __name__ == '__main__':
+    pytest.main()
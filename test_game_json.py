@@ -0,0 +1,33 @@
+from enum import Enum
+import json
+import game_json
+from game_json import card_str, dumps
+
+
+class Suit(Enum):
+    SPADES = 'S'
+
+
+class IdentityCard(object):
+    def __init__(self, rank: str, suit: str):
+        self.rank = rank
+        self.suit = suit
+
+    def __str__(self) -> str:
+        return f'{self.rank}{self.suit}'
+
+
+def test_card_str_caches_values():
+    assert card_str(('A', 'S')) == "('A', 'S')"
+    assert ('A', 'S') in game_json._CARD_STRINGS
+    assert card_str(IdentityCard('A', 'S')) == 'AS'
+    assert (IdentityCard, (('rank', 'A'), ('suit', 'S'))) in game_json._CARD_STRINGS
+    assert card_str(IdentityCard('K', 'S')) == 'KS'
+    assert card_str(IdentityCard('A', 'S')) == 'AS'
+    assert card_str(IdentityCard('A', ['S'])) == "A['S']"  # unhashable attributes are not cached
+    assert card_str(['A', 'S']) == "['A', 'S']"
+
+
+def test_dumps():
+    content = {'player': 0, 'player_stack': ['AS', '10H'], 'winners': ['PLAYER'], 'suit': Suit.SPADES}
+    assert json.loads(dumps(content)) == dict(content, suit='S')
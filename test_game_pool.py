@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+from blackjack_db import AsyncBlackjackGameDB, Blackjack
+from game_pool import GamePool
+from user_db import UserDB
+
+
+@pytest.mark.asyncio
+async def test_take_from_pool():
+    pool = GamePool({(2, 1): 3})
+    assert pool.take(2, 1).num_players == 1
+    assert (pool.hits, pool.misses) == (0, 1)
+    await pool.refill()
+    assert pool.ready_count(2, 1) == 3
+    games = [pool.take(2, 1) for _ in range(3)]
+    assert len({id(game) for game in games}) == 3
+    assert (pool.hits, pool.misses) == (3, 1)
+    assert pool.take(6, 3).num_players == 3  # not pooled, built on demand
+    assert pool.misses == 2
+
+
+@pytest.mark.asyncio
+async def test_background_refill():
+    pool = GamePool.for_decks((1, 2), max_players=2, size=2)
+    pool.start()
+    for _ in range(50):
+        await asyncio.sleep(0)
+    assert all(pool.ready_count(decks, players) == 2 for decks in (1, 2) for players in (1, 2))
+    pool.take(1, 2)
+    for _ in range(10):
+        await asyncio.sleep(0)
+    assert pool.ready_count(1, 2) == 2
+    await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_add_game_uses_factory():
+    pool = GamePool({(2, 2): 1})
+    await pool.refill()
+    game_db = AsyncBlackjackGameDB(UserDB(), game_factory=pool.take)
+    game_uuid, _, _ = await game_db.add_game(2, 'owner')
+    the_game, _ = await game_db.get_game(game_uuid)
+    assert isinstance(the_game, Blackjack)
+    assert pool.hits == 1
@@ -0,0 +1,90 @@
+import time
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from blackjack_db import AsyncBlackjackGameDB, InMemoryGameStore
+from metrics import Metrics, MetricsMiddleware, TimedGameStore, SamplingProfiler
+from sqlite_store import SQLiteWriteBatcher, SQLiteGameStore
+from user_db import UserDB
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics()
+    with metrics.stage('game_logic'):
+        pass
+    metrics.observe('blackjack_request_seconds', (), 0.1)
+    assert metrics.render() == '\n'
+
+
+def test_render_histograms_and_gauges():
+    metrics = Metrics(enabled=True, buckets=(0.01, 0.1))
+    metrics.gauge('blackjack_users', 'User accounts.', lambda: 3)
+    for seconds in (0.005, 0.05, 0.5):
+        metrics.observe('blackjack_stage_seconds', (('stage', 'serialize'),), seconds)
+    lines = metrics.render().splitlines()
+    assert 'blackjack_users 3' in lines
+    assert '# TYPE blackjack_stage_seconds histogram' in lines
+    assert 'blackjack_stage_seconds_bucket{stage="serialize",le="0.01"} 1' in lines
+    assert 'blackjack_stage_seconds_bucket{stage="serialize",le="0.1"} 2' in lines
+    assert 'blackjack_stage_seconds_bucket{stage="serialize",le="+Inf"} 3' in lines
+    assert 'blackjack_stage_seconds_count{stage="serialize"} 3' in lines
+
+
+def test_middleware_labels_route_templates():
+    metrics = Metrics(enabled=True)
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+    @app.get('/game/{game_id}')
+    async def read_game(game_id: str):
+        return {'game_id': game_id}
+
+    client = TestClient(app)
+    client.get('/game/a')
+    client.get('/game/b')
+    client.get('/nowhere')
+    text = metrics.render()
+    assert 'blackjack_request_seconds_count{method="GET",route="/game/{game_id}",status="200"} 2' in text
+    assert 'blackjack_request_seconds_count{method="GET",route="unmatched",status="404"} 1' in text
+
+
+@pytest.mark.asyncio
+async def test_timed_game_store():
+    metrics = Metrics(enabled=True)
+    store = InMemoryGameStore()
+    game_db = AsyncBlackjackGameDB(UserDB(), TimedGameStore(store, metrics))
+    game_uuid, _, _ = await game_db.add_game(1, 'owner')
+    async with game_db.game_session(game_uuid) as (the_game, _):
+        the_game.initial_deal()
+    assert game_db._current_games is store.games
+    text = metrics.render()
+    for stage in ('store_get', 'store_put', 'store_lock'):
+        assert f'blackjack_stage_seconds_count{{stage="{stage}"}}' in text
+
+
+@pytest.mark.asyncio
+async def test_timed_shared_store(tmp_path):
+    # with metrics on, workers sharing a store must still list each other's games
+    state_path = str(tmp_path / 'state.db')
+    game_dbs = [AsyncBlackjackGameDB(UserDB(), TimedGameStore(SQLiteGameStore(SQLiteWriteBatcher(state_path),
+                                                                              shared=True), Metrics(enabled=True)))
+                for _ in range(2)]
+    assert game_dbs[0]._store.shared is True
+    game_uuid, _, _ = await game_dbs[0].add_game(2, 'owner')
+    await game_dbs[0].add_player(game_uuid, 'other')
+    assert await game_dbs[1].list_games_page() == ([(game_uuid, 'owner', 2)], None)
+    assert (await game_dbs[1].list_games_page(player='other'))[0] == [(game_uuid, 'owner', 2)]
+
+
+def busy_wait(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_sampling_profiler():
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    busy_wait(0.2)
+    profiler.stop()
+    assert 'busy_wait' in profiler.collapsed().splitlines()[0]
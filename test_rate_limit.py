@@ -0,0 +1,25 @@
+import pytest
+from rate_limit import TokenBucketLimiter
+
+
+def test_token_bucket(clock):
+    limiter = TokenBucketLimiter(rate=2.0, burst=3, clock=clock)
+    assert [limiter.acquire('user') for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire('user') == pytest.approx(0.5)
+    assert limiter.acquire('other') == 0.0
+    clock.now = 0.5
+    assert limiter.wait_time('user') == 0.0
+    assert limiter.acquire('user') == 0.0
+    assert limiter.acquire('user') == pytest.approx(0.5)
+    clock.now = 100.0
+    assert [limiter.acquire('user') for _ in range(4)][-1] > 0.0  # refills to burst, not beyond
+
+
+def test_limiter_memory_is_bounded(clock):
+    limiter = TokenBucketLimiter(rate=1.0, burst=1, max_keys=100, clock=clock)
+    limiter.acquire('hot')
+    for idx in range(1000):
+        limiter.acquire(f'sprayed{idx}')
+        limiter.wait_time('hot')
+    assert len(limiter) == 100
+    assert limiter.acquire('hot') > 0.0
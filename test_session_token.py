@@ -0,0 +1,45 @@
+import pytest
+from session_token import SessionTokenSigner
+
+
+@pytest.fixture
+def signer():
+    return SessionTokenSigner(ttl=60)
+
+
+def test_issue_and_verify(signer):
+    token, expires = signer.issue('jimbo')
+    assert signer.verify(token) == 'jimbo'
+
+
+def test_username_with_separator(signer):
+    token, _ = signer.issue('jim:bo')
+    assert signer.verify(token) == 'jim:bo'
+
+
+def test_tampered_token(signer):
+    token, _ = signer.issue('jimbo')
+    other_token, _ = signer.issue('mallory')
+    forged = other_token.split('.')[0] + '.' + token.split('.')[1]
+    assert signer.verify(forged) is None
+    assert signer.verify('garbage') is None
+    assert signer.verify('a.b.c') is None
+    assert signer.verify('!!!.???') is None
+
+
+def test_other_key(signer):
+    token, _ = signer.issue('jimbo')
+    assert SessionTokenSigner().verify(token) is None
+
+
+def test_expired_token():
+    now = [1000.0]
+    signer = SessionTokenSigner(ttl=60, clock=lambda: now[0])
+    token, expires = signer.issue('jimbo')
+    assert expires == 1060
+    now[0] = 1060.0
+    assert signer.verify(token) is None
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import math
+import re
+import numpy as np
+import pytest
+from blackjack_db import Blackjack
+from simulate import simulate, simulate_in_executor, _Hands, _outcomes, OUTCOMES, DEALER_STANDS_ON
+
+_FACE_VALUES = {'ACE': 11, 'A': 11, 'KING': 10, 'K': 10, 'QUEEN': 10, 'Q': 10, 'JACK': 10, 'J': 10}
+
+
+def card_value(card: str) -> int:
+    """
+    :param card: a card as get_stacks() shows it, e.g. '10H' or 'Ace of Spades'
+    :return: its value as simulate counts it, with the ace as 11
+    """
+    rank = re.match(r'\s*(ace|king|queen|jack|10|[2-9]|[AKQJ])', card, re.IGNORECASE).group(1).upper()
+    return int(rank) if rank.isdigit() else _FACE_VALUES[rank]
+
+
+def hand_of(cards: List[str]) -> _Hands:
+    hand = _Hands(1)
+    for card in cards:
+        hand.add(np.array([card_value(card)], dtype=np.int8))
+    return hand
+
+
+def test_hand_totals():
+    hands = _Hands(3)
+    # rounds of A A A, A 10 5 and 9 9 10
+    for cards in ([11, 11, 9], [11, 10, 9], [11, 5, 10]):
+        hands.add(np.array(cards, dtype=np.int8))
+    assert list(hands.total) == [13, 16, 28]
+    assert list(hands.soft_aces) == [1, 0, 0]
+
+
+def test_simulate_counts():
+    result = simulate(1000, num_players=3, num_decks=2, seed=5)
+    assert sum(result['outcomes'].values()) == 3000
+    assert result == simulate(1000, num_players=3, num_decks=2, seed=5, batch_size=300)
+    with pytest.raises(ValueError):
+        simulate(10, num_players=4, num_decks=1)
+
+
+@pytest.mark.asyncio
+async def test_simulate_in_executor():
+    with ThreadPoolExecutor(2) as executor:
+        result = await simulate_in_executor(executor, 1001, seed=3, rounds_per_task=200)
+        assert result == await simulate_in_executor(executor, 1001, seed=3, rounds_per_task=200)
+    assert sum(result['outcomes'].values()) == 1001
+
+
+def test_hand_parity_with_blackjack():
+    # the same cards through both: players draw by the _Hands total, then the dealer must stop
+    # on the card where _Hands reaches 17 and every hand must end as compute_winners() says
+    player_stands_on = [12, 17]
+    for _ in range(1000):
+        game = Blackjack(2, len(player_stands_on))
+        game.initial_deal()
+        for player_idx, stands_on in enumerate(player_stands_on):
+            while hand_of(game.get_stacks()[1][player_idx]).total[0] < stands_on:
+                game.player_draw(player_idx)
+        while game.dealer_draw() is False:
+            pass
+        dealer_cards, player_cards = game.get_stacks()
+        assert hand_of(dealer_cards).total[0] >= DEALER_STANDS_ON
+        assert len(dealer_cards) == 2 or hand_of(dealer_cards[:-1]).total[0] < DEALER_STANDS_ON, dealer_cards
+        dealer = hand_of(dealer_cards)
+        outcomes = [OUTCOMES[_outcomes(hand_of(cards), dealer)[0]] for cards in player_cards]
+        assert outcomes == game.compute_winners(), (dealer_cards, player_cards)
+
+
+def test_outcome_rates_match_blackjack():
+    # secondary to the hand by hand parity: whole rounds of both, compared statistically
+    num_rounds = 3000
+    scalar = dict.fromkeys(OUTCOMES, 0)
+    for _ in range(num_rounds):
+        game = Blackjack(2, 2)
+        game.initial_deal()
+        while game.dealer_draw() is False:
+            pass
+        for winner in game.compute_winners():
+            scalar[winner] += 1
+    vectorized = simulate(200000, num_players=2, num_decks=2, player_stands_on=0, seed=17)['outcomes']
+    for outcome in OUTCOMES:
+        expected = vectorized[outcome] / 400000
+        observed = scalar[outcome] / (2 * num_rounds)
+        assert abs(observed - expected) < 5 * math.sqrt(expected * (1 - expected) / num_rounds), outcome
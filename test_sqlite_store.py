@@ -0,0 +1,170 @@
+import pickle
+import sqlite3
+import pytest
+from blackjack_db import AsyncBlackjackGameDB, BlackjackGameInfo
+from sqlite_store import SQLiteWriteBatcher, SQLiteGameStore, SQLiteAccountStore, load_secret
+from user_db import UserDB
+
+TEST_USER = 'tester'
+
+
+@pytest.fixture
+def state_path(tmp_path):
+    return str(tmp_path / 'state.db')
+
+
+def test_accounts_persist(state_path):
+    batcher = SQLiteWriteBatcher(state_path)
+    user_db = UserDB(accounts=SQLiteAccountStore(batcher))
+    username, passtoken = user_db.create_user(TEST_USER)
+    batcher.close()
+    reopened = UserDB(accounts=SQLiteAccountStore(SQLiteWriteBatcher(state_path)))
+    assert reopened.is_valid(username, passtoken) is True
+
+
+def test_writes_are_batched(state_path):
+    batcher = SQLiteWriteBatcher(state_path, max_delay=0.5)
+    accounts = SQLiteAccountStore(batcher)
+    for idx in range(100):
+        accounts[f'user{idx}'] = b'hash'
+    accounts['user0'] = b'newhash'
+    batcher.flush()
+    assert batcher.batches_committed == 1
+    batcher.close()
+    reopened = SQLiteAccountStore(SQLiteWriteBatcher(state_path))
+    assert len(reopened) == 100
+    assert reopened['user0'] == b'newhash'
+
+
+def test_failed_batch_reaches_flush(state_path):
+    batcher = SQLiteWriteBatcher(state_path)
+    batcher.submit(('nowhere', 'x'), 'INSERT INTO nowhere VALUES (?)', ('x',))
+    with pytest.raises(sqlite3.OperationalError):
+        batcher.flush()
+    accounts = SQLiteAccountStore(batcher)
+    accounts[TEST_USER] = b'hash'
+    batcher.flush()
+    batcher.close()
+    assert SQLiteAccountStore(SQLiteWriteBatcher(state_path))[TEST_USER] == b'hash'
+
+
+@pytest.mark.asyncio
+async def test_games_persist(state_path):
+    batcher = SQLiteWriteBatcher(state_path)
+    user_db = UserDB(accounts=SQLiteAccountStore(batcher))
+    game_db = AsyncBlackjackGameDB(user_db, SQLiteGameStore(batcher))
+    game_uuid, _, _ = await game_db.add_game(2, TEST_USER)
+    deleted_uuid, deleted_pass, _ = await game_db.add_game(1, TEST_USER)
+    await game_db.add_player(game_uuid, 'other')
+    async with game_db.game_session(game_uuid) as (the_game, _):
+        the_game.initial_deal()
+    assert await game_db.del_game(deleted_uuid, deleted_pass, TEST_USER) is True
+    batcher.close()
+
+    reopened = AsyncBlackjackGameDB(user_db, SQLiteGameStore(SQLiteWriteBatcher(state_path)))
+    await reopened.load_existing_games()
+    assert len(await reopened.list_games()) == 1
+    reopened_game, reopened_info = await reopened.get_game(game_uuid)
+    assert reopened_info.players == [TEST_USER, 'other']
+    assert reopened_game.get_stacks() == the_game.get_stacks()
+
+
+@pytest.mark.asyncio
+async def test_shared_stores_see_each_other(state_path):
+    user_db_a = UserDB(accounts=SQLiteAccountStore(SQLiteWriteBatcher(state_path), shared=True))
+    user_db_b = UserDB(accounts=SQLiteAccountStore(SQLiteWriteBatcher(state_path), shared=True))
+    username, passtoken = user_db_a.create_user(TEST_USER)
+    assert user_db_b.is_valid(username, passtoken) is True
+
+    game_db_a = AsyncBlackjackGameDB(user_db_a, SQLiteGameStore(SQLiteWriteBatcher(state_path), shared=True))
+    game_db_b = AsyncBlackjackGameDB(user_db_b, SQLiteGameStore(SQLiteWriteBatcher(state_path), shared=True))
+    game_uuid, term_pass, _ = await game_db_a.add_game(2, TEST_USER)
+    assert await game_db_b.add_player(game_uuid, 'other') == 1
+    async with game_db_a.game_session(game_uuid) as (the_game, the_game_info):
+        assert the_game_info.players == [TEST_USER, 'other']
+        the_game.initial_deal()
+    the_game_b, _ = await game_db_b.get_game(game_uuid)
+    assert the_game_b.get_stacks() == the_game.get_stacks()
+    assert await game_db_b.del_game(game_uuid, term_pass, TEST_USER) is True
+    assert (await game_db_a.get_game(game_uuid))[0] is None
+
+
+def test_shared_create_does_not_overwrite(state_path):
+    accounts_a = SQLiteAccountStore(SQLiteWriteBatcher(state_path), shared=True)
+    accounts_b = SQLiteAccountStore(SQLiteWriteBatcher(state_path), shared=True)
+    accounts_a[TEST_USER] = b'first'
+    with pytest.raises(ValueError):
+        accounts_b[TEST_USER] = b'second'  # b had not seen the user, as when both create it at once
+    with pytest.raises(ValueError):
+        accounts_b.update({'fresh': b'hash', TEST_USER: b'second'})
+    assert 'fresh' not in accounts_a
+    assert accounts_b[TEST_USER] == b'first'
+    accounts_b[TEST_USER] = b'rehashed'
+    assert SQLiteAccountStore(SQLiteWriteBatcher(state_path))[TEST_USER] == b'rehashed'
+
+
+@pytest.mark.asyncio
+async def test_shared_async_accounts_do_not_block(state_path, monkeypatch):
+    user_db_a = UserDB(accounts=SQLiteAccountStore(SQLiteWriteBatcher(state_path), shared=True))
+    user_db_b = UserDB(accounts=SQLiteAccountStore(SQLiteWriteBatcher(state_path), shared=True))
+
+    def blocking(*args, **kwargs):
+        raise AssertionError('mapping method called from a coroutine')
+    for name in ('__getitem__', '__setitem__', '__contains__', 'get', 'update'):
+        monkeypatch.setattr(SQLiteAccountStore, name, blocking)
+    username, passtoken = await user_db_a.create_user_async(TEST_USER)
+    with pytest.raises(ValueError):
+        await user_db_b.create_user_async(TEST_USER)
+    with pytest.raises(ValueError):
+        await user_db_b.create_users_async(['fresh', TEST_USER])
+    created = await user_db_b.create_users_async(['fresh', 'other'])
+    assert await user_db_b.is_valid_async(username, passtoken) is True
+    assert await user_db_a.is_valid_async(*created[1]) is True
+    assert await user_db_a.is_valid_async('nobody', 'whatever') is False
+
+
+@pytest.mark.asyncio
+async def test_shared_stores_list_every_game(state_path):
+    user_db = UserDB()
+    game_db_a = AsyncBlackjackGameDB(user_db, SQLiteGameStore(SQLiteWriteBatcher(state_path), shared=True))
+    game_db_b = AsyncBlackjackGameDB(user_db, SQLiteGameStore(SQLiteWriteBatcher(state_path), shared=True))
+    first_uuid, first_pass, _ = await game_db_a.add_game(2, TEST_USER)
+    second_uuid, _, _ = await game_db_b.add_game(2, 'other')
+    await game_db_a.add_player(second_uuid, TEST_USER)
+    async with game_db_a.game_session(first_uuid) as (the_game, _):
+        the_game.initial_deal()  # updating a game keeps its place
+
+    games, cursor = await game_db_b.list_games_page(limit=1)
+    assert games == [(first_uuid, TEST_USER, 2)]
+    games, cursor = await game_db_a.list_games_page(cursor, limit=1)
+    assert games == [(second_uuid, 'other', 2)]
+    assert await game_db_b.list_games_page(cursor, limit=1) == ([], None)
+    assert (await game_db_b.list_games_page(player=TEST_USER))[0] == [(first_uuid, TEST_USER, 2),
+                                                                      (second_uuid, 'other', 2)]
+    assert (await game_db_b.list_games_page(owner='other'))[0] == [(second_uuid, 'other', 2)]
+
+    assert await game_db_b.del_game(first_uuid, first_pass, TEST_USER) is True
+    assert await game_db_a.list_games() == [(second_uuid, 2)]
+    assert (await game_db_a.get_game(first_uuid))[0] is None
+    assert game_db_a.live_game_count == 1  # the game removed by b is forgotten
+
+
+@pytest.mark.asyncio
+async def test_older_database_is_migrated(state_path):
+    old_conn = sqlite3.connect(state_path)
+    old_conn.execute('CREATE TABLE games (game_id TEXT PRIMARY KEY, game BLOB NOT NULL, info BLOB NOT NULL)')
+    old_info = BlackjackGameInfo(3, TEST_USER, [TEST_USER, 'p'], 'x')
+    with old_conn:
+        old_conn.execute('INSERT INTO games VALUES (?, ?, ?)', ('old', pickle.dumps(None), pickle.dumps(old_info)))
+    old_conn.close()
+    store = SQLiteGameStore(SQLiteWriteBatcher(state_path), shared=True)
+    assert await store.page(player='p') == ([('old', TEST_USER, 3)], None)
+
+
+def test_load_secret(state_path):
+    assert load_secret(state_path, 'key') == load_secret(state_path, 'key')
+    assert load_secret(state_path, 'key') != load_secret(state_path, 'other')
+
+
+if __name__ == '__main__':
+    pytest.main()
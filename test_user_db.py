@@ -1,5 +1,6 @@
 import pytest
-from user_db import UserDB
+import nacl.pwhash
+from user_db import UserDB, HASH_PROFILES
 
 
 @pytest.fixture
@@ -25,5 +26,72 @@ def test_check_login(empty_userdb):
         test_username, passtoken) is True
 
 
+@pytest.mark.asyncio
+async def test_check_login_async(empty_userdb):
+    test_username = 'asyncer'
+    username, passtoken = empty_userdb.create_user(test_username)
+    assert await empty_userdb.is_valid_async(
+        test_username, 'baddpasstoken') is False
+    assert await empty_userdb.is_valid_async(
+        test_username, passtoken) is True
+
+
+@pytest.mark.asyncio
+async def test_unknown_user_is_invalid(empty_userdb):
+    assert empty_userdb.is_valid('nobody', 'whatever') is False
+    assert await empty_userdb.is_valid_async('nobody', 'whatever') is False
+    assert empty_userdb._dummy_hash is not None
+    assert 'nobody' not in empty_userdb._accounts
+
+
+def test_rehash_on_login():
+    min_profile = (nacl.pwhash.argon2id.OPSLIMIT_MIN, nacl.pwhash.argon2id.MEMLIMIT_MIN)
+    old_userdb = UserDB(hash_profile=min_profile)
+    username, passtoken = old_userdb.create_user('oldie')
+    assert old_userdb.needs_rehash(old_userdb._accounts[username]) is False
+    new_userdb = UserDB(hash_profile='interactive')
+    new_userdb._accounts = old_userdb._accounts
+    old_hash = new_userdb._accounts[username]
+    assert new_userdb.needs_rehash(old_hash) is True
+    assert new_userdb.is_valid(username, 'baddpasstoken') is False
+    assert new_userdb._accounts[username] == old_hash
+    assert new_userdb.is_valid(username, passtoken) is True
+    assert new_userdb.needs_rehash(new_userdb._accounts[username]) is False
+    assert new_userdb.is_valid(username, passtoken) is True
+
+
+def test_create_users(empty_userdb):
+    created = empty_userdb.create_users(['a', 'b', 'c'])
+    assert [username for username, _ in created] == ['a', 'b', 'c']
+    for username, passtoken in created:
+        assert empty_userdb.is_valid(username, passtoken) is True
+
+
+def test_create_users_all_or_nothing(empty_userdb):
+    empty_userdb.create_user('taken')
+    with pytest.raises(ValueError):
+        empty_userdb.create_users(['fresh', 'taken'])
+    with pytest.raises(ValueError):
+        empty_userdb.create_users(['dup', 'dup'])
+    assert set(empty_userdb._accounts) == {'taken'}
+
+
+@pytest.mark.asyncio
+async def test_create_users_async(empty_userdb):
+    created = await empty_userdb.create_users_async(['a', 'b'])
+    assert len(created) == 2
+    assert await empty_userdb.is_valid_async(*created[1]) is True
+
+
+def test_hash_profiles():
+    assert set(HASH_PROFILES) == {'interactive', 'moderate', 'sensitive'}
+    argon2id = nacl.pwhash.argon2id
+    assert HASH_PROFILES == {'interactive': (argon2id.OPSLIMIT_INTERACTIVE, argon2id.MEMLIMIT_INTERACTIVE),
+                             'moderate': (argon2id.OPSLIMIT_MODERATE, argon2id.MEMLIMIT_MODERATE),
+                             'sensitive': (argon2id.OPSLIMIT_SENSITIVE, argon2id.MEMLIMIT_SENSITIVE)}
+    with pytest.raises(KeyError):
+        UserDB(hash_profile='bogus')
+
+
 if __name__ == '__main__':
     pytest.main()
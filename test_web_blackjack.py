@@ -1,7 +1,14 @@
+import subprocess
+import sys
+import time
 import pytest
+from base64 import b64encode
+from starlette.websockets import WebSocketDisconnect
 from fastapi.testclient import TestClient
 from requests.auth import HTTPBasicAuth
+import web_blackjack
 from web_blackjack import app
+from rate_limit import TokenBucketLimiter
 
 TEST_USER = 'testah'
 test_user_initialized = False
@@ -41,6 +48,35 @@ def base_user2(base_client):
     return test_user2_initialized
 
 
+def test_create_user_batch(base_client, base_user):
+    response = base_client.post('/user/create_batch', json=['batch1', 'batch2'])
+    assert response.status_code == 401
+    response = base_client.post('/user/create_batch', json=['batch1', 'batch2'], auth=base_user)
+    assert response.status_code == 201
+    resp = response.json()
+    assert [user['username'] for user in resp] == ['batch1', 'batch2']
+    assert all('password' in user for user in resp)
+    response = base_client.post('/user/create_batch', json=['batch3', 'batch1'], auth=base_user)
+    assert response.status_code == 409
+    too_many = [f'many{i}' for i in range(web_blackjack.MAX_BATCH_USERS + 1)]
+    response = base_client.post('/user/create_batch', json=too_many, auth=base_user)
+    assert response.status_code == 422
+
+
+def test_login(base_client, base_user):
+    response = base_client.post('/user/login', auth=base_user)
+    resp = response.json()
+    assert response.status_code == 200
+    assert resp['token_type'] == 'bearer'
+    headers = {'Authorization': f'Bearer {resp["access_token"]}'}
+    response = base_client.get('/game/create/1', headers=headers)
+    assert response.status_code == 201
+    response = base_client.get('/game/create/1', headers={'Authorization': 'Bearer forged.token'})
+    assert response.status_code == 401
+    response = base_client.get('/game/create/1')
+    assert response.status_code == 401
+
+
 def test_home(base_client):
     response = base_client.get('/')
     assert response.status_code == 200
@@ -70,6 +106,21 @@ def get_base_game(base_client, base_user, base_user2):
     return game_resp
 
 
+def test_list_games(get_base_game, base_user, base_client):
+    assert base_client.get('/games').status_code == 401
+    response = base_client.get(f'/games?owner={TEST_USER}&limit=1', auth=base_user)
+    resp = response.json()
+    assert response.status_code == 200
+    assert len(resp['games']) == 1
+    assert resp['games'][0]['owner'] == TEST_USER
+    seen = {resp['games'][0]['game_id']}
+    while resp['next_cursor'] is not None:
+        resp = base_client.get(f'/games?owner={TEST_USER}&cursor={resp["next_cursor"]}', auth=base_user).json()
+        seen.update(game['game_id'] for game in resp['games'])
+    assert get_base_game['game_id'] in seen
+    assert base_client.get('/games?cursor=bogus', auth=base_user).status_code == 400
+
+
 def test_add_player(get_base_game, base_user, base_user2, base_client):
     game_id = get_base_game['game_id']
     response = base_client.post(f'/game/{game_id}/add_player?username={TEST_USER2}', auth=base_user)
@@ -170,5 +221,123 @@ def test_delete_game(get_dealer_won_game, base_user, base_user2, get_base_game,
     assert resp_json['deleted_id'] == game_id
 
 
+def test_game_websocket(get_init_game, base_user, base_user2, base_client):
+    game_id = get_init_game['game_id']
+    with pytest.raises(WebSocketDisconnect):
+        with base_client.websocket_connect(f'/game/{game_id}/ws') as websocket:
+            websocket.receive_json()
+    headers = {'Authorization': 'Basic ' + b64encode(f'{base_user.username}:{base_user.password}'.encode()).decode()}
+    token = base_client.post('/user/login', auth=base_user2).json()['access_token']
+    with base_client.websocket_connect(f'/game/{game_id}/ws', headers=headers) as owner_ws, \
+            base_client.websocket_connect(f'/game/{game_id}/ws',
+                                          headers={'Authorization': f'Bearer {token}'}) as player_ws:
+        assert owner_ws.receive_json()['player_idx'] == 0
+        assert player_ws.receive_json()['player_idx'] == 1
+        owner_ws.send_json({'action': 'hit', 'player_idx': 1})
+        assert owner_ws.receive_json()['status_code'] == 401
+        owner_ws.send_json({'action': 'hit', 'player_idx': 0})
+        for websocket in (owner_ws, player_ws):
+            event = websocket.receive_json()
+            assert event['event'] == 'player_stack'
+            assert len(event['player_stack']) == 3
+        owner_ws.send_json({'action': 'dealer_play'})
+        for websocket in (owner_ws, player_ws):
+            assert websocket.receive_json()['event'] == 'dealer_stack'
+            assert websocket.receive_json()['winners'][0] in ['NONE', 'DEALER', 'PLAYER']
+
+
+def test_batch(get_init_game, base_user, base_client):
+    game_id = get_init_game['game_id']
+    response = base_client.post('/batch', auth=base_user, json=[
+        {'op': 'create', 'num_players': 1},
+        {'op': 'hit', 'game_id': game_id, 'player_idx': 0},
+        {'op': 'stack', 'game_id': game_id, 'player_idx': 0},
+        {'op': 'hit', 'game_id': game_id, 'player_idx': 1},
+        {'op': 'stack', 'game_id': game_id},
+        {'op': 'winners', 'game_id': 'nonexistent'},
+    ])
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert [result['status_code'] for result in results] == [200, 200, 200, 401, 422, 404]
+    assert 'termination_password' in results[0]['result']
+    assert results[2]['result']['player_stack'] == results[1]['result']['player_stack']
+    assert len(results[2]['result']['player_stack']) == 3
+    assert base_client.post('/batch', json=[{'op': 'winners', 'game_id': game_id}]).status_code == 401
+    assert base_client.post('/batch', auth=base_user, json=[{'op': 'shuffle'}]).status_code == 422
+
+
+def test_add_player_to_full_game(base_user, base_client):
+    game_id = base_client.get('/game/create/1', auth=base_user).json()['game_id']
+    response = base_client.post(f'/game/{game_id}/add_player?username={TEST_USER2}', auth=base_user)
+    assert response.status_code == 400
+    assert response.json()['detail'] == 'game is full'
+
+
+def test_batch_operation_failure(base_user, base_client, monkeypatch):
+    game_id = base_client.get('/game/create/1', auth=base_user).json()['game_id']
+
+    async def failing_hit(*args):
+        raise RuntimeError('injected failure')
+    monkeypatch.setattr(web_blackjack, 'hit_player', failing_hit)
+    response = base_client.post('/batch', auth=base_user, json=[
+        {'op': 'initialize', 'game_id': game_id},
+        {'op': 'hit', 'game_id': game_id, 'player_idx': 0},
+        {'op': 'stack', 'game_id': game_id, 'player_idx': 0},
+    ])
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert [result['status_code'] for result in results] == [200, 500, 200]
+    assert results[1]['detail'] == 'RuntimeError: injected failure'
+
+
+def test_simulate(base_user, base_client):
+    response = base_client.post('/simulate?rounds=2000&num_players=2&seed=1', auth=base_user)
+    assert response.status_code == 200
+    resp = response.json()
+    assert sum(resp['outcomes'].values()) == 4000
+    assert -1 <= resp['house_edge'] <= 1
+    assert base_client.post('/simulate?num_players=7&num_decks=1', auth=base_user).status_code == 422
+    assert base_client.post('/simulate').status_code == 401
+
+
+def test_metrics_off_by_default(base_client):
+    assert base_client.get('/metrics').status_code == 404
+
+
+def test_auth_rate_limit(base_client, monkeypatch, clock):
+    monkeypatch.setattr(web_blackjack, 'AUTH_USER_LIMITER', TokenBucketLimiter(1, 10, clock=clock))
+    monkeypatch.setattr(web_blackjack, 'AUTH_IP_LIMITER', TokenBucketLimiter(20, 200, clock=clock))
+    assert base_client.get('/game/create/1', auth=HTTPBasicAuth('nobody', 'guess')).status_code == 401
+    username = base_client.post('/user/create?username=limited').json()['username']
+    statuses = [base_client.get('/game/create/1', auth=HTTPBasicAuth(username, f'guess{attempt}')).status_code
+                for attempt in range(11)]
+    assert statuses == [401] * 10 + [429]  # the burst of 10, then none until the clock moves
+    response = base_client.get('/game/create/1', auth=HTTPBasicAuth(username, 'guess'))
+    assert response.headers['Retry-After'] == '1'
+    clock.now += 1
+    assert base_client.get('/game/create/1', auth=HTTPBasicAuth(username, 'guess')).status_code == 401
+    assert base_client.get('/game/create/1', auth=HTTPBasicAuth(username, 'guess')).status_code == 429
+
+
+def test_ready():
+    with TestClient(app) as client:
+        for _ in range(500):
+            response = client.get('/ready')
+            if response.status_code == 200:
+                break
+            time.sleep(0.01)
+        resp = response.json()
+        assert resp['ready'] is True
+        assert all(seconds is not None for seconds in resp['steps'].values())
+        assert resp['game_pool']['size'] > 0
+
+
+def test_import_defers_heavy_modules():
+    loaded = subprocess.run([sys.executable, '-c', 'import sys, web_blackjack; '
+                             'print(*(name for name in ("numpy", "nacl.pwhash", "blackjack.blackjack", "uvicorn") '
+                             'if name in sys.modules))'], check=True, capture_output=True, text=True).stdout
+    assert loaded.split() == []
+
+
 if __name__ == '__main__':
     pytest.main()
@@ -1,12 +1,91 @@
-from typing import Tuple, Dict
+from typing import Tuple, Optional, Union, List, Iterable, MutableMapping, Dict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from collections import Counter
+import asyncio
+import os
+import re
 import secrets
-import nacl.pwhash
-import nacl.exceptions
+
+
+# (opslimit, memlimit in bytes) for nacl.pwhash.argon2id, the values of its OPSLIMIT_* and MEMLIMIT_*
+# constants; written out so that nacl (and libsodium) is only loaded by the first hash or verify
+HASH_PROFILES: Dict[str, Tuple[int, int]] = {
+    'interactive': (2, 64 * 1024 * 1024),
+    'moderate': (3, 256 * 1024 * 1024),
+    'sensitive': (4, 1024 * 1024 * 1024),
+}
+_ARGON2_PARAMS = re.compile(rb'^\$(argon2id)\$v=\d+\$m=(\d+),t=(\d+),p=\d+\$')
+
+
+def _hash_password(password: bytes, opslimit: int, memlimit: int) -> bytes:
+    """
+    Hash a password with argon2id.  Module level so it can run in a ProcessPoolExecutor.
+
+    :param password: password in bytes
+    :param opslimit: argon2 operations limit
+    :param memlimit: argon2 memory limit in bytes
+    :return: the encoded hash, including its parameters
+    """
+    import nacl.pwhash
+    return nacl.pwhash.argon2id.str(password, opslimit=opslimit, memlimit=memlimit)
+
+
+def _verify_hash(stored_hash: bytes, password_attempt: bytes) -> bool:
+    """
+    Verify a password against a stored hash.  Kept at module level so that
+    it can be pickled and sent to a ProcessPoolExecutor.
+
+    :param stored_hash: the stored nacl.pwhash hash
+    :param password_attempt: attempted password in bytes
+    :return: True if the password matches, False if not.
+    """
+    import nacl.pwhash
+    import nacl.exceptions
+    try:
+        return nacl.pwhash.verify(stored_hash, password_attempt)
+    except nacl.exceptions.InvalidkeyError:
+        return False
 
 
 class UserDB(object):
-    def __init__(self):
-        self._accounts: Dict[str, bytes] = {}
+    def __init__(self, executor: Optional[Executor] = None, max_pending_verifies: int = 64,
+                 hash_profile: Union[str, Tuple[int, int]] = 'interactive',
+                 accounts: Optional[MutableMapping[str, bytes]] = None,
+                 create_executor: Optional[Executor] = None, create_workers: Optional[int] = None):
+        """
+        :param executor: thread or process pool that runs the password hashing work
+            for the async API; a ThreadPoolExecutor is created on first use if None
+        :param max_pending_verifies: maximum number of verifies queued on the executor
+            at once, further callers wait for a free slot
+        :param hash_profile: name of a profile in HASH_PROFILES, or explicit (opslimit, memlimit).
+            Stored hashes made with other parameters are rehashed on the next successful login.
+        :param accounts: mapping of username -> password hash to use as storage, e.g. a
+            sqlite_store.SQLiteAccountStore; an in-memory dict if None.  A store whose reads or
+            writes may block also provides the coroutines get_async(), set_async(), add_new_async()
+            and taken_async(), which the async API uses instead of the mapping methods
+        :param create_executor: pool that hashes the passwords of create_users(), kept apart from
+            executor so that verifies never wait behind a batch; started on first use if None
+        :param create_workers: number of threads of the pool started when create_executor is None,
+            one per CPU if None
+        """
+        self._accounts: MutableMapping[str, bytes] = accounts if accounts is not None else {}
+        if isinstance(hash_profile, str):
+            hash_profile = HASH_PROFILES[hash_profile]
+        self._opslimit, self._memlimit = hash_profile
+        self._executor = executor
+        self._create_executor = create_executor
+        self._create_workers = create_workers or os.cpu_count() or 1
+        self._max_pending_verifies = max_pending_verifies
+        self._verify_slots: Optional[asyncio.Semaphore] = None
+        # verified in place of an unknown user's hash, so that unknown users cost a full verify
+        self._dummy_hash: Optional[bytes] = None
+
+    @property
+    def user_count(self) -> int:
+        """
+        :return: number of user accounts
+        """
+        return len(self._accounts)
 
     def create_user(self, username: str) -> Tuple[str, str]:
         """
@@ -28,9 +107,119 @@ class UserDB(object):
         generated_token = secrets.token_urlsafe()
         if username in self._accounts:
             raise ValueError(f'username {username} already taken')
-        self._accounts[username] = nacl.pwhash.str(generated_token.encode())
+        self._accounts[username] = _hash_password(generated_token.encode(), self._opslimit, self._memlimit)
         return username, generated_token
 
+    async def create_user_async(self, username: str) -> Tuple[str, str]:
+        """
+        Same as create_user(), but hashes on the create executor and stores the account
+        without blocking the event loop.
+
+        :raises: ValueError if the username already exists
+        :param username: desired username
+        :return: (username, password_token)
+        """
+        created = await self.create_users_async([username])
+        return created[0]
+
+    async def _get_account_async(self, username: str) -> Optional[bytes]:
+        get_async = getattr(self._accounts, 'get_async', None)
+        if get_async is not None:
+            return await get_async(username)
+        return self._accounts.get(username)
+
+    async def _set_account_async(self, username: str, stored_hash: bytes):
+        set_async = getattr(self._accounts, 'set_async', None)
+        if set_async is not None:
+            await set_async(username, stored_hash)
+        else:
+            self._accounts[username] = stored_hash
+
+    async def _check_new_usernames_async(self, usernames: List[str]):
+        taken_async = getattr(self._accounts, 'taken_async', None)
+        if taken_async is None:
+            self._check_new_usernames(usernames)
+            return
+        taken = set(await taken_async(usernames))
+        taken.update(username for username, count in Counter(usernames).items() if count > 1)
+        if taken:
+            raise ValueError(f'usernames {", ".join(sorted(taken))} already taken or duplicated')
+
+    async def _add_accounts_async(self, accounts: Dict[str, bytes]):
+        add_new_async = getattr(self._accounts, 'add_new_async', None)
+        if add_new_async is not None:
+            await add_new_async(accounts)  # all or none, ValueError if any is taken
+            return
+        self._check_new_usernames(list(accounts))  # another request may have taken a name meanwhile
+        self._accounts.update(accounts)
+
+    def _ensure_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(thread_name_prefix='pwhash')
+        return self._executor
+
+    def _ensure_create_executor(self) -> Executor:
+        if self._create_executor is None:
+            self._create_executor = ThreadPoolExecutor(self._create_workers, thread_name_prefix='pwhash-create')
+        return self._create_executor
+
+    def _check_new_usernames(self, usernames: List[str]):
+        counts = Counter(usernames)
+        taken = sorted(username for username, count in counts.items()
+                       if count > 1 or username in self._accounts)
+        if taken:
+            raise ValueError(f'usernames {", ".join(taken)} already taken or duplicated')
+
+    def create_users(self, usernames: Iterable[str]) -> List[Tuple[str, str]]:
+        """
+        Creates many users at once, hashing their generated tokens in parallel on the create executor.
+        Either every user is created or, if any username is taken or repeated, none are.
+
+        :raises: ValueError if any username already exists or appears twice
+        :param usernames: desired usernames
+        :return: list of (username, password_token) in the same order
+        """
+        usernames = list(usernames)
+        self._check_new_usernames(usernames)
+        tokens = [secrets.token_urlsafe() for _ in usernames]
+        hashes = list(self._ensure_create_executor().map(
+            _hash_password, [token.encode() for token in tokens],
+            [self._opslimit] * len(tokens), [self._memlimit] * len(tokens)))
+        self._check_new_usernames(usernames)
+        self._accounts.update(zip(usernames, hashes))
+        return list(zip(usernames, tokens))
+
+    async def create_users_async(self, usernames: Iterable[str]) -> List[Tuple[str, str]]:
+        """
+        Same as create_users(), but awaits the parallel hashing instead of blocking the event loop.
+
+        :raises: ValueError if any username already exists or appears twice
+        :param usernames: desired usernames
+        :return: list of (username, password_token) in the same order
+        """
+        usernames = list(usernames)
+        await self._check_new_usernames_async(usernames)
+        tokens = [secrets.token_urlsafe() for _ in usernames]
+        loop = asyncio.get_running_loop()
+        executor = self._ensure_create_executor()
+        hashes = await asyncio.gather(*[
+            loop.run_in_executor(executor, _hash_password, token.encode(), self._opslimit, self._memlimit)
+            for token in tokens])
+        await self._add_accounts_async(dict(zip(usernames, hashes)))
+        return list(zip(usernames, tokens))
+
+    def needs_rehash(self, stored_hash: bytes) -> bool:
+        """
+        Check whether a stored hash was made with parameters other than this UserDB's profile.
+
+        :param stored_hash: the stored nacl.pwhash hash
+        :return: True if the hash should be replaced, False if it matches the current profile.
+        """
+        params = _ARGON2_PARAMS.match(stored_hash)
+        if params is None:
+            return True
+        return int(params.group(3)) != self._opslimit or int(params.group(2)) * 1024 != self._memlimit
+
     def is_valid(self, username: str, password_attempt: str) -> bool:
         """
         Check whether the given username and password match a user
@@ -39,11 +228,50 @@ class UserDB(object):
 
         See what you can call in nacl.pwhash to verify an input password.
 
+        An unknown username costs the same verify as a known one, against a dummy hash,
+        so response times do not tell which usernames exist.
+
         :param username: username of the user
         :param password_attempt: attempted password
         :return: True if the credentials are valid, False if not.
         """
-        try:
-            return nacl.pwhash.verify(self._accounts[username], password_attempt.encode())
-        except nacl.exceptions.InvalidkeyError:
+        stored_hash = self._accounts.get(username)
+        if stored_hash is None:
+            if self._dummy_hash is None:
+                self._dummy_hash = _hash_password(secrets.token_bytes(16), self._opslimit, self._memlimit)
+            _verify_hash(self._dummy_hash, password_attempt.encode())
+            return False
+        if not _verify_hash(stored_hash, password_attempt.encode()):
             return False
+        if self.needs_rehash(stored_hash):
+            self._accounts[username] = _hash_password(password_attempt.encode(), self._opslimit, self._memlimit)
+        return True
+
+    async def is_valid_async(self, username: str, password_attempt: str) -> bool:
+        """
+        Same check as is_valid(), but the hash comparison runs on the executor
+        so that the event loop keeps serving other requests during the verify.
+        At most max_pending_verifies calls are in flight on the executor.
+
+        :param username: username of the user
+        :param password_attempt: attempted password
+        :return: True if the credentials are valid, False if not.
+        """
+        stored_hash = await self._get_account_async(username)
+        self._ensure_executor()
+        if self._verify_slots is None:
+            self._verify_slots = asyncio.Semaphore(self._max_pending_verifies)
+        loop = asyncio.get_running_loop()
+        async with self._verify_slots:
+            if stored_hash is None:
+                if self._dummy_hash is None:
+                    self._dummy_hash = await loop.run_in_executor(
+                        self._executor, _hash_password, secrets.token_bytes(16), self._opslimit, self._memlimit)
+                await loop.run_in_executor(self._executor, _verify_hash, self._dummy_hash, password_attempt.encode())
+                return False
+            if not await loop.run_in_executor(self._executor, _verify_hash, stored_hash, password_attempt.encode()):
+                return False
+            if self.needs_rehash(stored_hash):
+                await self._set_account_async(username, await loop.run_in_executor(
+                    self._executor, _hash_password, password_attempt.encode(), self._opslimit, self._memlimit))
+        return True
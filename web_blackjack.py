@@ -1,21 +1,174 @@
-import uvicorn
-from typing import Optional, Tuple
-from fastapi import FastAPI, HTTPException, Path, status, Query, Depends
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from blackjack_db import AsyncBlackjackGameDB, Blackjack, BlackjackGameInfo
+import asyncio
+import base64
+import importlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+import time
+from typing import Optional, Tuple, List, Iterator, AsyncIterator, Dict, Any, Literal, Union, TYPE_CHECKING
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, Field
+from fastapi import (FastAPI, APIRouter, HTTPException, Path, status, Query, Depends, Body, WebSocket,
+                     WebSocketDisconnect, Request)
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from fastapi.security import HTTPBasic, HTTPBasicCredentials, HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.security.utils import get_authorization_scheme_param
+from blackjack_db import AsyncBlackjackGameDB, BlackjackGameInfo, InMemoryGameStore
 from user_db import UserDB
+from credential_cache import CredentialCache
+from session_token import SessionTokenSigner
+from game_channels import GameChannels
+from game_json import GameJSONResponse, card_str
+from metrics import METRICS, MetricsMiddleware, TimedGameStore, SamplingProfiler
+from rate_limit import TokenBucketLimiter
+from game_pool import GamePool
+
+if TYPE_CHECKING:
+    from blackjack.blackjack import Blackjack
+
+logger = logging.getLogger(__name__)
+
+# set BLACKJACK_STATE_PATH to a SQLite file to keep users and games across restarts,
+# and also BLACKJACK_SHARED_STATE=1 to share them between several worker processes
+STATE_PATH = os.environ.get('BLACKJACK_STATE_PATH')
+SHARED_STATE = os.environ.get('BLACKJACK_SHARED_STATE', '0') == '1'
+# or set BLACKJACK_EVENT_LOG_DIR to a directory to log every change there and replay it on
+# startup instead (one worker process only)
+EVENT_LOG_DIR = os.environ.get('BLACKJACK_EVENT_LOG_DIR')
+# games idle for this many seconds are removed, and at most this many games are kept
+GAME_IDLE_TTL = float(os.environ.get('BLACKJACK_GAME_IDLE_TTL', 3600))
+MAX_GAMES = int(os.environ.get('BLACKJACK_MAX_GAMES', 100000))
+# games kept shuffled and ready for each common deck count and table size, 0 to build every game on demand
+GAME_POOL_SIZE = int(os.environ.get('BLACKJACK_GAME_POOL_SIZE', 32))
+GAME_POOL = GamePool.for_decks((1, 2, 6, 8), max_players=4, size=GAME_POOL_SIZE)
+SIMULATION_WORKERS = int(os.environ.get('BLACKJACK_SIMULATION_WORKERS', os.cpu_count() or 1))
+# threads hashing the passwords of POST /user/create_batch, and the most usernames it accepts per call
+CREATE_WORKERS = int(os.environ.get('BLACKJACK_CREATE_WORKERS', os.cpu_count() or 1))
+MAX_BATCH_USERS = int(os.environ.get('BLACKJACK_MAX_BATCH_USERS', 10000))
+# set BLACKJACK_METRICS=1 to record latencies for GET /metrics, and BLACKJACK_PROFILE to a file
+# to sample the event loop's stacks while the server runs and write them there on shutdown
+METRICS.enabled = os.environ.get('BLACKJACK_METRICS', '0') == '1'
+PROFILE_PATH = os.environ.get('BLACKJACK_PROFILE')
+PROFILER: Optional[SamplingProfiler] = None
+# password verifies allowed per second for each username and for each client IP, in bursts of up to 10 s worth
+AUTH_RATE_PER_USER = float(os.environ.get('BLACKJACK_AUTH_RATE_PER_USER', 1))
+AUTH_RATE_PER_IP = float(os.environ.get('BLACKJACK_AUTH_RATE_PER_IP', 20))
+CREDENTIAL_CACHE = CredentialCache()
+AUTH_USER_LIMITER = TokenBucketLimiter(AUTH_RATE_PER_USER, 10 * AUTH_RATE_PER_USER)
+AUTH_IP_LIMITER = TokenBucketLimiter(AUTH_RATE_PER_IP, 10 * AUTH_RATE_PER_IP)
+GAME_CHANNELS = GameChannels()
+SIMULATION_POOL: Optional[ProcessPoolExecutor] = None  # started on the first POST /simulate
+# built by open_stores() when the app warms up, see warm_up()
+STATE_WRITER = None
+EVENT_LOG = None
+USER_DB: Optional[UserDB] = None
+GAME_STORE = None
+BLACKJACK_DB: Optional[AsyncBlackjackGameDB] = None
+SESSION_TOKENS: Optional[SessionTokenSigner] = None
+WARM_UP_STEPS = ('open_stores', 'load_games', 'preload_modules')
+# needed by the first requests but not imported by this module, to keep its import short
+PRELOADED_MODULES = ('nacl.pwhash', 'blackjack.blackjack')
+WARM_UP_SECONDS: Dict[str, float] = {}  # seconds taken by each finished step
+WARM_UP: Optional['asyncio.Task[None]'] = None
+if METRICS.enabled:
+    METRICS.gauge('blackjack_live_games', 'Games in this worker.', lambda: BLACKJACK_DB.live_game_count)
+    METRICS.gauge('blackjack_users', 'User accounts.', lambda: USER_DB.user_count)
+    METRICS.gauge('blackjack_credential_cache_entries', 'Credentials in the cache.', lambda: len(CREDENTIAL_CACHE))
+    METRICS.gauge('blackjack_credential_cache_hits_total', 'Credentials answered from the cache.',
+                  lambda: CREDENTIAL_CACHE.hits, 'counter')
+    METRICS.gauge('blackjack_credential_cache_misses_total', 'Credentials verified by hashing.',
+                  lambda: CREDENTIAL_CACHE.misses, 'counter')
+security = HTTPBasic()
+optional_basic = HTTPBasic(auto_error=False)
+optional_bearer = HTTPBearer(auto_error=False)
 
 
-USER_DB = UserDB()
-BLACKJACK_DB = AsyncBlackjackGameDB(USER_DB)
-app = FastAPI(
-    title="Blackjack Server",
-    description="Implementation of a simultaneous multi-game Blackjack server by[Your name here]."
-)
-security = HTTPBasic()
+def open_stores():
+    """
+    Build USER_DB and BLACKJACK_DB with the configured backend, loading the saved users and games.
+    Blocking, so warm_up() runs it in a thread.
+    """
+    global STATE_WRITER, EVENT_LOG, USER_DB, GAME_STORE, BLACKJACK_DB, SESSION_TOKENS
+    if STATE_PATH:
+        from sqlite_store import SQLiteWriteBatcher, SQLiteGameStore, SQLiteAccountStore, load_secret
+        STATE_WRITER = SQLiteWriteBatcher(STATE_PATH)
+        USER_DB = UserDB(accounts=SQLiteAccountStore(STATE_WRITER, shared=SHARED_STATE), create_workers=CREATE_WORKERS)
+        # activity is tracked per worker, so shared state is never reaped or capped
+        GAME_STORE = SQLiteGameStore(STATE_WRITER, shared=SHARED_STATE)
+        BLACKJACK_DB = AsyncBlackjackGameDB(USER_DB, TimedGameStore(GAME_STORE) if METRICS.enabled else GAME_STORE,
+                                            idle_ttl=None if SHARED_STATE else GAME_IDLE_TTL,
+                                            max_games=None if SHARED_STATE else MAX_GAMES,
+                                            game_factory=GAME_POOL.take)
+        SESSION_TOKENS = SessionTokenSigner(key=load_secret(STATE_PATH, 'session_token'))
+    elif EVENT_LOG_DIR:
+        from event_log import EventLog
+        recovered = EventLog.recover(EVENT_LOG_DIR)
+        EVENT_LOG = EventLog(EVENT_LOG_DIR)
+        USER_DB = UserDB(accounts=EVENT_LOG.accounts(recovered['accounts']), create_workers=CREATE_WORKERS)
+        GAME_STORE = InMemoryGameStore()
+        for game_id, (the_game, the_game_info) in recovered['games'].items():
+            GAME_STORE.games[game_id] = the_game
+            GAME_STORE.games_info[game_id] = the_game_info
+        BLACKJACK_DB = AsyncBlackjackGameDB(USER_DB, TimedGameStore(GAME_STORE) if METRICS.enabled else GAME_STORE,
+                                            idle_ttl=GAME_IDLE_TTL, max_games=MAX_GAMES, game_factory=GAME_POOL.take,
+                                            journal=EVENT_LOG)
+        SESSION_TOKENS = SessionTokenSigner()
+    else:
+        USER_DB = UserDB(create_workers=CREATE_WORKERS)
+        GAME_STORE = InMemoryGameStore()
+        BLACKJACK_DB = AsyncBlackjackGameDB(USER_DB, TimedGameStore(GAME_STORE) if METRICS.enabled else GAME_STORE,
+                                            idle_ttl=GAME_IDLE_TTL, max_games=MAX_GAMES, game_factory=GAME_POOL.take)
+        SESSION_TOKENS = SessionTokenSigner()
+
 
+async def warm_up(start_background_tasks: bool = False):
+    """
+    Run the WARM_UP_STEPS, recording how long each took in WARM_UP_SECONDS for GET /ready.
 
-async def get_game(game_id: str) -> Tuple[Blackjack, BlackjackGameInfo]:
+    :param start_background_tasks: also start the reaper, the game pool's refills and the event
+        log's flushes, which must run on the server's event loop
+    """
+    step_start = time.perf_counter()
+    await asyncio.to_thread(open_stores)
+    WARM_UP_SECONDS['open_stores'] = time.perf_counter() - step_start
+    step_start = time.perf_counter()
+    await BLACKJACK_DB.load_existing_games()
+    WARM_UP_SECONDS['load_games'] = time.perf_counter() - step_start
+    step_start = time.perf_counter()
+    for module_name in PRELOADED_MODULES:
+        await asyncio.to_thread(importlib.import_module, module_name)
+    WARM_UP_SECONDS['preload_modules'] = time.perf_counter() - step_start
+    if start_background_tasks:
+        await BLACKJACK_DB.start_reaper()
+        GAME_POOL.start()
+        if EVENT_LOG is not None:
+            EVENT_LOG.start()
+
+
+async def stores_ready():
+    """
+    Dependency of every route that uses the stores: waits until warm_up() is done.  If the app
+    was started without its lifespan (e.g. driven through an ASGI transport), the first
+    request starts the warm-up.
+    """
+    global WARM_UP
+    if WARM_UP is None:
+        WARM_UP = asyncio.create_task(warm_up())
+    if not WARM_UP.done():
+        await asyncio.shield(WARM_UP)
+    WARM_UP.result()  # raises the warm-up's error, if it failed
+
+
+# probes answer while the app warms up, every other route waits for the stores
+probes = APIRouter()
+router = APIRouter(dependencies=[Depends(stores_ready)])
+
+
+async def get_game(game_id: str) -> Tuple['Blackjack', BlackjackGameInfo]:
     """
     Get a game from the blackjack game database, otherwise raise a 404.
 
@@ -28,146 +181,595 @@ async def get_game(game_id: str) -> Tuple[Blackjack, BlackjackGameInfo]:
     return the_game, the_game_info
 
 
-async def check_user(username: str, password: str) -> bool:
+def client_ip(connection: Union[Request, WebSocket]) -> str:
+    """
+    :param connection: the request or WebSocket
+    :return: the client's IP address, or 'unknown' if the server does not know it
+    """
+    return connection.client.host if connection.client is not None else 'unknown'
+
+
+async def check_user(username: str, password: str, ip: str = 'unknown') -> bool:
     """
     Check if a user is valid, otherwise raise the HTTPException 401 Unauthorized.
+    Recently verified credentials are answered from CREDENTIAL_CACHE without hashing.
+    Other attempts spend a token of the username's and of the client IP's rate limits
+    before hashing, and get a 429 Too Many Requests when either is used up.
 
     :param username: the attempted username
     :param password: the attempted password
+    :param ip: the client's IP address
     :return: True if valid, otherwise raises exception
     """
-    if USER_DB.is_valid(username, password):
+    if CREDENTIAL_CACHE.is_cached(username, password):
+        return True
+    retry_after = max(AUTH_USER_LIMITER.wait_time(username), AUTH_IP_LIMITER.wait_time(ip))
+    if retry_after > 0:
+        raise HTTPException(status.HTTP_429_TOO_MANY_REQUESTS, "too many authentication attempts",
+                            headers={'Retry-After': str(math.ceil(retry_after))})
+    AUTH_USER_LIMITER.acquire(username)
+    AUTH_IP_LIMITER.acquire(ip)
+    with METRICS.stage('password_verify'):
+        valid = await USER_DB.is_valid_async(username, password)
+    if valid:
+        CREDENTIAL_CACHE.add(username, password)
         return True
     else:
         raise HTTPException(status.HTTP_401_UNAUTHORIZED, "user not found with those credentials")
 
 
-@app.get('/')
+async def authenticated_user(request: Request,
+                             basic: Optional[HTTPBasicCredentials] = Depends(optional_basic),
+                             bearer: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer)) -> str:
+    """
+    Dependency that authenticates a request with either a bearer token from /user/login
+    or HTTP Basic credentials, otherwise raise the HTTPException 401 Unauthorized.
+
+    :param request: the request
+    :param basic: HTTP Basic credentials, if sent
+    :param bearer: bearer token, if sent
+    :return: the authenticated username
+    """
+    return await authenticate(client_ip(request), basic, bearer)
+
+
+async def authenticate(ip: str, basic: Optional[HTTPBasicCredentials],
+                       bearer: Optional[HTTPAuthorizationCredentials]) -> str:
+    """
+    Body of authenticated_user(), for callers that are not FastAPI dependencies.
+
+    :param ip: the client's IP address
+    :return: the authenticated username
+    """
+    if bearer is not None:
+        username = SESSION_TOKENS.verify(bearer.credentials)
+        if username is None:
+            raise HTTPException(status.HTTP_401_UNAUTHORIZED, "invalid or expired token",
+                                headers={'WWW-Authenticate': 'Bearer'})
+        return username
+    if basic is not None:
+        await check_user(basic.username, basic.password, ip)
+        return basic.username
+    raise HTTPException(status.HTTP_401_UNAUTHORIZED, "not authenticated",
+                        headers={'WWW-Authenticate': 'Basic'})
+
+
+async def authenticated_header(authorization: Optional[str], ip: str) -> str:
+    """
+    Same as authenticated_user(), for a raw Authorization header (e.g. a WebSocket handshake).
+
+    :param authorization: value of the Authorization header, if sent
+    :param ip: the client's IP address
+    :return: the authenticated username
+    """
+    scheme, credentials = get_authorization_scheme_param(authorization)
+    if scheme.lower() == 'bearer':
+        return await authenticate(ip, None, HTTPAuthorizationCredentials(scheme=scheme, credentials=credentials))
+    if scheme.lower() == 'basic':
+        try:
+            username, _, password = base64.b64decode(credentials).decode().partition(':')
+        except (ValueError, UnicodeDecodeError):
+            raise HTTPException(status.HTTP_401_UNAUTHORIZED, "invalid authentication credentials")
+        return await authenticate(ip, HTTPBasicCredentials(username=username, password=password), None)
+    return await authenticate(ip, None, None)
+
+
+async def initialize_game(game_id: str, auth_user: str) -> Dict[str, Any]:
+    """
+    Deal the initial hands of a game as its owner, and push the stacks to the game's channel.
+
+    :param game_id: the UUID of the game
+    :param auth_user: the authenticated username
+    :return: the init_game() response
+    """
+    async with BLACKJACK_DB.game_session(game_id) as (the_game, the_game_info):
+        if the_game_info.owner != auth_user:
+            raise HTTPException(status.HTTP_401_UNAUTHORIZED, "not owner of game")
+        with METRICS.stage('game_logic'):
+            the_game.initial_deal()
+            dealer_stack, player_stacks = the_game.get_stacks()
+        GAME_CHANNELS.publish(game_id, {'event': 'initialized', 'dealer_stack': dealer_stack,
+                                        'player_stacks': player_stacks})
+        return {'success': True, 'dealer_stack': dealer_stack, 'player_stacks': player_stacks}
+
+
+async def hit_player(game_id: str, player_idx: int, auth_user: str) -> Dict[str, Any]:
+    """
+    Hit for a player of a game as that player, and push the new stack to the game's channel.
+
+    :param game_id: the UUID of the game
+    :param player_idx: the player index (zero-indexed)
+    :param auth_user: the authenticated username
+    :return: the player_hit() response
+    """
+    async with BLACKJACK_DB.game_session(game_id) as (the_game, the_game_info):
+        if auth_user != the_game_info.player_at(player_idx):
+            raise HTTPException(status.HTTP_401_UNAUTHORIZED, f"not player at index {player_idx}")
+        with METRICS.stage('game_logic'):
+            drawn_card = the_game.player_draw(player_idx)
+    with METRICS.stage('game_logic'):
+        response = {'player': player_idx,
+                    'drawn_card': card_str(drawn_card),
+                    'player_stack': BLACKJACK_DB.player_stack(game_id, the_game, the_game_info, player_idx)}
+    GAME_CHANNELS.publish(game_id, dict(response, event='player_stack'))
+    return response
+
+
+async def play_dealer(game_id: str, auth_user: str) -> Dict[str, Any]:
+    """
+    Play the dealer of a game as its owner, and push the dealer's stack and the winners
+    to the game's channel.
+
+    :param game_id: the UUID of the game
+    :param auth_user: the authenticated username
+    :return: the dealer_play() response
+    """
+    async with BLACKJACK_DB.game_session(game_id) as (the_game, the_game_info):
+        if the_game_info.owner != auth_user:
+            raise HTTPException(status.HTTP_401_UNAUTHORIZED, "not owner of game")
+        with METRICS.stage('game_logic'):
+            dealer_stop = the_game.dealer_draw()
+            while dealer_stop is False:
+                dealer_stop = the_game.dealer_draw()
+    with METRICS.stage('game_logic'):
+        response = {'player': 'dealer',
+                    'player_stack': BLACKJACK_DB.stacks(game_id, the_game, the_game_info)[0]}
+    GAME_CHANNELS.publish(game_id, dict(response, event='dealer_stack'))
+    if GAME_CHANNELS.subscriber_count(game_id):
+        GAME_CHANNELS.publish(game_id, {'event': 'winners',
+                                        'winners': BLACKJACK_DB.winners(game_id, the_game, the_game_info)})
+    return response
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Start warming up in the background, so that the server accepts connections (and answers
+    GET /ready) while saved state loads, and close everything on shutdown.
+    """
+    global WARM_UP, PROFILER
+    if WARM_UP is None:
+        WARM_UP = asyncio.create_task(warm_up(start_background_tasks=True))
+    if PROFILE_PATH:
+        PROFILER = SamplingProfiler()
+        PROFILER.start()
+    yield
+    await close_state()
+
+
+async def close_state():
+    if WARM_UP is not None and not WARM_UP.done():
+        WARM_UP.cancel()
+        await asyncio.gather(WARM_UP, return_exceptions=True)
+    if BLACKJACK_DB is not None:
+        await BLACKJACK_DB.stop_reaper()
+    await GAME_POOL.stop()
+    if STATE_WRITER is not None:
+        await asyncio.to_thread(STATE_WRITER.close)
+    if EVENT_LOG is not None:
+        await EVENT_LOG.close()
+    if SIMULATION_POOL is not None:
+        await asyncio.to_thread(SIMULATION_POOL.shutdown, cancel_futures=True)
+    if PROFILER is not None:
+        PROFILER.stop()
+        with open(PROFILE_PATH, 'w') as profile_file:
+            profile_file.write(PROFILER.collapsed())
+
+
+@probes.get('/')
 async def home():
     return {"message": "Welcome to Blackjack!"}
 
 
-@app.get('/game/create/{num_players}', status_code=status.HTTP_201_CREATED)
+@probes.get('/ready')
+async def readiness():
+    """
+    Readiness probe: 200 once the saved users and games are loaded, 503 before.
+    Either way the body reports the warm-up's progress.
+    """
+    pool_ready, pool_size = GAME_POOL.fill_level()
+    progress = {'ready': False, 'steps': {step: WARM_UP_SECONDS.get(step) for step in WARM_UP_STEPS},
+                'game_pool': {'ready': pool_ready, 'size': pool_size}}
+    if WARM_UP is not None and WARM_UP.done() and not WARM_UP.cancelled():
+        if WARM_UP.exception() is not None:
+            progress['error'] = repr(WARM_UP.exception())
+        else:
+            progress['ready'] = True
+    return JSONResponse(progress, status_code=status.HTTP_200_OK if progress['ready'] else
+                        status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@router.get('/stats')
+async def stats():
+    return {'live_games': BLACKJACK_DB.live_game_count,
+            'live_games_approx_bytes': await BLACKJACK_DB.approx_bytes(),
+            'credential_cache_hits': CREDENTIAL_CACHE.hits,
+            'credential_cache_misses': CREDENTIAL_CACHE.misses,
+            'game_pool_hits': GAME_POOL.hits,
+            'game_pool_misses': GAME_POOL.misses}
+
+
+def stream_games_page(games: List[Tuple[str, str, int]], next_cursor: Optional[str]) -> Iterator[str]:
+    """
+    Serialize a page of games as a JSON object, one game at a time.
+
+    :param games: (game_id, owner, num_players) of each game in the page
+    :param next_cursor: cursor of the next page, or None if this is the last
+    :return: chunks of the JSON object
+    """
+    yield '{"games":['
+    for idx, (game_id, owner, num_players) in enumerate(games):
+        yield (',' if idx else '') + json.dumps({'game_id': game_id, 'owner': owner, 'num_players': num_players})
+    yield '],"next_cursor":' + json.dumps(next_cursor) + '}'
+
+
+@router.get('/metrics', response_class=PlainTextResponse)
+async def get_metrics():
+    if not METRICS.enabled:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "metrics are off, set BLACKJACK_METRICS=1")
+    return PlainTextResponse(METRICS.render(), media_type='text/plain; version=0.0.4')
+
+
+@router.get('/games')
+async def list_games(owner: Optional[str] = Query(None, description='only games owned by this user'),
+                     player: Optional[str] = Query(None, description='only games this user plays in'),
+                     cursor: Optional[str] = Query(None, description='next_cursor of the previous page'),
+                     limit: int = Query(100, gt=0, le=1000, description='maximum games per page'),
+                     auth_user: str = Depends(authenticated_user)):
+    games, next_cursor = await BLACKJACK_DB.list_games_page(cursor, limit, owner=owner, player=player)
+    return StreamingResponse(stream_games_page(games, next_cursor), media_type='application/json')
+
+
+@router.get('/game/create/{num_players}', status_code=status.HTTP_201_CREATED)
 async def create_game(num_players: int = Path(..., gt=0, description='the number of players'),
                       num_decks: Optional[int] = Query(2, description='the number of decks to use'),
-                      credentials: HTTPBasicCredentials = Depends(security)):
-    await check_user(credentials.username, credentials.password)
+                      auth_user: str = Depends(authenticated_user)):
     new_uuid, new_term_pass, game_owner = await BLACKJACK_DB.add_game(num_players=num_players,
-                                                                      owner=credentials.username,
+                                                                      owner=auth_user,
                                                                       num_decks=num_decks)
     return {'success': True, 'game_id': new_uuid, 'termination_password': new_term_pass}
 
 
-@app.post('/user/create', status_code=status.HTTP_201_CREATED)
+@router.post('/user/create', status_code=status.HTTP_201_CREATED)
 async def create_user(username: str = Query(..., description='the number of decks to use')):
     try:
-        username, password = USER_DB.create_user(username)
+        username, password = await USER_DB.create_user_async(username)
         return {'success': True, 'username': username, 'password': password}
     except ValueError:
         raise HTTPException(status.HTTP_409_CONFLICT, f"username {username} already taken")
 
 
-@app.post('/game/{game_id}/initialize')
+def stream_created_users(created: List[Tuple[str, str]]) -> Iterator[str]:
+    """
+    Serialize (username, password) pairs as a JSON array, one element at a time.
+
+    :param created: the created users and their passwords
+    :return: chunks of the JSON array
+    """
+    yield '['
+    for idx, (username, password) in enumerate(created):
+        yield (',' if idx else '') + json.dumps({'username': username, 'password': password})
+    yield ']'
+
+
+@router.post('/user/create_batch', status_code=status.HTTP_201_CREATED)
+async def create_users(usernames: List[str] = Body(..., max_length=MAX_BATCH_USERS,
+                                                   description='the usernames to create'),
+                       auth_user: str = Depends(authenticated_user)):
+    try:
+        created = await USER_DB.create_users_async(usernames)
+    except ValueError as error:
+        raise HTTPException(status.HTTP_409_CONFLICT, str(error))
+    return StreamingResponse(stream_created_users(created), status_code=status.HTTP_201_CREATED,
+                             media_type='application/json')
+
+
+@router.post('/user/login')
+async def login(request: Request, credentials: HTTPBasicCredentials = Depends(security)):
+    await check_user(credentials.username, credentials.password, client_ip(request))
+    token, _ = SESSION_TOKENS.issue(credentials.username)
+    return {'success': True, 'username': credentials.username, 'access_token': token,
+            'token_type': 'bearer', 'expires_in': SESSION_TOKENS.ttl}
+
+
+@router.post('/game/{game_id}/initialize', response_class=GameJSONResponse)
 async def init_game(game_id: str = Path(..., description='the unique game id'),
-                    credentials: HTTPBasicCredentials = Depends(security)):
-    await check_user(credentials.username, credentials.password)
-    the_game, the_game_info = await get_game(game_id)
-    if the_game_info.owner != credentials.username:
-        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "not owner of game")
-    the_game.initial_deal()
-    dealer_stack, player_stacks = the_game.get_stacks()
-    return {'success': True, 'dealer_stack': dealer_stack, 'player_stacks': player_stacks}
+                    auth_user: str = Depends(authenticated_user)):
+    return GameJSONResponse(await initialize_game(game_id, auth_user))
 
 
-@app.post('/game/{game_id}/add_player')
+@router.post('/game/{game_id}/add_player')
 async def add_player_to_game(game_id: str = Path(..., description='the unique game id'),
                              username: str = Query(..., description='the user to add as a player'),
-                             credentials: HTTPBasicCredentials = Depends(security)):
-    await check_user(credentials.username, credentials.password)
-    the_game, the_game_info = await get_game(game_id)
-    if the_game_info.owner != credentials.username:
-        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "not owner of game")
-    player_idx = await BLACKJACK_DB.add_player(game_id, username)
+                             auth_user: str = Depends(authenticated_user)):
+    player_idx = await BLACKJACK_DB.add_player(game_id, username, attempter=auth_user)
     return {'success': True, 'game_id': game_id, 'player_username': username, 'player_idx': player_idx}
 
 
-@app.post('/game/{game_id}/player/{player_idx}/hit')
+@router.post('/game/{game_id}/player/{player_idx}/hit', response_class=GameJSONResponse)
 async def player_hit(game_id: str = Path(..., description='the unique game id'),
                      player_idx: int = Path(..., description='the player index (zero-indexed)'),
-                     credentials: HTTPBasicCredentials = Depends(security)):
-    await check_user(credentials.username, credentials.password)
-    the_game, the_game_info = await get_game(game_id)
-    if credentials.username != the_game_info.players[player_idx]:
-        raise HTTPException(status.HTTP_401_UNAUTHORIZED, f"not player at index {player_idx}")
-    drawn_card = the_game.player_draw(player_idx)
-    return {'player': player_idx,
-            'drawn_card': str(drawn_card),
-            'player_stack': the_game.get_stacks()[1][player_idx]}
+                     auth_user: str = Depends(authenticated_user)):
+    return GameJSONResponse(await hit_player(game_id, player_idx, auth_user))
 
 
-@app.post('/game/{game_id}/get_player_idx')
+@router.post('/game/{game_id}/get_player_idx')
 async def get_player_idx(game_id: str = Path(..., description='the unique game id'),
                          username: str = Path(..., description='the username of the player'),
-                         credentials: HTTPBasicCredentials = Depends(security)):
-    await check_user(credentials.username, credentials.password)
+                         auth_user: str = Depends(authenticated_user)):
     the_game, the_game_info = await get_game(game_id)
-    if credentials.username not in the_game_info.players:
+    if the_game_info.player_idx(auth_user) is None:
         raise HTTPException(status.HTTP_401_UNAUTHORIZED, f"not player in game {game_id}")
-    try:
-        player_idx = the_game_info.players.index(username)
-    except ValueError:
+    player_idx = the_game_info.player_idx(username)
+    if player_idx is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, f"player {username} not in game {game_id}")
     return {'success': True, 'game_id': game_id, 'player_username': username, 'player_idx': player_idx}
 
 
-@app.get('/game/{game_id}/player/{player_idx}/stack')
-async def player_stack(game_id: str = Path(..., description='the unique game id'),
-                       player_idx: int = Path(..., description='the player index (zero-indexed)'),
-                       credentials: HTTPBasicCredentials = Depends(security)):
-    await check_user(credentials.username, credentials.password)
+async def read_player_stack(game_id: str, player_idx: int, auth_user: str) -> Dict[str, Any]:
+    """
+    :param game_id: the UUID of the game
+    :param player_idx: the player index (zero-indexed)
+    :param auth_user: the authenticated username, who must be the player
+    :return: the player_stack() response
+    """
     the_game, the_game_info = await get_game(game_id)
-    if credentials.username != the_game_info.players[player_idx]:
+    if auth_user != the_game_info.player_at(player_idx):
         raise HTTPException(status.HTTP_401_UNAUTHORIZED, f"not the player at {player_idx}")
-    return {'player': player_idx, 'player_stack': the_game.get_stacks()[1][player_idx]}
+    return {'player': player_idx,
+            'player_stack': BLACKJACK_DB.player_stack(game_id, the_game, the_game_info, player_idx)}
 
 
-@app.post('/game/{game_id}/dealer/play')
-async def dealer_play(game_id: str = Path(..., description='the unique game id'),
-                      credentials: HTTPBasicCredentials = Depends(security)):
-    await check_user(credentials.username, credentials.password)
+async def read_winners(game_id: str) -> Dict[str, Any]:
+    """
+    :param game_id: the UUID of the game
+    :return: the get_winners() response
+    """
     the_game, the_game_info = await get_game(game_id)
-    if the_game_info.owner != credentials.username:
-        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "not owner of game")
-    dealer_stop = the_game.dealer_draw()
-    while dealer_stop is False:
-        dealer_stop = the_game.dealer_draw()
-    return {'player': 'dealer',
-            'player_stack': the_game.get_stacks()[0]}
+    winner_list = BLACKJACK_DB.winners(game_id, the_game, the_game_info)
+    return {'game_id': game_id,
+            'winners': winner_list}
+
+
+@router.get('/game/{game_id}/player/{player_idx}/stack', response_class=GameJSONResponse)
+async def player_stack(game_id: str = Path(..., description='the unique game id'),
+                       player_idx: int = Path(..., description='the player index (zero-indexed)'),
+                       auth_user: str = Depends(authenticated_user)):
+    return GameJSONResponse(await read_player_stack(game_id, player_idx, auth_user))
 
 
-@app.get('/game/{game_id}/winners')
+@router.post('/game/{game_id}/dealer/play', response_class=GameJSONResponse)
+async def dealer_play(game_id: str = Path(..., description='the unique game id'),
+                      auth_user: str = Depends(authenticated_user)):
+    return GameJSONResponse(await play_dealer(game_id, auth_user))
+
+
+@router.get('/game/{game_id}/winners', response_class=GameJSONResponse)
 async def get_winners(game_id: str = Path(..., description='the unique game id')):
-    the_game, _ = await get_game(game_id)
-    winner_list = the_game.compute_winners()
-    return {'game_id': game_id,
-            'winners': winner_list}
+    return GameJSONResponse(await read_winners(game_id))
 
 
-@app.post('/game/{game_id}/terminate')
+@router.post('/game/{game_id}/terminate')
 async def delete_game(game_id: str = Path(..., description='the unique game id'),
                       password: str = Query(..., description='the termination password'),
-                      credentials: HTTPBasicCredentials = Depends(security)):
-    await check_user(credentials.username, credentials.password)
-    the_game, the_game_info = await get_game(game_id)
-    if the_game_info.owner != credentials.username:
-        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "not owner of game")
-    the_game = await BLACKJACK_DB.del_game(game_id, password, credentials.username)
+                      auth_user: str = Depends(authenticated_user)):
+    the_game = await BLACKJACK_DB.del_game(game_id, password, auth_user)
     if the_game is False:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Game not found.")
+    GAME_CHANNELS.publish(game_id, {'event': 'terminated'})
+    GAME_CHANNELS.close_game(game_id)
     return {'success': True, 'deleted_id': game_id}
 
 
+def simulation_pool() -> ProcessPoolExecutor:
+    """
+    :return: the process pool for simulations, started on first use.  Workers are spawned
+        rather than forked, since this process runs threads (e.g. the SQLite writer).
+    """
+    global SIMULATION_POOL
+    if SIMULATION_POOL is None:
+        SIMULATION_POOL = ProcessPoolExecutor(SIMULATION_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return SIMULATION_POOL
+
+
+@router.post('/simulate', response_class=GameJSONResponse)
+async def run_simulation(rounds: int = Query(100000, ge=1, le=10000000, description='the number of rounds to play'),
+                         num_players: int = Query(1, ge=1, le=7, description='the number of players'),
+                         num_decks: int = Query(2, ge=1, le=8, description='the number of decks to use'),
+                         stand_on: int = Query(17, ge=0, le=22, description='total at which players stop drawing'),
+                         seed: Optional[int] = Query(None, ge=0, description='random seed'),
+                         auth_user: str = Depends(authenticated_user)):
+    from simulate import simulate_in_executor  # imports numpy, which only simulations need
+    try:
+        result = await simulate_in_executor(simulation_pool(), rounds, num_players, num_decks, stand_on, seed)
+    except ValueError as error:
+        raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, str(error))
+    return GameJSONResponse(result)
+
+
+class BatchOperation(BaseModel):
+    op: Literal['create', 'initialize', 'add_player', 'hit', 'stack', 'dealer_play', 'winners', 'terminate']
+    game_id: Optional[str] = Field(None, description='the unique game id (all operations but create)')
+    player_idx: Optional[int] = Field(None, description='the player index (hit, stack)')
+    num_players: Optional[int] = Field(None, gt=0, description='the number of players (create)')
+    num_decks: int = Field(2, description='the number of decks to use (create)')
+    username: Optional[str] = Field(None, description='the user to add as a player (add_player)')
+    password: Optional[str] = Field(None, description='the termination password (terminate)')
+
+
+_BATCH_REQUIRED_FIELDS = {'create': ('num_players',), 'initialize': ('game_id',),
+                          'add_player': ('game_id', 'username'), 'hit': ('game_id', 'player_idx'),
+                          'stack': ('game_id', 'player_idx'), 'dealer_play': ('game_id',),
+                          'winners': ('game_id',), 'terminate': ('game_id', 'password')}
+
+
+async def run_batch_operation(operation: BatchOperation, auth_user: str) -> Dict[str, Any]:
+    """
+    Run one operation of a batch with the same permissions and results as its HTTP route.
+
+    :param operation: the operation
+    :param auth_user: the authenticated username
+    :return: {'status_code': 200, 'result': route response} or {'status_code': error code, 'detail': ...},
+        with status code 500 if the operation failed unexpectedly, so that the rest of the batch still runs
+    """
+    missing = [name for name in _BATCH_REQUIRED_FIELDS[operation.op] if getattr(operation, name) is None]
+    try:
+        if missing:
+            raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, f"{operation.op} requires {', '.join(missing)}")
+        if operation.op == 'create':
+            result = await create_game(operation.num_players, operation.num_decks, auth_user)
+        elif operation.op == 'initialize':
+            result = await initialize_game(operation.game_id, auth_user)
+        elif operation.op == 'add_player':
+            result = await add_player_to_game(operation.game_id, operation.username, auth_user)
+        elif operation.op == 'hit':
+            result = await hit_player(operation.game_id, operation.player_idx, auth_user)
+        elif operation.op == 'stack':
+            result = await read_player_stack(operation.game_id, operation.player_idx, auth_user)
+        elif operation.op == 'dealer_play':
+            result = await play_dealer(operation.game_id, auth_user)
+        elif operation.op == 'winners':
+            result = await read_winners(operation.game_id)
+        else:
+            result = await delete_game(operation.game_id, operation.password, auth_user)
+    except HTTPException as error:
+        return {'status_code': error.status_code, 'detail': error.detail}
+    except Exception as error:
+        logger.exception('batch operation %s on game %s failed', operation.op, operation.game_id)
+        return {'status_code': status.HTTP_500_INTERNAL_SERVER_ERROR, 'detail': f'{type(error).__name__}: {error}'}
+    return {'status_code': status.HTTP_200_OK, 'result': result}
+
+
+@router.post('/batch', response_class=GameJSONResponse)
+async def run_batch(operations: List[BatchOperation] = Body(..., max_length=1000,
+                                                             description='the operations to run'),
+                    auth_user: str = Depends(authenticated_user)):
+    # operations on one game run in order; different games (and each create) run concurrently
+    by_game: 'OrderedDict[Any, List[int]]' = OrderedDict()
+    for op_idx, operation in enumerate(operations):
+        by_game.setdefault(operation.game_id if operation.op != 'create' else ('create', op_idx), []).append(op_idx)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(operations)
+
+    async def run_game_operations(op_indices: List[int]):
+        for op_idx in op_indices:
+            results[op_idx] = await run_batch_operation(operations[op_idx], auth_user)
+
+    await asyncio.gather(*(run_game_operations(op_indices) for op_indices in by_game.values()))
+    return GameJSONResponse({'results': results})
+
+
+async def run_game_commands(websocket: WebSocket, game_id: str, auth_user: str):
+    """
+    Execute the commands a client sends over a game's WebSocket.  Results reach the client
+    through the game's channel like everyone else's; only errors are sent back directly.
+    """
+    while True:
+        command = await websocket.receive_json()
+        try:
+            action = command.get('action') if isinstance(command, dict) else None
+            if action == 'hit':
+                await hit_player(game_id, int(command['player_idx']), auth_user)
+            elif action == 'dealer_play':
+                await play_dealer(game_id, auth_user)
+            elif action == 'initialize':
+                await initialize_game(game_id, auth_user)
+            else:
+                raise HTTPException(status.HTTP_400_BAD_REQUEST, f"unknown action {action}")
+        except (KeyError, TypeError, ValueError):
+            await websocket.send_json({'event': 'error', 'status_code': status.HTTP_400_BAD_REQUEST,
+                                       'detail': 'malformed command'})
+        except HTTPException as error:
+            await websocket.send_json({'event': 'error', 'status_code': error.status_code, 'detail': error.detail})
+
+
+async def forward_game_updates(websocket: WebSocket, subscription: 'asyncio.Queue[Optional[str]]'):
+    """
+    Send a game's channel messages to a client until the subscription is closed.
+    """
+    while True:
+        text = await subscription.get()
+        if text is None:
+            await websocket.close()
+            return
+        await websocket.send_text(text)
+
+
+@router.websocket('/game/{game_id}/ws')
+async def game_channel(websocket: WebSocket, game_id: str):
+    try:
+        auth_user = await authenticated_header(websocket.headers.get('authorization'), client_ip(websocket))
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    _, the_game_info = await BLACKJACK_DB.get_game(game_id)
+    if the_game_info is None or the_game_info.player_idx(auth_user) is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    subscription = GAME_CHANNELS.subscribe(game_id)
+    await websocket.send_json({'event': 'subscribed', 'game_id': game_id,
+                               'player_idx': the_game_info.player_idx(auth_user)})
+    tasks = [asyncio.create_task(run_game_commands(websocket, game_id, auth_user)),
+             asyncio.create_task(forward_game_updates(websocket, subscription))]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is not None and not isinstance(task.exception(), WebSocketDisconnect):
+                raise task.exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+        GAME_CHANNELS.unsubscribe(game_id, subscription)
+
+
+def create_app() -> FastAPI:
+    """
+    Build the Web API.  Returns quickly: the stores are opened by the app's lifespan in the
+    background, as reported by GET /ready.  For `uvicorn --factory web_blackjack:create_app`;
+    web_blackjack.app is built by it on first access.
+    """
+    app = FastAPI(
+        title="Blackjack Server",
+        description="Implementation of a simultaneous multi-game Blackjack server by[Your name here].",
+        lifespan=lifespan
+    )
+    if METRICS.enabled:
+        app.add_middleware(MetricsMiddleware)
+    app.include_router(probes)
+    app.include_router(router)
+    return app
+
+
+def __getattr__(name: str) -> Any:
+    # web_blackjack.app, e.g. for `uvicorn web_blackjack:app`, built on first access rather than on import
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 if __name__ == '__main__':
+    import uvicorn
     # running from main instead of terminal allows for debugger
     uvicorn.run('web_blackjack:app', port=8000, log_level='info', reload=True,
                 ssl_keyfile='key/localhost+2-key.pem', ssl_certfile='key/localhost+2.pem')